@@ -0,0 +1,88 @@
+"""Benchmark harness for the FLUX generation path.
+
+Usage:
+    python benchmarks/run_benchmarks.py run --mode stub --output results.json
+    python benchmarks/run_benchmarks.py run --mode real --lora_path lora/my_lora.safetensors --output real.json
+    python benchmarks/run_benchmarks.py compare baseline.json results.json --threshold 0.10
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from flux_gen import benchmark  # noqa: E402
+
+
+def _parse_pairs(text: str) -> list[tuple[int, int]]:
+    return [tuple(int(v) for v in item.lower().split("x")) for item in text.split(",")]
+
+
+def _parse_ints(text: str) -> list[int]:
+    return [int(v) for v in text.split(",")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark load, render and save of the FLUX generation path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmark matrix and write JSON results")
+    run.add_argument("--mode", choices=["stub", "real"], default="stub",
+                     help="stub: deterministic CPU pipeline, real: the actual model (default: stub)")
+    run.add_argument("--model_id", type=str, default=None, help="Model for --mode real (default: FLUX.1-schnell)")
+    run.add_argument("--resolutions", type=_parse_pairs, default=None, help="e.g. 768x768,1024x1024")
+    run.add_argument("--steps", type=_parse_ints, default=None, help="e.g. 1,4")
+    run.add_argument("--batch_sizes", type=_parse_ints, default=None, help="e.g. 1,2")
+    run.add_argument("--lora", choices=["off", "on", "both"], default="both", help="LoRA cases to run (default: both)")
+    run.add_argument("--lora_path", type=str, default=None, help="LoRA file for the LoRA-on cases")
+    run.add_argument("--repeats", type=int, default=5, help="Timed repetitions per case (default: 5)")
+    run.add_argument("--output", type=str, required=True, help="Where to write the JSON results")
+
+    cmp = commands.add_parser("compare", help="Compare results against a baseline, exit 1 on regressions")
+    cmp.add_argument("baseline", type=str)
+    cmp.add_argument("current", type=str)
+    cmp.add_argument("--threshold", type=float, default=0.10,
+                     help="Allowed relative slowdown or memory growth (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.command == "compare":
+        baseline = benchmark.load_results(Path(args.baseline))
+        current = benchmark.load_results(Path(args.current))
+        if baseline.get("environment") != current.get("environment"):
+            print("Warning: baseline and current results come from different environments")
+        regressions = benchmark.compare(baseline, current, threshold=args.threshold)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression.case} {regression.metric}: "
+                f"{regression.baseline:.4g} -> {regression.current:.4g} ({regression.change:+.1%})"
+            )
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+
+    matrix = dict(benchmark.STUB_MATRIX if args.mode == "stub" else benchmark.REAL_MATRIX)
+    if args.resolutions:
+        matrix["resolutions"] = args.resolutions
+    if args.steps:
+        matrix["steps"] = args.steps
+    if args.batch_sizes:
+        matrix["batch_sizes"] = args.batch_sizes
+    matrix["lora"] = {"off": [False], "on": [True], "both": [False, True]}[args.lora]
+
+    results = benchmark.run_benchmarks(
+        mode=args.mode,
+        cases=benchmark.build_matrix(**matrix),
+        repeats=args.repeats,
+        model_id=args.model_id,
+        lora_path=args.lora_path,
+    )
+    benchmark.write_results(results, Path(args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
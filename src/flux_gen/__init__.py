@@ -1,5 +1,26 @@
-"""FLUX image generation package."""
+"""FLUX image generation package.
 
-from . import cli, config, device, env, generate, io, pipeline
+Submodules are imported on first attribute access, so ``import flux_gen``
+and the CLI argument parsing stay cheap. torch, diffusers, peft and
+transformers are only imported inside the functions that need them.
+"""
+
+import importlib
 
 __version__ = "0.1.0"
+
+__all__ = [
+    "attention", "batch", "benchmark", "cli", "compilation", "config", "device", "embeddings", "env",
+    "generate", "io", "jobstore", "lora", "memory", "metrics", "pipeline", "pool", "progress", "quantize",
+    "result_cache", "scheduler", "shared_weights", "snapshot", "staged", "stub", "sweep", "trace", "worker",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,224 @@
+"""Scaled-dot-product attention backend selection for FLUX."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from . import env, stub
+
+
+ATTENTION_BACKENDS = ("flash", "efficient", "cudnn", "math")
+
+# Names of the matching torch.nn.attention.SDPBackend members
+_SDP_BACKENDS = {
+    "flash": "FLASH_ATTENTION",
+    "efficient": "EFFICIENT_ATTENTION",
+    "cudnn": "CUDNN_ATTENTION",
+    "math": "MATH",
+}
+
+# FLUX.1 attention geometry: 24 heads of 128 dims, 512 T5 tokens, 2x2 patches of 8x latents
+FLUX_HEADS = 24
+FLUX_HEAD_DIM = 128
+FLUX_TEXT_TOKENS = 512
+
+# In-process memo of resolved backends, keyed like the on-disk cache
+_RESOLVED: dict[str, str] = {}
+_LOCK = threading.Lock()
+
+
+def flux_sequence_length(height: int, width: int, text_tokens: int = FLUX_TEXT_TOKENS) -> int:
+    """Joint text+image sequence length FLUX attends over at a resolution."""
+    return (height // 16) * (width // 16) + text_tokens
+
+
+def cache_path():
+    """File holding benchmark winners across runs."""
+    return env.cache_dir("attention_backends.json")
+
+
+def _torch():
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+@contextlib.contextmanager
+def attention_context(backend: str):
+    """Restrict scaled_dot_product_attention to one backend inside the block."""
+    torch = _torch()
+    if torch is None:
+        yield
+        return
+
+    try:
+        from torch.nn.attention import SDPBackend, sdpa_kernel
+    except ImportError:
+        # torch < 2.3 only has the CUDA flag context manager and no cuDNN backend
+        flag = {"flash": "enable_flash", "efficient": "enable_mem_efficient", "math": "enable_math"}.get(backend)
+        if flag is None:
+            raise RuntimeError(f"Attention backend '{backend}' is not available in torch {torch.__version__}")
+        flags = {name: name == flag for name in ("enable_flash", "enable_mem_efficient", "enable_math")}
+        with torch.backends.cuda.sdp_kernel(**flags):
+            yield
+        return
+
+    member = getattr(SDPBackend, _SDP_BACKENDS[backend], None)
+    if member is None:
+        raise RuntimeError(f"Attention backend '{backend}' is not available in torch {torch.__version__}")
+    with sdpa_kernel(member):
+        yield
+
+
+def benchmark_backends(device: str, height: int, width: int, dtype=None, repeats: int = 3) -> dict:
+    """Time one FLUX-sized attention call per backend.
+
+    Returns a mapping of backend name to seconds per call, or None for
+    backends that fail on this device, dtype or torch build.
+    """
+    torch = _torch()
+    seq_len = flux_sequence_length(height, width)
+    if dtype is None:
+        dtype = torch.bfloat16 if device.startswith("cuda") else torch.float32
+    shape = (1, FLUX_HEADS, seq_len, FLUX_HEAD_DIM)
+
+    def synchronize():
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+
+    results = {}
+    with torch.inference_mode():
+        q, k, v = (torch.randn(shape, device=device, dtype=dtype) for _ in range(3))
+        for backend in ATTENTION_BACKENDS:
+            try:
+                with attention_context(backend):
+                    # Warm-up call selects kernels and fails fast if unsupported
+                    torch.nn.functional.scaled_dot_product_attention(q, k, v)
+                    synchronize()
+                    start = time.perf_counter()
+                    for _ in range(repeats):
+                        torch.nn.functional.scaled_dot_product_attention(q, k, v)
+                    synchronize()
+                results[backend] = (time.perf_counter() - start) / repeats
+            except (RuntimeError, ValueError, NotImplementedError):
+                results[backend] = None
+    return results
+
+
+def _device_name(torch) -> str:
+    if torch.cuda.is_available():
+        return f"cuda:{torch.cuda.get_device_name()}"
+    return "cpu"
+
+
+def _read_cache(path) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(path, entries: dict):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not write attention backend cache {path}: {e}")
+
+
+def _cache_key(torch, gen_config) -> str:
+    return (f"{_device_name(torch)}|torch-{torch.__version__}|{gen_config.dtype or 'default'}"
+            f"|{gen_config.height}x{gen_config.width}")
+
+
+def backend_for(gen_config) -> str:
+    """Return the attention backend to use for a config.
+
+    Explicit backends are returned as is. ``auto`` benchmarks all backends
+    once per (device, torch version, dtype, resolution), caches the fastest
+    in ``cache_path()`` and reuses it on later runs. Stub models never
+    call attention and get math without a benchmark. Setting
+    DIFFUSERS_FORCE_ATTENTION_BACKEND=math in the environment still forces
+    the math backend.
+    """
+    if gen_config.attention_backend != "auto":
+        if gen_config.attention_backend not in ATTENTION_BACKENDS:
+            raise ValueError(f"Unknown attention backend '{gen_config.attention_backend}'")
+        return gen_config.attention_backend
+    if os.environ.get("DIFFUSERS_FORCE_ATTENTION_BACKEND") == "math":
+        return "math"
+    if stub.is_stub_model(gen_config.model_id):
+        return "math"
+
+    torch = _torch()
+    if torch is None:
+        return "math"
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    key = _cache_key(torch, gen_config)
+    with _LOCK:
+        if key in _RESOLVED:
+            return _RESOLVED[key]
+
+        path = cache_path()
+        entries = _read_cache(path)
+        if key in entries:
+            _RESOLVED[key] = entries[key]["backend"]
+            return _RESOLVED[key]
+
+        from . import pipeline
+        timings = benchmark_backends(device, gen_config.height, gen_config.width,
+                                     dtype=pipeline.resolve_torch_dtype(gen_config.dtype))
+        working = {name: seconds for name, seconds in timings.items() if seconds is not None}
+        backend = min(working, key=working.get) if working else "math"
+        print(
+            f"Attention backend for {gen_config.height}x{gen_config.width}: {backend} "
+            f"({', '.join(f'{n}={s * 1000:.1f}ms' if s else f'{n}=failed' for n, s in timings.items())})"
+        )
+
+        entries[key] = {"backend": backend, "timings": timings}
+        _write_cache(path, entries)
+        _RESOLVED[key] = backend
+        return backend
+
+
+def _mark_failed(gen_config, backend: str):
+    """Pin a config's key to math, in memory and in the cache file, after its backend failed at runtime."""
+    torch = _torch()
+    if torch is None:
+        return
+    key = _cache_key(torch, gen_config)
+    with _LOCK:
+        _RESOLVED[key] = "math"
+        path = cache_path()
+        entries = _read_cache(path)
+        entries[key] = {**entries.get(key, {}), "backend": "math", "failed": backend}
+        _write_cache(path, entries)
+
+
+def run_with_backend(gen_config, fn):
+    """Call ``fn`` under the selected backend, retrying with math if it fails.
+
+    Only kernel availability errors trigger the fallback; other errors
+    propagate unchanged.
+    """
+    backend = backend_for(gen_config)
+    try:
+        with attention_context(backend):
+            return fn()
+    except RuntimeError as e:
+        if backend == "math" or "kernel" not in str(e).lower():
+            raise
+        print(f"Warning: attention backend '{backend}' failed ({e}), falling back to 'math'")
+        if gen_config.attention_backend == "auto":
+            _mark_failed(gen_config, backend)
+        with attention_context("math"):
+            return fn()
@@ -0,0 +1,245 @@
+"""Batch rendering of manifest jobs with a single pipeline load."""
+
+import csv
+import dataclasses
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import config, generate, io, lora, memory, pipeline, result_cache, staged
+
+
+@dataclass
+class JobResult:
+    """Outcome of a single manifest job."""
+    index: int
+    output_path: Path
+    seconds: float
+
+
+@dataclass
+class BatchReport:
+    """Timing summary for a batch run."""
+    results: list[JobResult] = field(default_factory=list)
+    load_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def render_seconds(self) -> float:
+        """Time spent rendering jobs, excluding pipeline loads."""
+        return sum(result.seconds for result in self.results)
+
+    @property
+    def images_per_second(self) -> float:
+        """Aggregate throughput over the whole run, including loads."""
+        if self.total_seconds <= 0:
+            return 0.0
+        return len(self.results) / self.total_seconds
+
+
+def _row_to_config(row: dict, defaults: config.GenerationConfig, index: int) -> config.GenerationConfig:
+    """Overlay one manifest row on the default config."""
+    try:
+        job = defaults.with_overrides(row)
+    except ValueError as e:
+        raise ValueError(f"Manifest row {index}: {e}")
+
+    if not row.get("output_name"):
+        job = dataclasses.replace(job, output_name=f"job_{index:04d}.png")
+    return job
+
+
+def read_manifest(manifest_path: Path, defaults: config.GenerationConfig) -> list[config.GenerationConfig]:
+    """Read a JSONL or CSV manifest into a list of GenerationConfig.
+
+    Every row may set any GenerationConfig field; missing fields come from
+    ``defaults``. Rows without an ``output_name`` get a unique numbered one so
+    jobs never overwrite each other.
+    """
+    manifest_path = Path(manifest_path)
+    suffix = manifest_path.suffix.lower()
+
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if suffix == ".csv":
+            rows = list(csv.DictReader(f))
+        elif suffix in (".jsonl", ".ndjson"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(f"Unsupported manifest format '{suffix}', expected .jsonl or .csv")
+
+    return [_row_to_config(row, defaults, index) for index, row in enumerate(rows)]
+
+
+def _lora_order_key(item: tuple[int, config.GenerationConfig]) -> tuple:
+    _, job = item
+    return (job.lora_path or "", job.lora_scale if job.lora_path else 0.0)
+
+
+def _restore_cached(cache: result_cache.ResultCache, job: config.GenerationConfig,
+                    writer: io.ImageWriter | None) -> Path | None:
+    """Serve a job from the result cache, returning its output path on a hit."""
+    if writer is None or writer.output_format == "png":
+        output_path = writer.output_path_for(job.output_path) if writer else job.output_path
+        return cache.restore(job, output_path)
+
+    # Other formats are re-encoded from the cached PNG
+    cached = cache.lookup(job)
+    if cached is None:
+        return None
+    from PIL import Image
+
+    metadata = io.image_metadata(job) if job.seed is not None else None
+    with Image.open(cached) as image:
+        image.load()
+        writer.submit(image.copy(), job.output_path, metadata)
+    return writer.output_path_for(job.output_path)
+
+
+def restore_job(variants: list[config.GenerationConfig], writer: io.ImageWriter | None = None) -> list[Path] | None:
+    """Serve every variant of a job from the result cache.
+
+    Returns the output paths when all variants were cached, else None.
+    """
+    cache = result_cache.cache_for(variants[0])
+    if cache is None:
+        return None
+    io.ensure_output_directory(variants[0].out_dir)
+    restored = [_restore_cached(cache, variant, writer) for variant in variants]
+    return restored if all(restored) else None
+
+
+def render_job(pipe, variants: list[config.GenerationConfig], runtime_config: config.RuntimeConfig,
+               embedding_cache=None, writer: io.ImageWriter | None = None,
+               fuse_lora: bool = True) -> list[tuple[Path, float]]:
+    """Render the variants of one job on a loaded pipeline and save them.
+
+    Activates the job's LoRA, renders within device memory (see
+    ``memory.render_admitted``), stores seeded results in the result cache
+    and writes the images, through ``writer`` when given. Returns the output
+    path and render seconds of each image.
+    """
+    io.ensure_output_directory(variants[0].out_dir)
+    job_start = time.perf_counter()
+    lora.get_lora_manager(pipe, fuse=fuse_lora).activate_for(variants[0])
+    variants, images = memory.render_admitted(
+        pipe,
+        variants,
+        lambda pipe, variants: generate.render_variants(pipe, variants, embedding_cache),
+        runtime_config,
+    )
+
+    outputs = []
+    for variant, image in zip(variants, images):
+        # Seeded images carry the settings needed to regenerate them
+        metadata = io.image_metadata(variant) if variant.seed is not None else None
+        cache = result_cache.cache_for(variant)
+        if cache is not None:
+            cache.store(variant, image, (time.perf_counter() - job_start) / len(images))
+        if writer is None:
+            output_path = variant.output_path
+            if metadata is None:
+                io.save_generated_image(image, output_path)
+            else:
+                io.save_generated_image(image, output_path, metadata)
+        else:
+            output_path = writer.output_path_for(variant.output_path)
+            writer.submit(image, variant.output_path, metadata)
+        outputs.append((output_path, (time.perf_counter() - job_start) / len(images)))
+    return outputs
+
+
+def _run_staged(pipe, group: list[tuple[int, config.GenerationConfig]], variants_by_job: list,
+                embedding_cache, writer: io.ImageWriter | None, fuse_lora: bool,
+                queue_size: int) -> list[JobResult]:
+    """Render a pipeline group through a StagedRunner, one run per adapter state."""
+    results = []
+    for _, segment in itertools.groupby(sorted(group, key=_lora_order_key), key=_lora_order_key):
+        segment = list(segment)
+        lora.get_lora_manager(pipe, fuse=fuse_lora).activate_for(segment[0][1])
+        runner = staged.StagedRunner(pipe, embedding_cache, writer, queue_size)
+        staged_report = runner.run([variants_by_job[index] for index, _ in segment])
+        if staged_report.failures:
+            failed = staged_report.failures[0]
+            raise RuntimeError(
+                f"Job {segment[failed.index][0]} failed in stage {failed.failed_stage}: "
+                f"{failed.error.strip().splitlines()[-1]}"
+            ) from failed.exception
+        for job in staged_report.jobs:
+            results.extend(JobResult(index=segment[job.index][0], output_path=output_path, seconds=job.seconds)
+                           for output_path in job.outputs)
+    return results
+
+
+def run_batch(jobs: list[config.GenerationConfig], embedding_cache=None, fuse_lora: bool = True,
+              writer: io.ImageWriter | None = None, staged_queue_size: int | None = None) -> BatchReport:
+    """Render every job, loading the pipeline once per model.
+
+    LoRA adapters are hot-swapped on the loaded pipeline; jobs are ordered
+    by LoRA file and scale so each adapter state is set up only once. An
+    optional PromptEmbeddingCache lets jobs that repeat a prompt skip the
+    text encoders. With an ``io.ImageWriter`` images are encoded and written
+    in the background while the next job renders; the writer is flushed
+    before the report is returned. Seeded jobs with ``result_cache_dir`` set
+    are restored from the result cache when an identical job ran before.
+    With ``staged_queue_size`` jobs run through a ``staged.StagedRunner``,
+    which overlaps encoding, denoising, decoding and writing of consecutive
+    jobs; memory admission then does not apply.
+    """
+    report = BatchReport()
+    if not jobs:
+        return report
+
+    batch_start = time.perf_counter()
+
+    # Each job expands into one config per seeded variant (usually just one)
+    variants_by_job = [generate.variant_configs(job) for job in jobs]
+    total_images = sum(len(variants) for variants in variants_by_job)
+
+    # Group jobs that can share a pipeline, keeping manifest order within groups.
+    # Jobs already in the result cache are restored and never reach a pipeline.
+    groups: dict[tuple, list[tuple[int, config.GenerationConfig]]] = {}
+    caches = {}
+    for index, job in enumerate(jobs):
+        cache = result_cache.cache_for(job)
+        if cache is not None:
+            caches[id(cache)] = cache
+            job_start = time.perf_counter()
+            restored = restore_job(variants_by_job[index], writer)
+            if restored is not None:
+                seconds = (time.perf_counter() - job_start) / len(restored)
+                report.results.extend(JobResult(index=index, output_path=path, seconds=seconds) for path in restored)
+                continue
+        groups.setdefault(pipeline.pipeline_cache_key(job, include_lora=False), []).append((index, job))
+
+    runtime_config = generate.prepare_runtime() if groups else None
+    for group in groups.values():
+        load_start = time.perf_counter()
+        pipe = pipeline.load_flux_pipeline(group[0][1], runtime_config, apply_lora=False)
+        lora.get_lora_manager(pipe, fuse=fuse_lora)
+        report.load_seconds += time.perf_counter() - load_start
+
+        if staged_queue_size is not None:
+            report.results.extend(_run_staged(pipe, group, variants_by_job, embedding_cache, writer, fuse_lora,
+                                              staged_queue_size))
+            continue
+        for index, job in sorted(group, key=_lora_order_key):
+            outputs = render_job(pipe, variants_by_job[index], runtime_config, embedding_cache, writer, fuse_lora)
+            for output_path, seconds in outputs:
+                report.results.append(JobResult(index=index, output_path=output_path, seconds=seconds))
+                print(f"[{len(report.results)}/{total_images}] {output_path} in {seconds:.2f}s")
+
+    if writer is not None:
+        writer.flush()
+    report.total_seconds = time.perf_counter() - batch_start
+    print(
+        f"Rendered {len(report.results)} images in {report.total_seconds:.2f}s "
+        f"({report.images_per_second:.3f} img/s, load {report.load_seconds:.2f}s, "
+        f"render {report.render_seconds:.2f}s)"
+    )
+    if embedding_cache is not None:
+        print(f"Prompt embedding cache: {embedding_cache.stats()}")
+    for cache in caches.values():
+        print(f"Result cache {cache.cache_dir}: {cache.stats()}")
+    return report
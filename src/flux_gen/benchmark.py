@@ -0,0 +1,241 @@
+"""End-to-end benchmarks of loading, rendering and saving."""
+
+import dataclasses
+import itertools
+import json
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import config, generate, io, metrics, pipeline, stub
+
+
+STUB_MODEL_ID = stub.STUB_PREFIX + "1"
+
+# Resolution, step, batch and LoRA axes of the default matrices
+STUB_MATRIX = dict(resolutions=[(256, 256), (512, 512), (1024, 1024)], steps=[1, 4], batch_sizes=[1, 2],
+                   lora=[False, True])
+REAL_MATRIX = dict(resolutions=[(768, 768), (1024, 1024)], steps=[4], batch_sizes=[1], lora=[False, True])
+
+LATENCY_METRICS = ("load_seconds", "render_seconds", "step_seconds", "save_seconds", "end_to_end_seconds")
+MEMORY_METRICS = ("peak_rss_bytes", "peak_device_bytes")
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    """One point of the benchmark matrix."""
+    height: int
+    width: int
+    num_inference_steps: int
+    batch_size: int
+    lora: bool
+
+    @property
+    def name(self) -> str:
+        return (f"{self.height}x{self.width}-steps{self.num_inference_steps}"
+                f"-batch{self.batch_size}-lora_{'on' if self.lora else 'off'}")
+
+
+@dataclass
+class Regression:
+    """A metric that got worse than the baseline by more than the threshold."""
+    case: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        return self.current / self.baseline - 1 if self.baseline else float("inf")
+
+
+def build_matrix(resolutions, steps, batch_sizes, lora) -> list[BenchmarkCase]:
+    """Cartesian product of the benchmark axes."""
+    return [
+        BenchmarkCase(height, width, num_steps, batch_size, use_lora)
+        for (height, width), num_steps, batch_size, use_lora in itertools.product(resolutions, steps, batch_sizes, lora)
+    ]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linearly interpolated percentile of ``values`` for ``q`` in [0, 100]."""
+    ordered = sorted(values)
+    if not ordered:
+        raise ValueError("percentile of an empty sample")
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples: list[float]) -> dict:
+    """p50/p95/min/max of a list of latency samples."""
+    return {
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "min": min(samples),
+        "max": max(samples),
+        "samples": len(samples),
+    }
+
+
+def _lora_available() -> bool:
+    """LoRA cases need PEFT for the adapter API and safetensors/torch to read files."""
+    import importlib.util
+
+    return pipeline.PEFT_AVAILABLE and all(
+        importlib.util.find_spec(name) is not None for name in ("safetensors", "torch")
+    )
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def measure_case(case: BenchmarkCase, base_config: config.GenerationConfig, runtime_config: config.RuntimeConfig,
+                 repeats: int = 5, lora_path: str | None = None, end_to_end_repeats: int | None = None) -> dict:
+    """Load, render and save one case ``repeats`` times and summarize the timings.
+
+    End-to-end time goes through ``generate.run_generation``, which reloads
+    the model each time, and is only measured for single-image cases,
+    ``end_to_end_repeats`` times (default: ``repeats``).
+    """
+    gen_config = dataclasses.replace(
+        base_config,
+        height=case.height,
+        width=case.width,
+        num_inference_steps=case.num_inference_steps,
+        lora_path=lora_path if case.lora else None,
+    )
+    io.ensure_output_directory(gen_config.out_dir)
+    batch = [
+        dataclasses.replace(gen_config, prompt=f"{gen_config.prompt} #{i}", output_name=f"{case.name}-{i}.png")
+        for i in range(case.batch_size)
+    ]
+
+    samples = {name: [] for name in LATENCY_METRICS}
+    metrics.reset_device_peak_memory()
+
+    pipe, seconds = _timed(lambda: pipeline.load_flux_pipeline(gen_config, runtime_config))
+    samples["load_seconds"].append(seconds)
+
+    # Untimed warm-up so the first sample does not include one-off setup
+    generate.render_batch(pipe, batch)
+    for _ in range(repeats):
+        images, seconds = _timed(lambda: generate.render_batch(pipe, batch))
+        samples["render_seconds"].append(seconds)
+        samples["step_seconds"].append(seconds / case.num_inference_steps)
+        for image, job in zip(images, batch):
+            _, seconds = _timed(lambda: io.save_generated_image(image, job.output_path))
+            samples["save_seconds"].append(seconds)
+
+    if case.batch_size == 1:
+        for _ in range(repeats if end_to_end_repeats is None else end_to_end_repeats):
+            _, seconds = _timed(lambda: generate.run_generation(batch[0]))
+            samples["end_to_end_seconds"].append(seconds)
+
+    result = {name: summarize(values) for name, values in samples.items() if values}
+    result["peak_rss_bytes"] = metrics.peak_rss_bytes()
+    result["peak_device_bytes"] = metrics.device_peak_memory_bytes()
+    return result
+
+
+def environment_info(mode: str) -> dict:
+    """Describe the machine so results are only compared like for like."""
+    info = {"mode": mode, "python": platform.python_version(), "platform": platform.platform()}
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        info["torch"] = torch.__version__
+        if torch.cuda.is_available():
+            info["device"] = torch.cuda.get_device_name()
+    return info
+
+
+def run_benchmarks(mode: str = "stub", cases: list[BenchmarkCase] | None = None, repeats: int = 5,
+                   model_id: str | None = None, lora_path: str | None = None, out_dir: Path | None = None,
+                   runtime_config: config.RuntimeConfig | None = None) -> dict:
+    """Run a benchmark matrix and return the JSON-serializable results.
+
+    ``mode="stub"`` uses the deterministic CPU stub pipeline; ``mode="real"``
+    loads ``model_id`` (FLUX.1-schnell by default). LoRA cases are recorded as
+    skipped when no LoRA file is given or PEFT is not installed.
+    """
+    if mode not in ("stub", "real"):
+        raise ValueError(f"Unknown benchmark mode '{mode}', expected 'stub' or 'real'")
+    if cases is None:
+        cases = build_matrix(**(STUB_MATRIX if mode == "stub" else REAL_MATRIX))
+    if model_id is None:
+        from .cli import MODEL_ID
+        model_id = STUB_MODEL_ID if mode == "stub" else MODEL_ID
+    runtime_config = runtime_config or generate.prepare_runtime()
+
+    results = {"environment": environment_info(mode), "repeats": repeats, "cases": {}}
+    with tempfile.TemporaryDirectory(prefix="flux_gen_bench_") as tmp_dir:
+        base_config = config.GenerationConfig(
+            model_id=model_id,
+            prompt="benchmark prompt",
+            height=0,
+            width=0,
+            guidance_scale=0.0,
+            num_inference_steps=0,
+            out_dir=Path(out_dir or tmp_dir),
+        )
+        for case in cases:
+            if case.lora and not (lora_path and _lora_available()):
+                print(f"Skipping {case.name}: needs --lora_path and PEFT")
+                results["cases"][case.name] = {"skipped": "LoRA unavailable"}
+                continue
+            print(f"Benchmarking {case.name}")
+            results["cases"][case.name] = measure_case(
+                case, base_config, runtime_config, repeats, lora_path,
+                # Real end-to-end runs reload the full model, once is enough
+                end_to_end_repeats=None if mode == "stub" else 1,
+            )
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10, noise_floor_seconds: float = 0.001) -> list[Regression]:
+    """Return metrics in ``current`` that regressed against ``baseline``.
+
+    Latencies are compared on p50 and p95, memory on the peak values. A
+    metric regresses when it grew by more than ``threshold`` (a fraction)
+    and, for latencies, by more than ``noise_floor_seconds``. Cases missing
+    from either side or skipped are ignored.
+    """
+    regressions = []
+    for case_name, base_case in baseline.get("cases", {}).items():
+        case = current.get("cases", {}).get(case_name)
+        if case is None or "skipped" in case or "skipped" in base_case:
+            continue
+        for metric in LATENCY_METRICS:
+            if metric not in base_case or metric not in case:
+                continue
+            for stat in ("p50", "p95"):
+                before, after = base_case[metric][stat], case[metric][stat]
+                if after > before * (1 + threshold) and after - before > noise_floor_seconds:
+                    regressions.append(Regression(case_name, f"{metric}.{stat}", before, after))
+        for metric in MEMORY_METRICS:
+            before, after = base_case.get(metric), case.get(metric)
+            if before and after and after > before * (1 + threshold):
+                regressions.append(Regression(case_name, metric, before, after))
+    return regressions
+
+
+def load_results(path: Path) -> dict:
+    """Read a results file written by ``write_results``."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_results(results: dict, path: Path):
+    """Write results as indented JSON."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Saved: {path}")
@@ -1,18 +1,31 @@
 """Command line interface for FLUX generation."""
 
 import argparse
+import dataclasses
+import importlib.util
 import os
 from pathlib import Path
 
+from . import compilation, sweep
 from .config import GenerationConfig
 
 
 MODEL_ID = "black-forest-labs/FLUX.1-schnell"
 
 
-def parse_args():
-    """Parse command line arguments and return GenerationConfig."""
-    parser = argparse.ArgumentParser(description="Generate images using FLUX model on Runpod")
+def _parse_seed_range(text: str) -> tuple[int, int]:
+    """Parse ``START-END`` (inclusive) into ``(start, count)``."""
+    try:
+        start, end = (int(part) for part in text.split("-", 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid seed range '{text}', expected START-END")
+    if end < start:
+        raise argparse.ArgumentTypeError(f"invalid seed range '{text}', END must not be below START")
+    return start, end - start + 1
+
+
+def _add_generation_arguments(parser):
+    """Register the arguments shared by every generation entry point."""
     parser.add_argument(
         "--model_id",
         type=str,
@@ -79,18 +92,197 @@ def parse_args():
         default=None,
         help="Trigger word for LoRA (automatically added to prompt start)"
     )
+    parser.add_argument(
+        "--offload",
+        type=str,
+        choices=["none", "model", "sequential", "auto"],
+        default="model",
+        help="CPU offload strategy: none keeps everything on the GPU, model moves whole "
+             "components, sequential moves single layers, auto picks from free GPU "
+             "memory (default: model)"
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        choices=["fp32", "bf16", "fp16"],
+        default=None,
+        help="Weight dtype (default: pipeline default, fp32)"
+    )
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        choices=["int8"],
+        default=None,
+        help="Quantize transformer and T5 encoder weights at load time (requires optimum-quanto)"
+    )
+    parser.add_argument(
+        "--quantized_cache_dir",
+        type=str,
+        default=None,
+        help="Directory for pre-quantized checkpoints (default: ~/.cache/flux_gen/quantized)"
+    )
+    parser.add_argument(
+        "--attention_backend",
+        type=str,
+        choices=["auto", "flash", "efficient", "cudnn", "math"],
+        default="auto",
+        help="Scaled-dot-product attention backend; auto benchmarks the available ones "
+             "once per device and resolution (default: auto)"
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="torch.compile the transformer and VAE decoder; compiled artifacts are "
+             "cached on disk and reused by later runs"
+    )
+    parser.add_argument(
+        "--compile_cache_dir",
+        type=str,
+        default=None,
+        help="Directory for compiled artifacts (default: ~/.cache/flux_gen/compile)"
+    )
+    seeds = parser.add_mutually_exclusive_group()
+    seeds.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed; a fixed seed makes the image reproducible (default: random)"
+    )
+    seeds.add_argument(
+        "--seed_range",
+        type=_parse_seed_range,
+        default=None,
+        help="Render one variant per seed in an inclusive range, e.g. 100-103; "
+             "sets --seed and --num_images_per_prompt"
+    )
+    parser.add_argument(
+        "--num_images_per_prompt",
+        type=int,
+        default=1,
+        help="Render this many variants in one pass with consecutive seeds, saved as "
+             "<name>_seed<N>.png (default: 1)"
+    )
+    parser.add_argument(
+        "--model_revision",
+        type=str,
+        default=None,
+        help="Model revision to load: branch, tag or commit hash (default: main)"
+    )
+    parser.add_argument(
+        "--snapshot_dir",
+        type=str,
+        default=None,
+        help="Load the model strictly from this snapshot written by prefetch.py, "
+             "with no Hugging Face hub calls"
+    )
+    parser.add_argument(
+        "--shared_weights_dir",
+        type=str,
+        default=None,
+        help="Export the transformer and T5 weights here once and memory-map them, so processes "
+             "on one host share a single copy (e.g. /dev/shm/flux_gen)"
+    )
+    parser.add_argument(
+        "--result_cache_dir",
+        type=str,
+        default=None,
+        help="Reuse images of identical seeded jobs from this directory instead of rendering"
+    )
+    parser.add_argument(
+        "--result_cache_max_gb",
+        type=float,
+        default=10.0,
+        help="Evict least recently used cached results above this size (default: 10)"
+    )
+    parser.add_argument(
+        "--bypass_result_cache",
+        action="store_true",
+        help="Render even if the result is cached, then refresh the cache entry"
+    )
+    parser.add_argument(
+        "--vae_decode",
+        type=str,
+        choices=["full", "sliced", "tiled", "auto"],
+        default="full",
+        help="VAE decoding: full decodes the batch at once, sliced one image at a time, "
+             "tiled in overlapping tiles to cap memory at high resolutions, auto tiles "
+             "above 1024x1024 and slices batches (default: full)"
+    )
+    parser.add_argument(
+        "--vae_tile_size",
+        type=int,
+        default=512,
+        help="Tile edge in pixels for tiled VAE decoding (default: 512)"
+    )
+    parser.add_argument(
+        "--vae_tile_overlap",
+        type=float,
+        default=0.25,
+        help="Fraction of each tile blended with its neighbours to hide seams (default: 0.25)"
+    )
+    parser.add_argument(
+        "--allow_downscale",
+        action="store_true",
+        help="Render at a lower resolution when the job is predicted not to fit in device memory"
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print progress and an ETA after every denoising step"
+    )
+    parser.add_argument(
+        "--preview_every",
+        type=int,
+        default=0,
+        help="Every N steps save a cheap preview projected from the latents "
+             "as <output>_preview.png (default: 0, disabled)"
+    )
+    parser.add_argument(
+        "--trace_out",
+        type=str,
+        default=None,
+        help="Record per-stage timing and memory spans and write them to this file: "
+             "JSON lines for .jsonl, Chrome trace format otherwise"
+    )
 
-    args = parser.parse_args()
 
-    # Check PEFT availability if LoRA is requested
-    if args.lora_path:
-        try:
-            import peft
-        except ImportError:
-            print("Warning: PEFT library is required for LoRA support but not installed.")
-            print("Install it with: pip install peft>=0.7.0")
-            print("Continuing without LoRA...")
+def _add_resident_arguments(parser):
+    """Register options for entry points that keep a pipeline loaded across jobs."""
+    parser.add_argument(
+        "--embedding_cache_size",
+        type=int,
+        default=0,
+        help="Keep encoded prompts for this many prompts in memory (default: 0, disabled)"
+    )
+    parser.add_argument(
+        "--embedding_cache_dir",
+        type=str,
+        default=None,
+        help="Also persist encoded prompts as safetensors files in this directory"
+    )
+    parser.add_argument(
+        "--lora_mode",
+        type=str,
+        choices=["fused", "unfused"],
+        default="fused",
+        help="Fuse active LoRA adapters into the weights, or run them unfused "
+             "when scales change often (default: fused)"
+    )
+
 
+def _warn_if_peft_missing(args):
+    """Warn early when LoRA is requested but PEFT is not installed."""
+    # Check PEFT availability if LoRA is requested, without importing it
+    if args.lora_path and importlib.util.find_spec("peft") is None:
+        print("Warning: PEFT library is required for LoRA support but not installed.")
+        print("Install it with: pip install peft>=0.7.0")
+        print("Continuing without LoRA...")
+
+
+def _config_from_args(args, parser: argparse.ArgumentParser):
+    """Build a GenerationConfig from parsed arguments."""
+    if args.quantize and args.shared_weights_dir:
+        parser.error("--shared_weights_dir cannot be combined with --quantize")
     return GenerationConfig(
         model_id=args.model_id,
         prompt=args.prompt,
@@ -103,4 +295,315 @@ def parse_args():
         lora_config_path=args.lora_config_path,
         lora_scale=args.lora_scale,
         lora_trigger_word=args.lora_trigger_word,
+        offload=args.offload,
+        dtype=args.dtype,
+        quantize=args.quantize,
+        quantized_cache_dir=args.quantized_cache_dir,
+        attention_backend=args.attention_backend,
+        compile=args.compile,
+        compile_cache_dir=args.compile_cache_dir,
+        trace_out=args.trace_out,
+        seed=args.seed_range[0] if args.seed_range else args.seed,
+        num_images_per_prompt=args.seed_range[1] if args.seed_range else args.num_images_per_prompt,
+        model_revision=args.model_revision,
+        snapshot_dir=args.snapshot_dir,
+        shared_weights_dir=args.shared_weights_dir,
+        result_cache_dir=args.result_cache_dir,
+        result_cache_max_gb=args.result_cache_max_gb,
+        bypass_result_cache=args.bypass_result_cache,
+        vae_decode=args.vae_decode,
+        vae_tile_size=args.vae_tile_size,
+        vae_tile_overlap=args.vae_tile_overlap,
+        allow_downscale=args.allow_downscale,
+        progress=args.progress,
+        preview_every=args.preview_every,
+    )
+
+
+def parse_args():
+    """Parse command line arguments and return GenerationConfig."""
+    parser = argparse.ArgumentParser(description="Generate images using FLUX model on Runpod")
+    _add_generation_arguments(parser)
+    args = parser.parse_args()
+    _warn_if_peft_missing(args)
+    return _config_from_args(args, parser)
+
+
+def parse_batch_args():
+    """Parse batch command line arguments.
+
+    Returns a namespace with the manifest path, cache settings and
+    ``defaults``, the GenerationConfig that manifest rows override.
+    """
+    parser = argparse.ArgumentParser(description="Render a manifest of FLUX jobs with a single model load")
+    parser.add_argument(
+        "manifest",
+        type=str,
+        help="Path to a .jsonl or .csv manifest with one job per row"
+    )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=["png", "webp", "jpeg", "avif"],
+        default="png",
+        help="Image format; webp is lossless, jpeg and avif use --image_quality (default: png)"
+    )
+    parser.add_argument(
+        "--png_compress_level",
+        type=int,
+        choices=range(10),
+        default=6,
+        help="PNG zlib level, 0 is fastest and 9 smallest (default: 6)"
+    )
+    parser.add_argument(
+        "--image_quality",
+        type=str,
+        choices=["high", "balanced", "small"],
+        default="high",
+        help="Quality preset for jpeg and avif: 95, 85 or 70 (default: high)"
+    )
+    parser.add_argument(
+        "--writer_threads",
+        type=int,
+        default=2,
+        help="Threads encoding and writing images while the next job renders (default: 2)"
+    )
+    parser.add_argument(
+        "--writer_queue_size",
+        type=int,
+        default=8,
+        help="Images that may wait for writing before rendering pauses (default: 8)"
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="Overlap text encoding, denoising, VAE decoding and writing of consecutive jobs "
+             "on separate threads"
+    )
+    parser.add_argument(
+        "--stage_queue_size",
+        type=int,
+        default=2,
+        help="With --staged, jobs that may wait between two stages (default: 2)"
+    )
+    parser.add_argument(
+        "--job_store",
+        type=str,
+        default=None,
+        help="Record jobs and their status in this SQLite file; rerunning the manifest skips "
+             "finished jobs and resumes unfinished ones"
+    )
+    parser.add_argument(
+        "--worker_name",
+        type=str,
+        default=None,
+        help="Name this process leases jobs under in the job store (default: host:pid)"
+    )
+    parser.add_argument(
+        "--lease_seconds",
+        type=float,
+        default=600.0,
+        help="A job whose worker stops renewing its lease for this long is queued again (default: 600)"
+    )
+    parser.add_argument(
+        "--devices",
+        type=str,
+        default=None,
+        help="Render on a pool of worker processes, one per device: auto (every GPU, else one "
+             "per NUMA node), cuda:0,cuda:1, cpu (one per NUMA node) or cpu:N "
+             "(default: a single in-process worker)"
+    )
+    _add_generation_arguments(parser)
+    _add_resident_arguments(parser)
+    args = parser.parse_args()
+    if args.job_store and (args.devices or args.staged):
+        parser.error("--job_store cannot be combined with --devices or --staged")
+    if args.devices and args.staged:
+        parser.error("--staged cannot be combined with --devices")
+    _warn_if_peft_missing(args)
+    return argparse.Namespace(
+        manifest=Path(args.manifest),
+        embedding_cache_size=args.embedding_cache_size,
+        embedding_cache_dir=args.embedding_cache_dir,
+        fuse_lora=args.lora_mode == "fused",
+        output_format=args.output_format,
+        png_compress_level=args.png_compress_level,
+        image_quality=args.image_quality,
+        writer_threads=args.writer_threads,
+        writer_queue_size=args.writer_queue_size,
+        devices=args.devices,
+        staged_queue_size=args.stage_queue_size if args.staged else None,
+        job_store=args.job_store,
+        worker_name=args.worker_name,
+        lease_seconds=args.lease_seconds,
+        defaults=_config_from_args(args, parser),
+    )
+
+
+def _parse_list(value_type):
+    """Build an argparse type for comma-separated lists of ``value_type``."""
+    def parse(text: str) -> list:
+        try:
+            return [value_type(part) for part in text.split(",") if part.strip()]
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return parse
+
+
+def parse_sweep_args():
+    """Parse sweep command line arguments.
+
+    Returns a namespace with the swept value lists, cache settings and
+    ``base``, the GenerationConfig every cell starts from.
+    """
+    parser = argparse.ArgumentParser(description="Render a parameter grid of one prompt with a single model load")
+    parser.add_argument(
+        "--guidance_scales",
+        type=_parse_list(float),
+        default=[],
+        help="Comma-separated guidance scales, one contact sheet column each"
+    )
+    parser.add_argument(
+        "--steps",
+        type=_parse_list(int),
+        default=[],
+        help="Comma-separated inference step counts"
+    )
+    parser.add_argument(
+        "--lora_scales",
+        type=_parse_list(float),
+        default=[],
+        help="Comma-separated LoRA scales (requires --lora_path)"
+    )
+    parser.add_argument(
+        "--resolutions",
+        type=_parse_list(sweep.parse_resolution),
+        default=[],
+        help="Comma-separated HEIGHTxWIDTH sizes, e.g. 768x768,1024x768"
+    )
+    parser.add_argument(
+        "--cell_size",
+        type=int,
+        default=256,
+        help="Longest side of each image on the contact sheet (default: 256)"
+    )
+    _add_generation_arguments(parser)
+    _add_resident_arguments(parser)
+    args = parser.parse_args()
+    _warn_if_peft_missing(args)
+    return argparse.Namespace(
+        guidance_scales=args.guidance_scales,
+        steps=args.steps,
+        lora_scales=args.lora_scales,
+        resolutions=args.resolutions,
+        cell_size=args.cell_size,
+        embedding_cache_size=args.embedding_cache_size,
+        embedding_cache_dir=args.embedding_cache_dir,
+        fuse_lora=args.lora_mode == "fused",
+        base=dataclasses.replace(_config_from_args(args, parser), output_name="sweep.png"),
+    )
+
+
+def parse_prefetch_args():
+    """Parse prefetch command line arguments.
+
+    Returns a namespace with the snapshot options and ``config``, whose
+    ``model_id``, ``model_revision`` and ``snapshot_dir`` select the snapshot.
+    """
+    parser = argparse.ArgumentParser(
+        description="Download a pinned FLUX model revision into a local snapshot for hub-free startup"
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=8,
+        help="Parallel downloads and checksum threads (default: 8)"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-hash an existing snapshot against its manifest instead of downloading"
+    )
+    parser.add_argument(
+        "--compare_cold_start",
+        action="store_true",
+        help="After prefetching, time a hub-resolved pipeline load against a load from the snapshot"
+    )
+    _add_generation_arguments(parser)
+    args = parser.parse_args()
+    return argparse.Namespace(
+        max_workers=args.max_workers,
+        verify=args.verify,
+        compare_cold_start=args.compare_cold_start,
+        config=_config_from_args(args, parser),
+    )
+
+
+def parse_worker_args():
+    """Parse worker command line arguments.
+
+    Returns a namespace with the server settings and ``defaults``, the
+    GenerationConfig that request payloads override.
+    """
+    parser = argparse.ArgumentParser(description="Run a resident FLUX generation worker over HTTP")
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to bind (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to bind (default: 8765)"
+    )
+    parser.add_argument(
+        "--memory_budget_gb",
+        type=float,
+        default=None,
+        help="Evict least recently used pipelines above this estimated size"
+    )
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=1,
+        help="Merge up to this many same-shape requests into one pipeline call (default: 1)"
+    )
+    parser.add_argument(
+        "--max_batch_wait_ms",
+        type=float,
+        default=0.0,
+        help="How long a request may wait for its batch to fill (default: 0)"
+    )
+    parser.add_argument(
+        "--warmup_shapes",
+        type=str,
+        default=None,
+        help="With --compile, render these shapes at startup, e.g. '768x768,1024x1024x2' "
+             "(HEIGHTxWIDTH[xBATCH])"
+    )
+    _add_generation_arguments(parser)
+    _add_resident_arguments(parser)
+    args = parser.parse_args()
+    _warn_if_peft_missing(args)
+    try:
+        warmup_shapes = compilation.parse_warmup_shapes(args.warmup_shapes)
+    except ValueError as e:
+        parser.error(str(e))
+
+    memory_budget = None
+    if args.memory_budget_gb is not None:
+        memory_budget = int(args.memory_budget_gb * 1024 ** 3)
+    return argparse.Namespace(
+        host=args.host,
+        port=args.port,
+        memory_budget_bytes=memory_budget,
+        max_batch_size=args.max_batch_size,
+        max_wait_seconds=args.max_batch_wait_ms / 1000,
+        warmup_shapes=warmup_shapes,
+        embedding_cache_size=args.embedding_cache_size,
+        embedding_cache_dir=args.embedding_cache_dir,
+        fuse_lora=args.lora_mode == "fused",
+        defaults=_config_from_args(args, parser),
     )
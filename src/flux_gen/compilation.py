@@ -0,0 +1,161 @@
+"""torch.compile of the FLUX transformer and VAE decoder with a persistent cache."""
+
+import dataclasses
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import env
+
+
+WARMUP_PROMPT = "warm-up"
+
+
+@dataclass
+class WarmupTiming:
+    """First-call and steady-state time of one warmed-up shape."""
+    height: int
+    width: int
+    batch_size: int
+    first_call_seconds: float
+    steady_seconds: float
+    cache_state: str  # "cold" when the on-disk cache was empty at startup, else "warm"
+
+    @property
+    def shape(self) -> str:
+        return f"{self.height}x{self.width}x{self.batch_size}"
+
+
+def cache_root(gen_config) -> Path:
+    """Directory holding compiled artifacts for a config."""
+    if gen_config.compile_cache_dir:
+        return Path(gen_config.compile_cache_dir)
+    return env.cache_dir("compile")
+
+
+def parse_warmup_shapes(text: str | None) -> list[tuple[int, int, int]]:
+    """Parse ``"768x768,1024x1024x2"`` into ``(height, width, batch_size)`` tuples."""
+    shapes = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.lower().split("x")
+        if len(parts) not in (2, 3) or not all(part.isdigit() for part in parts):
+            raise ValueError(f"Invalid warm-up shape '{item}', expected HEIGHTxWIDTH or HEIGHTxWIDTHxBATCH")
+        height, width = int(parts[0]), int(parts[1])
+        batch_size = int(parts[2]) if len(parts) == 3 else 1
+        shapes.append((height, width, batch_size))
+    return shapes
+
+
+def _has_compiled_artifacts(root: Path) -> bool:
+    """Whether inductor left compiled artifacts under ``root``.
+
+    Inductor writes into subdirectories (fxgraph, aotautograd, triton and
+    per-kernel hash directories). Files at the top level, such as the
+    warm-up timings, and lock files do not count.
+    """
+    return any(
+        path.is_file() and path.parent != root and path.suffix != ".lock"
+        for path in root.rglob("*")
+    )
+
+
+def configure_cache(gen_config) -> str:
+    """Point the inductor caches at ``cache_root`` and report whether it is populated.
+
+    Must run before the first compiled call. Returns ``"warm"`` when an
+    earlier process already left compiled artifacts there, ``"cold"``
+    otherwise.
+    """
+    root = cache_root(gen_config)
+    root.mkdir(parents=True, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(root)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+    try:
+        import torch._inductor.config as inductor_config
+    except ImportError:
+        inductor_config = None
+    if inductor_config is not None:
+        # The config module may already have read the environment at import time
+        if hasattr(inductor_config, "fx_graph_cache"):
+            inductor_config.fx_graph_cache = True
+
+    return "warm" if _has_compiled_artifacts(root) else "cold"
+
+
+def compile_pipeline(pipe, gen_config) -> str:
+    """Compile the transformer and VAE decoder in place.
+
+    Shapes are compiled statically, so each (height, width, batch) gets its
+    own graph; use ``warm_up`` to pay for them before serving. Returns the
+    cache state reported by ``configure_cache``. Compiling twice is a no-op.
+    """
+    if getattr(pipe, "_flux_gen_compiled", False):
+        return getattr(pipe, "_flux_gen_cache_state", "warm")
+
+    import torch
+
+    cache_state = configure_cache(gen_config)
+    start = time.perf_counter()
+    # Module.compile keeps the module object, so offload hooks stay attached
+    pipe.transformer.compile(dynamic=False)
+    pipe.vae.decode = torch.compile(pipe.vae.decode, dynamic=False)
+    pipe._flux_gen_compiled = True
+    pipe._flux_gen_cache_state = cache_state
+    print(
+        f"Compiled transformer and VAE decoder in {time.perf_counter() - start:.1f}s "
+        f"(cache: {cache_root(gen_config)}, {cache_state} start)"
+    )
+    return cache_state
+
+
+def _record_timings(gen_config, timings: list[WarmupTiming]):
+    """Append warm-up timings so cold and warm starts can be compared across runs."""
+    path = cache_root(gen_config) / "warmup_timings.jsonl"
+    try:
+        with open(path, "a") as f:
+            for timing in timings:
+                record = dataclasses.asdict(timing)
+                record["model_id"] = gen_config.model_id
+                record["recorded_at"] = time.time()
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: could not record warm-up timings in {path}: {e}")
+
+
+def warm_up(pipe, gen_config, shapes: list[tuple[int, int, int]]) -> list[WarmupTiming]:
+    """Render each shape twice so later requests hit compiled graphs.
+
+    The first call pays tracing, kernel selection and cache loading; the
+    second shows the steady-state time. Both are printed and appended to
+    ``warmup_timings.jsonl`` in the cache directory.
+    """
+    from . import generate
+
+    cache_state = compile_pipeline(pipe, gen_config)
+    timings = []
+    for height, width, batch_size in shapes:
+        warm_config = dataclasses.replace(
+            gen_config, prompt=WARMUP_PROMPT, height=height, width=width,
+            lora_path=None, lora_trigger_word=None,
+        )
+        durations = []
+        for _ in range(2):
+            start = time.perf_counter()
+            generate.render_batch(pipe, [warm_config] * batch_size)
+            durations.append(time.perf_counter() - start)
+        timing = WarmupTiming(height, width, batch_size, durations[0], durations[1], cache_state)
+        print(
+            f"Warm-up {timing.shape}: first call {timing.first_call_seconds:.1f}s, "
+            f"steady {timing.steady_seconds:.1f}s ({cache_state} start)"
+        )
+        timings.append(timing)
+
+    _record_timings(gen_config, timings)
+    return timings
@@ -1,5 +1,6 @@
 """Configuration dataclasses for FLUX image generation."""
 
+import dataclasses
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -18,11 +19,35 @@ class GenerationConfig:
     lora_config_path: str | None = None  # Path to LoRA config file (.json)
     lora_scale: float = 1.0  # Scale factor for LoRA weights
     lora_trigger_word: str | None = None  # Trigger word for LoRA (auto-added to prompt)
+    output_name: str = "flux_schnell.png"  # File name inside out_dir
+    max_sequence_length: int = 512  # T5 prompt length, matches the FluxPipeline default
+    offload: str = "model"  # none, model, sequential or auto
+    dtype: str | None = None  # fp32, bf16 or fp16; None keeps the pipeline default
+    quantize: str | None = None  # int8 weight-only quantization of transformer and T5
+    quantized_cache_dir: str | None = None  # Where pre-quantized checkpoints are stored
+    attention_backend: str = "auto"  # auto, flash, efficient, cudnn or math
+    compile: bool = False  # torch.compile the transformer and VAE decoder
+    compile_cache_dir: str | None = None  # Where compiled artifacts persist across runs
+    trace_out: str | None = None  # Write per-stage spans here (.jsonl or Chrome trace .json)
+    seed: int | None = None  # Fixed seed makes the image reproducible (and cacheable)
+    num_images_per_prompt: int = 1  # Variants rendered in one call with seeds seed, seed+1, ...
+    model_revision: str | None = None  # Hub revision (branch, tag or commit) of model_id
+    snapshot_dir: str | None = None  # Load model_id from this prefetched snapshot, without the hub
+    shared_weights_dir: str | None = None  # Map transformer and T5 weights shared with other processes
+    result_cache_dir: str | None = None  # Reuse images of identical seeded jobs from here
+    result_cache_max_gb: float = 10.0  # Least recently used results are evicted above this
+    bypass_result_cache: bool = False  # Always render this job, then refresh its cache entry
+    vae_decode: str = "full"  # full, sliced, tiled or auto VAE decoding
+    vae_tile_size: int = 512  # Tile edge in pixels for tiled decoding
+    vae_tile_overlap: float = 0.25  # Fraction of a tile blended with its neighbours
+    allow_downscale: bool = False  # Render smaller rather than run out of device memory
+    progress: bool = False  # Print one line per denoising step with an ETA
+    preview_every: int = 0  # Save a latent preview every n steps (0 disables)
 
     @property
     def output_path(self) -> Path:
         """Get the full path where the generated image will be saved."""
-        return self.out_dir / "flux_schnell.png"
+        return self.out_dir / self.output_name
 
     @property
     def effective_prompt(self) -> str:
@@ -31,20 +56,60 @@ class GenerationConfig:
             return f"{self.lora_trigger_word}, {self.prompt}"
         return self.prompt
 
+    def with_overrides(self, values: dict) -> 'GenerationConfig':
+        """Return a copy with fields replaced from a mapping of raw values.
+
+        Values are converted to the declared field types so rows from CSV
+        manifests or JSON payloads can be used directly. Empty strings keep
+        the current value.
+        """
+        field_types = {f.name: f.type for f in dataclasses.fields(self)}
+
+        unknown = sorted(set(values) - set(field_types))
+        if unknown:
+            raise ValueError(f"Unknown GenerationConfig fields: {', '.join(unknown)}")
+
+        overrides = {}
+        for name, value in values.items():
+            if value == "":
+                continue
+            overrides[name] = _coerce_field_value(field_types[name], value)
+        return dataclasses.replace(self, **overrides)
+
+
+def _coerce_field_value(field_type, value):
+    """Convert a raw value to the type declared on a config field."""
+    if value is None:
+        return None
+    if field_type is bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if field_type is int:
+        return int(value)
+    if field_type is float:
+        return float(value)
+    if field_type is Path:
+        return Path(value)
+    return str(value)
+
 
 @dataclass
 class RuntimeConfig:
     """Configuration for runtime environment."""
     hf_token: str | None
     has_cuda: bool
+    free_device_memory: int | None = None  # Free CUDA memory in bytes at startup
 
     @classmethod
     def from_env(cls) -> 'RuntimeConfig':
         """Create RuntimeConfig from environment variables."""
         import os
+        has_cuda = cls._detect_cuda()
         return cls(
             hf_token=os.getenv("HF_TOKEN"),
-            has_cuda=cls._detect_cuda()
+            has_cuda=has_cuda,
+            free_device_memory=cls._detect_free_device_memory() if has_cuda else None,
         )
 
     @staticmethod
@@ -55,3 +120,13 @@ class RuntimeConfig:
             return torch.cuda.is_available()
         except ImportError:
             return False
+
+    @staticmethod
+    def _detect_free_device_memory() -> int | None:
+        """Detect free memory on the current CUDA device."""
+        try:
+            import torch
+            free, _total = torch.cuda.mem_get_info()
+            return free
+        except Exception:
+            return None
@@ -1,5 +1,8 @@
 """Device detection and reporting for FLUX generation."""
 
+import os
+from pathlib import Path
+
 
 def detect_and_report_device(runtime_config):
     """Detect device capabilities and print system information."""
@@ -24,3 +27,38 @@ def report_hf_token_status(runtime_config):
         print("Warning: HF_TOKEN environment variable not set.")
         print("If the model is private, set HF_TOKEN before running:")
         print("export HF_TOKEN=your_huggingface_token_here")
+
+
+def cuda_device_count() -> int:
+    """Number of visible CUDA devices, 0 without torch or CUDA."""
+    try:
+        import torch
+    except ImportError:
+        return 0
+    return torch.cuda.device_count() if torch.cuda.is_available() else 0
+
+
+def _parse_cpu_list(text: str) -> set[int]:
+    """Parse a kernel CPU list such as ``0-3,8,10-11``."""
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_cpu_slices() -> list[tuple[int, ...]]:
+    """CPUs usable by this process grouped by NUMA node.
+
+    Falls back to a single slice with every usable CPU where the topology
+    is not exposed (non-Linux, containers without sysfs).
+    """
+    usable = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    slices = []
+    for cpulist in sorted(Path("/sys/devices/system/node").glob("node[0-9]*/cpulist")):
+        cpus = _parse_cpu_list(cpulist.read_text()) & usable
+        if cpus:
+            slices.append(tuple(sorted(cpus)))
+    return slices or [tuple(sorted(usable))]
@@ -0,0 +1,150 @@
+"""Content-addressed cache of FLUX text encoder outputs."""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from . import config
+
+
+def embedding_cache_key(gen_config: config.GenerationConfig) -> str:
+    """Return the content address of a config's prompt embeddings.
+
+    The key covers the model, its revision, dtype and quantization, the
+    effective prompt (so LoRA trigger words are included) and the T5
+    sequence length. The LoRA file and scale are part of the key as well
+    because an adapter may also patch the text encoders.
+    """
+    material = {
+        "model_id": gen_config.model_id,
+        "model_revision": gen_config.model_revision,
+        "dtype": gen_config.dtype,
+        "quantize": gen_config.quantize,
+        "prompt": gen_config.effective_prompt,
+        "max_sequence_length": gen_config.max_sequence_length,
+    }
+    if gen_config.lora_path:
+        material["lora_path"] = gen_config.lora_path
+        material["lora_scale"] = gen_config.lora_scale
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _on_encoder_device(pipe, embeds: tuple) -> tuple:
+    """Move embeddings read from disk to the device and dtypes ``encode_prompt`` returns."""
+    prompt_embeds, pooled_prompt_embeds = embeds
+    device = getattr(pipe, "_execution_device", None)
+    t5_dtype = getattr(getattr(pipe, "text_encoder_2", None), "dtype", None)
+    clip_dtype = getattr(getattr(pipe, "text_encoder", None), "dtype", None)
+    return (
+        prompt_embeds.to(device=device, dtype=t5_dtype),
+        pooled_prompt_embeds.to(device=device, dtype=clip_dtype),
+    )
+
+
+class PromptEmbeddingCache:
+    """Two-tier cache of ``prompt_embeds`` / ``pooled_prompt_embeds``.
+
+    The first tier is an in-memory LRU holding up to ``max_entries`` prompts.
+    When ``cache_dir`` is set, encoded prompts are also written there as
+    safetensors files and read back on in-memory misses, so warm prompts
+    survive restarts. On a hit the T5 and CLIP encoders are not called at all,
+    which with CPU offload also means they are never moved to the device.
+    """
+
+    def __init__(self, max_entries: int = 128, cache_dir: Path | None = None):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.safetensors"
+
+    def _remember(self, key: str, embeds: tuple):
+        self._entries[key] = embeds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> tuple | None:
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        from safetensors.torch import load_file
+
+        tensors = load_file(path)
+        return tensors["prompt_embeds"], tensors["pooled_prompt_embeds"]
+
+    def _save_to_disk(self, key: str, embeds: tuple):
+        if self.cache_dir is None:
+            return
+        from safetensors.torch import save_file
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        prompt_embeds, pooled_prompt_embeds = embeds
+        save_file(
+            {
+                "prompt_embeds": prompt_embeds.detach().cpu().contiguous(),
+                "pooled_prompt_embeds": pooled_prompt_embeds.detach().cpu().contiguous(),
+            },
+            self._disk_path(key),
+        )
+
+    def get_or_encode(self, pipe, gen_config: config.GenerationConfig) -> tuple:
+        """Return ``(prompt_embeds, pooled_prompt_embeds)`` for a config.
+
+        Encodes with ``pipe.encode_prompt`` on a miss in both tiers.
+        """
+        key = embedding_cache_key(gen_config)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            embeds = self._load_from_disk(key)
+            if embeds is not None:
+                embeds = _on_encoder_device(pipe, embeds)
+                self.disk_hits += 1
+                self._remember(key, embeds)
+                return embeds
+
+            self.misses += 1
+            prompt_embeds, pooled_prompt_embeds, _text_ids = pipe.encode_prompt(
+                prompt=gen_config.effective_prompt,
+                prompt_2=None,
+                max_sequence_length=gen_config.max_sequence_length,
+            )
+            embeds = (prompt_embeds, pooled_prompt_embeds)
+            self._remember(key, embeds)
+            self._save_to_disk(key, embeds)
+            return embeds
+
+    def stats(self) -> dict:
+        """Return hit/miss counters."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+def make_embedding_cache(max_entries: int, cache_dir: str | None = None) -> PromptEmbeddingCache | None:
+    """Build a cache from CLI settings, or None when caching is disabled."""
+    if max_entries <= 0 and not cache_dir:
+        return None
+    return PromptEmbeddingCache(max_entries=max(max_entries, 1), cache_dir=cache_dir)
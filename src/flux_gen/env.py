@@ -1,10 +1,20 @@
 """Environment setup for FLUX compatibility."""
 
 import os
+from pathlib import Path
 
 
 def apply_compatibility_settings():
-    """Apply environment variables for FLUX model compatibility."""
-    # Set environment variables for FLUX compatibility
-    os.environ['DIFFUSERS_FORCE_ATTENTION_BACKEND'] = 'math'
+    """Apply environment variables for FLUX model compatibility.
+
+    The attention backend is no longer forced to 'math' here; see
+    attention.backend_for, which benchmarks the available backends and only
+    falls back to 'math' when the faster ones fail.
+    """
     os.environ.setdefault('TORCH_USE_CUDA_DSA', '1')
+
+
+def cache_dir(name: str) -> Path:
+    """Return a flux_gen cache subdirectory, honoring FLUX_GEN_CACHE_DIR."""
+    root = os.environ.get("FLUX_GEN_CACHE_DIR", os.path.join("~", ".cache", "flux_gen"))
+    return Path(root).expanduser() / name
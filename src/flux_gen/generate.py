@@ -1,10 +1,15 @@
 """Main generation orchestrator for FLUX images."""
 
-from . import config, device, env, io, pipeline
+import dataclasses
+import random
+import time
+from pathlib import Path
 
+from . import attention, config, device, env, io, memory, metrics, pipeline, progress, result_cache, trace
 
-def run_generation(gen_config: config.GenerationConfig):
-    """Run the complete FLUX image generation pipeline."""
+
+def prepare_runtime() -> config.RuntimeConfig:
+    """Apply environment settings and report device and token status."""
     # Apply environment settings
     env.apply_compatibility_settings()
 
@@ -15,24 +20,255 @@ def run_generation(gen_config: config.GenerationConfig):
     device.detect_and_report_device(runtime_config)
     device.report_hf_token_status(runtime_config)
 
-    # Ensure output directory exists
-    io.ensure_output_directory(gen_config.out_dir)
-
-    # Load pipeline
-    pipe = pipeline.load_flux_pipeline(gen_config, runtime_config)
+    return runtime_config
 
-    # Run inference (use effective_prompt which includes LoRA trigger word if specified)
-    effective_prompt = gen_config.effective_prompt
-    if effective_prompt != gen_config.prompt:
-        print(f"Using effective prompt with LoRA trigger: '{effective_prompt}'")
 
-    image = pipe(
-        prompt=effective_prompt,
+def _sampling_kwargs(gen_config: config.GenerationConfig) -> dict:
+    """Pipeline arguments shared by single and batched calls."""
+    return dict(
         height=gen_config.height,
         width=gen_config.width,
         guidance_scale=gen_config.guidance_scale,
         num_inference_steps=gen_config.num_inference_steps,
-    ).images[0]
+        max_sequence_length=gen_config.max_sequence_length,
+    )
+
+
+def _generator_kwargs(gen_configs: list[config.GenerationConfig]) -> dict:
+    """Seeded generators, one per config, when any config sets a seed.
+
+    Without seeds nothing is passed and the pipeline draws its own noise.
+    Unseeded configs in a seeded batch get a random seed.
+    """
+    if all(gen_config.seed is None for gen_config in gen_configs):
+        return {}
+    import torch
+
+    generators = []
+    for gen_config in gen_configs:
+        generator = torch.Generator(device="cpu")
+        if gen_config.seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(gen_config.seed)
+        generators.append(generator)
+    return dict(generator=generators[0] if len(generators) == 1 else generators)
+
+
+def _step_kwargs(gen_config: config.GenerationConfig) -> dict:
+    """Step callbacks of the tracer and the progress tracker, chained into one."""
+    trace_kwargs = trace.pipeline_kwargs()
+    progress_kwargs = progress.pipeline_kwargs(gen_config)
+    callbacks = [kwargs.pop("callback_on_step_end") for kwargs in (trace_kwargs, progress_kwargs) if kwargs]
+    if len(callbacks) < 2:
+        return {**trace_kwargs, **progress_kwargs, **({"callback_on_step_end": callbacks[0]} if callbacks else {})}
+
+    def on_step_end(pipe, step, timestep, callback_kwargs):
+        for callback in callbacks:
+            callback_kwargs = callback(pipe, step, timestep, callback_kwargs)
+        return callback_kwargs
+
+    return {**progress_kwargs, "callback_on_step_end": on_step_end}
+
+
+def pipeline_kwargs(gen_configs: list[config.GenerationConfig], num_images_per_prompt: int = 1) -> dict:
+    """Sampling, seed and step callback arguments of one pipeline call.
+
+    ``gen_configs`` are the prompts of a batch or, with
+    ``num_images_per_prompt``, the variants of one prompt; they share
+    shape and sampling settings, so those of the first apply. Build the
+    arguments per call, since seeded generators are consumed by it.
+    """
+    first = gen_configs[0]
+    count = dict(num_images_per_prompt=num_images_per_prompt) if num_images_per_prompt > 1 else {}
+    return {**_sampling_kwargs(first), **count, **_generator_kwargs(gen_configs), **_step_kwargs(first)}
+
+
+def _prompt_kwargs(pipe, gen_configs: list[config.GenerationConfig], embedding_cache=None) -> dict:
+    """Prompt arguments: raw prompts, or cached embeddings when a cache is given."""
+    if embedding_cache is None:
+        prompts = [gen_config.effective_prompt for gen_config in gen_configs]
+        return dict(prompt=prompts[0] if len(prompts) == 1 else prompts)
+
+    embeds = [embedding_cache.get_or_encode(pipe, gen_config) for gen_config in gen_configs]
+    if len(embeds) == 1:
+        prompt_embeds, pooled_prompt_embeds = embeds[0]
+    else:
+        import torch
+
+        prompt_embeds = torch.cat([e[0] for e in embeds])
+        pooled_prompt_embeds = torch.cat([e[1] for e in embeds])
+    return dict(prompt_embeds=prompt_embeds, pooled_prompt_embeds=pooled_prompt_embeds)
+
+
+def render_image(pipe, gen_config: config.GenerationConfig, embedding_cache=None):
+    """Run inference for a single config on an already loaded pipeline.
+
+    With an ``embedding_cache`` the prompt is encoded through the cache and
+    the pipeline receives ``prompt_embeds`` instead of the raw prompt.
+    """
+    # Use effective_prompt which includes LoRA trigger word if specified
+    effective_prompt = gen_config.effective_prompt
+    if effective_prompt != gen_config.prompt:
+        print(f"Using effective prompt with LoRA trigger: '{effective_prompt}'")
+
+    with trace.span("render", height=gen_config.height, width=gen_config.width, batch_size=1), \
+            trace.instrument_pipeline(pipe), progress.cancellable(pipe):
+        prompt_kwargs = _prompt_kwargs(pipe, [gen_config], embedding_cache)
+        return attention.run_with_backend(
+            gen_config,
+            lambda: pipe(**prompt_kwargs, **pipeline_kwargs([gen_config])).images[0],
+        )
+
+
+def variant_configs(gen_config: config.GenerationConfig) -> list[config.GenerationConfig]:
+    """Expand ``num_images_per_prompt`` into one single-image config per seed.
+
+    Variants use consecutive seeds from ``seed`` (a random base when unset)
+    and seed-stamped file names, e.g. ``portrait_seed42.png``. A config with
+    a single image is returned unchanged.
+    """
+    count = gen_config.num_images_per_prompt
+    if count < 1:
+        raise ValueError("num_images_per_prompt must be at least 1")
+    if count == 1:
+        return [gen_config]
+
+    base_seed = gen_config.seed if gen_config.seed is not None else random.randrange(2 ** 32)
+    stem, suffix = Path(gen_config.output_name).stem, Path(gen_config.output_name).suffix
+    return [
+        dataclasses.replace(
+            gen_config,
+            seed=base_seed + offset,
+            num_images_per_prompt=1,
+            output_name=f"{stem}_seed{base_seed + offset}{suffix}",
+        )
+        for offset in range(count)
+    ]
+
+
+def render_variants(pipe, variants: list[config.GenerationConfig], embedding_cache=None) -> list:
+    """Render the seeded variants of one prompt in a single call.
+
+    ``variants`` comes from ``variant_configs``; the prompt is encoded once
+    and shared by all of them. Returns one image per variant, in order.
+    """
+    if len(variants) == 1:
+        return [render_image(pipe, variants[0], embedding_cache)]
+
+    first = variants[0]
+    with trace.span("render", height=first.height, width=first.width, batch_size=len(variants)), \
+            trace.instrument_pipeline(pipe), progress.cancellable(pipe):
+        prompt_kwargs = _prompt_kwargs(pipe, [first], embedding_cache)
+        return attention.run_with_backend(
+            first,
+            lambda: pipe(**prompt_kwargs, **pipeline_kwargs(variants, num_images_per_prompt=len(variants))).images,
+        )
+
+
+def render_batch(pipe, gen_configs: list[config.GenerationConfig], embedding_cache=None) -> list:
+    """Render several configs that share shape and sampling settings in one call.
+
+    All configs must agree on height, width, guidance_scale and
+    num_inference_steps; only the prompts differ. Returns one image per
+    config, in order.
+    """
+    if len(gen_configs) == 1:
+        return [render_image(pipe, gen_configs[0], embedding_cache)]
+
+    first = gen_configs[0]
+    with trace.span("render", height=first.height, width=first.width, batch_size=len(gen_configs)), \
+            trace.instrument_pipeline(pipe), progress.cancellable(pipe):
+        prompt_kwargs = _prompt_kwargs(pipe, gen_configs, embedding_cache)
+        return attention.run_with_backend(
+            first,
+            lambda: pipe(**prompt_kwargs, **pipeline_kwargs(gen_configs)).images,
+        )
+
+
+def _print_progress(gen_config: config.GenerationConfig):
+    """Progress listener printing each step and saving latent previews."""
+    preview_path = gen_config.output_path.with_name(f"{gen_config.output_path.stem}_preview.png")
+
+    def listener(event: progress.ProgressEvent):
+        if gen_config.progress:
+            print(f"Step {event.step}/{event.total_steps} ({event.fraction:.0%}), "
+                  f"{event.elapsed_seconds:.1f}s elapsed, ETA {event.eta_seconds:.1f}s")
+        if event.preview is not None:
+            io.ensure_output_directory(gen_config.out_dir)
+            event.preview.save(preview_path)
+
+    return listener
+
+
+def run_generation(gen_config: config.GenerationConfig, listener=None,
+                   token: progress.CancellationToken | None = None):
+    """Run the complete FLUX image generation pipeline.
+
+    With ``gen_config.trace_out`` set, every stage is recorded as a span and
+    written there when the run finishes (see ``trace.Tracer.write``).
+    ``listener`` receives a ``progress.ProgressEvent`` after every denoising
+    step (by default steps are printed with ``gen_config.progress``), and
+    cancelling ``token`` stops the run at the next step with
+    ``progress.GenerationCancelled``.
+    """
+    if listener is None and (gen_config.progress or gen_config.preview_every):
+        listener = _print_progress(gen_config)
+    if gen_config.trace_out:
+        trace.start()
+    try:
+        if listener is None and token is None:
+            _run_generation(gen_config)
+        else:
+            with progress.track(listener, token, gen_config.preview_every):
+                _run_generation(gen_config)
+    finally:
+        tracer = trace.stop() if gen_config.trace_out else None
+        if tracer is not None:
+            tracer.write(gen_config.trace_out)
+
+
+def _run_generation(gen_config: config.GenerationConfig):
+    variants = variant_configs(gen_config)
+
+    # Identical seeded jobs are served from the result cache without loading the model
+    cache = result_cache.cache_for(gen_config)
+    if cache is not None:
+        io.ensure_output_directory(gen_config.out_dir)
+        restored = [cache.restore(variant) for variant in variants]
+        if all(restored):
+            print(f"Result cache: {cache.stats()}")
+            return
+
+    with trace.span("env_setup"):
+        runtime_config = prepare_runtime()
+
+    # Ensure output directory exists
+    io.ensure_output_directory(gen_config.out_dir)
+
+    # Load pipeline
+    with trace.span("load_pipeline", model_id=gen_config.model_id):
+        pipe = pipeline.load_flux_pipeline(gen_config, runtime_config)
+
+    # Run inference, within device memory where it can be predicted
+    metrics.reset_device_peak_memory()
+    start = time.perf_counter()
+    variants, images = memory.render_admitted(pipe, variants, render_variants, runtime_config)
+    render_seconds = time.perf_counter() - start
+    print(
+        f"Generated {len(images)} image{'s' if len(images) > 1 else ''} in {render_seconds:.1f}s "
+        f"(dtype: {gen_config.dtype or 'default'}, quantize: {gen_config.quantize or 'none'}, "
+        f"offload: {gen_config.offload}, "
+        f"peak device memory: {metrics.format_bytes(metrics.device_peak_memory_bytes())}, "
+        f"peak RSS: {metrics.format_bytes(metrics.peak_rss_bytes())})"
+    )
 
-    # Save result
-    io.save_generated_image(image, gen_config.output_path)
+    # Save results; seeded images carry the settings needed to regenerate them
+    for variant, image in zip(variants, images):
+        with trace.span("save_image", path=str(variant.output_path)):
+            if variant.seed is None:
+                io.save_generated_image(image, variant.output_path)
+            else:
+                io.save_generated_image(image, variant.output_path, io.image_metadata(variant))
+        if cache is not None:
+            cache.store(variant, image, render_seconds / len(images))
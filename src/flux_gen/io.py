@@ -1,6 +1,11 @@
 """Input/Output operations for FLUX generation."""
 
+import json
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
 
@@ -9,7 +14,243 @@ def ensure_output_directory(out_dir: Path):
     os.makedirs(out_dir, exist_ok=True)
 
 
-def save_generated_image(image, output_path: Path):
-    """Save the generated image to the specified path."""
-    image.save(output_path)
+def save_generated_image(image, output_path: Path, metadata: dict | None = None):
+    """Save the generated image to the specified path.
+
+    ``metadata`` is embedded as PNG text chunks when saving a PNG.
+    """
+    if metadata and Path(output_path).suffix.lower() == ".png":
+        image.save(output_path, pnginfo=png_info(metadata))
+    else:
+        image.save(output_path)
     print(f"Saved: {output_path}")
+
+
+def image_metadata(gen_config) -> dict:
+    """Text metadata that lets an image be regenerated exactly.
+
+    ``parameters`` holds the settings that determine the pixels as JSON;
+    ``prompt`` and ``seed`` are repeated as plain keys for image viewers.
+    """
+    parameters = {
+        "model_id": gen_config.model_id,
+        "model_revision": gen_config.model_revision,
+        "prompt": gen_config.prompt,
+        "lora_trigger_word": gen_config.lora_trigger_word,
+        "height": gen_config.height,
+        "width": gen_config.width,
+        "guidance_scale": gen_config.guidance_scale,
+        "num_inference_steps": gen_config.num_inference_steps,
+        "max_sequence_length": gen_config.max_sequence_length,
+        "seed": gen_config.seed,
+        "dtype": gen_config.dtype,
+        "quantize": gen_config.quantize,
+    }
+    if gen_config.lora_path:
+        from . import lora
+
+        parameters["lora_path"] = gen_config.lora_path
+        parameters["lora_sha256"] = lora.file_sha256(gen_config.lora_path)
+        parameters["lora_scale"] = gen_config.lora_scale
+    return {
+        "prompt": gen_config.effective_prompt,
+        "seed": str(gen_config.seed),
+        "parameters": json.dumps(parameters, sort_keys=True),
+    }
+
+
+def png_info(metadata: dict):
+    """Build PNG text chunks from a mapping of strings."""
+    from PIL.PngImagePlugin import PngInfo
+
+    info = PngInfo()
+    for key, value in metadata.items():
+        info.add_text(key, str(value))
+    return info
+
+
+# EXIF ImageDescription, which holds the metadata of non-PNG images
+EXIF_DESCRIPTION_TAG = 0x010E
+
+
+def exif_bytes(metadata: dict) -> bytes:
+    """Encode metadata as JSON in the EXIF image description, for formats without text chunks."""
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[EXIF_DESCRIPTION_TAG] = json.dumps(metadata, sort_keys=True)
+    return exif.tobytes()
+
+
+# Output format name -> (Pillow format, file suffix)
+IMAGE_FORMATS = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "avif": ("AVIF", ".avif"),
+}
+
+# Quality presets for the lossy formats (JPEG, AVIF)
+QUALITY_PRESETS = {"high": 95, "balanced": 85, "small": 70}
+
+
+def image_save_options(output_format: str = "png", png_compress_level: int = 6, quality: str = "high") -> dict:
+    """Pillow ``save`` keyword arguments for an output format.
+
+    PNG uses ``png_compress_level`` (0 = fastest, 9 = smallest), WebP is
+    always lossless, JPEG and AVIF use the ``quality`` preset.
+    """
+    if output_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {', '.join(IMAGE_FORMATS)}")
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown quality preset '{quality}', expected one of {', '.join(QUALITY_PRESETS)}")
+
+    options = {"format": IMAGE_FORMATS[output_format][0]}
+    if output_format == "png":
+        if not 0 <= png_compress_level <= 9:
+            raise ValueError("PNG compress level must be between 0 and 9")
+        options["compress_level"] = png_compress_level
+    elif output_format == "webp":
+        options["lossless"] = True
+    else:
+        options["quality"] = QUALITY_PRESETS[quality]
+    return options
+
+
+def write_image_atomic(image, output_path: Path, **save_options) -> int:
+    """Encode to a temporary file next to ``output_path`` and rename it into place.
+
+    Readers never see a partially written image. Returns the file size.
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        image.save(tmp_path, **save_options)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return output_path.stat().st_size
+
+
+@dataclass
+class WriterStats:
+    """Throughput of an ImageWriter."""
+    images: int = 0
+    bytes_written: int = 0
+    encode_seconds: float = 0.0  # Summed over writer threads
+    wall_seconds: float = 0.0  # From writer creation to close
+
+    @property
+    def images_per_second(self) -> float:
+        return self.images / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_written / 1024 ** 2 / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+class ImageWriter:
+    """Encodes and writes images on a thread pool so saving overlaps inference.
+
+    Pillow releases the GIL while encoding, so threads scale without copying
+    images to other processes. At most ``max_pending`` images are queued or
+    being written; ``submit`` blocks beyond that, which bounds the memory held
+    by finished images. Files are written atomically and get the suffix of
+    the output format.
+    """
+
+    def __init__(self, output_format: str = "png", png_compress_level: int = 6, quality: str = "high",
+                 max_workers: int = 2, max_pending: int = 8):
+        self.output_format = output_format
+        self._save_options = image_save_options(output_format, png_compress_level, quality)
+        if output_format == "avif":
+            from PIL import features
+            if not features.check("avif"):
+                raise RuntimeError(
+                    "This Pillow build cannot write AVIF. Upgrade Pillow (>=11.3) or install pillow-avif-plugin"
+                )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-writer")
+        self._slots = threading.BoundedSemaphore(max(max_pending, max_workers))
+        self._pending: set[Future] = set()
+        self._errors: list[BaseException] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.stats = WriterStats()
+
+    def output_path_for(self, output_path: Path) -> Path:
+        """The path an image submitted for ``output_path`` is written to."""
+        return Path(output_path).with_suffix(IMAGE_FORMATS[self.output_format][1])
+
+    def _write(self, image, output_path: Path, metadata: dict | None) -> Path:
+        start = time.perf_counter()
+        save_options = self._save_options
+        if metadata and self.output_format == "png":
+            save_options = {**save_options, "pnginfo": png_info(metadata)}
+        elif metadata:
+            save_options = {**save_options, "exif": exif_bytes(metadata)}
+        try:
+            size = write_image_atomic(image, output_path, **save_options)
+        except BaseException as e:
+            # Recorded before the future completes, so a flush racing with it still sees the error
+            with self._lock:
+                self._errors.append(e)
+            raise
+        with self._lock:
+            self.stats.images += 1
+            self.stats.bytes_written += size
+            self.stats.encode_seconds += time.perf_counter() - start
+        print(f"Saved: {output_path}")
+        return output_path
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def submit(self, image, output_path: Path, metadata: dict | None = None) -> Future:
+        """Queue an image for writing; the future resolves to the written path.
+
+        ``metadata`` is embedded as text chunks in PNG output and as the
+        EXIF image description in other formats.
+        """
+        self._slots.acquire()
+        future = self._executor.submit(self._write, image, self.output_path_for(output_path), metadata)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def flush(self):
+        """Wait for every queued image; re-raise the first write error."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result()
+            except BaseException:
+                pass
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self) -> WriterStats:
+        """Flush, stop the threads and report write throughput."""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.stats.wall_seconds = time.perf_counter() - self._start
+        print(
+            f"Wrote {self.stats.images} {self.output_format} images "
+            f"({self.stats.bytes_written / 1024 ** 2:.1f} MiB) at {self.stats.images_per_second:.2f} img/s, "
+            f"{self.stats.megabytes_per_second:.1f} MiB/s (encode time {self.stats.encode_seconds:.2f}s)"
+        )
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
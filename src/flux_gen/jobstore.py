@@ -0,0 +1,362 @@
+"""Durable SQLite job queue with leases, for batches that survive crashes and restarts."""
+
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import batch, config, generate, io, worker
+
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+# Fields that change how a job is reported, not what it produces
+_NON_IDENTIFYING_FIELDS = ("progress", "preview_every", "trace_out")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    outputs TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_position ON jobs (status, position);
+"""
+
+
+def _config_to_json(gen_config: config.GenerationConfig) -> dict:
+    values = dataclasses.asdict(gen_config)
+    values["out_dir"] = str(values["out_dir"])
+    return values
+
+
+def job_id(gen_config: config.GenerationConfig) -> str:
+    """Stable ID of a job: the hash of every setting that shapes its outputs.
+
+    Resubmitting the same manifest row gives the same ID, so finished rows
+    are recognised and skipped.
+    """
+    values = _config_to_json(gen_config)
+    for name in _NON_IDENTIFYING_FIELDS:
+        values.pop(name, None)
+    encoded = json.dumps(values, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_exited(worker_name: str | None) -> bool:
+    """Whether a worker named ``host:pid`` ran on this host and its process is gone."""
+    host, _, pid = (worker_name or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+@dataclass
+class JobRecord:
+    """One row of the job store."""
+    job_id: str
+    position: int
+    config: config.GenerationConfig
+    status: str
+    attempts: int
+    worker: str | None
+    lease_expires: float | None
+    submitted_at: float
+    started_at: float | None
+    finished_at: float | None
+    seconds: float | None
+    outputs: list[Path]
+    error: str | None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'JobRecord':
+        values = json.loads(row["config"])
+        gen_config = config.GenerationConfig(**{**values, "out_dir": Path(values["out_dir"])})
+        return cls(
+            job_id=row["job_id"],
+            position=row["position"],
+            config=gen_config,
+            status=row["status"],
+            attempts=row["attempts"],
+            worker=row["worker"],
+            lease_expires=row["lease_expires"],
+            submitted_at=row["submitted_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+            seconds=row["seconds"],
+            outputs=[Path(path) for path in json.loads(row["outputs"] or "[]")],
+            error=row["error"],
+        )
+
+
+class JobStore:
+    """Generation jobs and their status in a SQLite file.
+
+    Jobs move from ``queued`` to ``running`` when a worker claims them and
+    to ``done`` or ``failed`` when it reports back. A claim is a lease of
+    ``lease_seconds`` that the worker renews while it renders; when a
+    worker dies its lease runs out and the job is queued again, until it
+    has been started ``max_attempts`` times. Several processes may share
+    one store file on the same host.
+    """
+
+    def __init__(self, path: str | Path, lease_seconds: float = 600.0, max_attempts: int = 3):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Serialize against other threads and, with BEGIN IMMEDIATE, other processes."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def submit(self, jobs: list[config.GenerationConfig]) -> list[str]:
+        """Add jobs in order and return their IDs.
+
+        Jobs already in the store keep their status, so finished ones are
+        not rendered again; failed ones are queued for a fresh set of
+        attempts.
+        """
+        now = time.time()
+        ids, added, requeued = [], 0, 0
+        with self._transaction() as db:
+            position = db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM jobs").fetchone()[0]
+            for job in jobs:
+                identifier = job_id(job)
+                ids.append(identifier)
+                row = db.execute("SELECT status FROM jobs WHERE job_id = ?", (identifier,)).fetchone()
+                if row is None:
+                    db.execute(
+                        "INSERT INTO jobs (job_id, position, config, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                        (identifier, position, json.dumps(_config_to_json(job)), "queued", now),
+                    )
+                    position += 1
+                    added += 1
+                elif row["status"] == "failed":
+                    db.execute(
+                        "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, worker = NULL "
+                        "WHERE job_id = ?",
+                        (identifier,),
+                    )
+                    requeued += 1
+        print(f"Job store {self.path}: {added} new, {requeued} failed requeued, {self.counts()}")
+        return ids
+
+    def _expire_leases(self, db, now: float, claimant: str) -> int:
+        """Requeue or fail running jobs whose worker is gone.
+
+        A worker is gone when its lease ran out, when it is a ``host:pid``
+        on this host whose process exited, or when it is the claimant
+        itself: a worker holds one job at a time, so a job still leased to
+        it is left over from a run that crashed.
+        """
+        running = db.execute("SELECT job_id, attempts, worker, lease_expires FROM jobs WHERE status = 'running'")
+        expired = [
+            row for row in running.fetchall()
+            if row["lease_expires"] < now or row["worker"] == claimant or _worker_exited(row["worker"])
+        ]
+        for row in expired:
+            if row["attempts"] >= self.max_attempts:
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, lease_expires = NULL "
+                    "WHERE job_id = ?",
+                    (now, f"lease of worker {row['worker']} expired after {row['attempts']} attempts",
+                     row["job_id"]),
+                )
+            else:
+                db.execute("UPDATE jobs SET status = 'queued', lease_expires = NULL WHERE job_id = ?",
+                           (row["job_id"],))
+        return len(expired)
+
+    def claim(self, worker_name: str) -> JobRecord | None:
+        """Lease the oldest queued job to ``worker_name``, or return None when none is left."""
+        now = time.time()
+        with self._transaction() as db:
+            expired = self._expire_leases(db, now, worker_name)
+            if expired:
+                print(f"Job store: {expired} expired lease{'s' if expired > 1 else ''} recovered")
+            row = db.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY position LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started_at = ?, "
+                "lease_expires = ?, error = NULL WHERE job_id = ?",
+                (worker_name, now, now + self.lease_seconds, row["job_id"]),
+            )
+        return self.get(row["job_id"])
+
+    def renew(self, identifier: str, worker_name: str) -> bool:
+        """Extend a lease; False when the job is no longer leased to this worker."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, identifier, worker_name),
+            )
+        return cursor.rowcount == 1
+
+    @contextlib.contextmanager
+    def keep_leased(self, identifier: str, worker_name: str):
+        """Renew the job's lease in the background for the duration of the block."""
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(self.lease_seconds / 3):
+                self.renew(identifier, worker_name)
+
+        thread = threading.Thread(target=renew_until_stopped, name="flux-job-lease", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, identifier: str, outputs: list[Path], seconds: float):
+        """Mark a job done with its output paths and render time."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, seconds = ?, outputs = ?, "
+                "lease_expires = NULL, error = NULL WHERE job_id = ?",
+                (time.time(), seconds, json.dumps([str(path) for path in outputs]), identifier),
+            )
+
+    def fail(self, identifier: str, error: str):
+        """Mark a job failed with the error text."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, lease_expires = NULL "
+                "WHERE job_id = ?",
+                (time.time(), error, identifier),
+            )
+
+    def get(self, identifier: str) -> JobRecord | None:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE job_id = ?", (identifier,)).fetchone()
+        return JobRecord.from_row(row) if row is not None else None
+
+    def jobs(self, status: str | None = None) -> list[JobRecord]:
+        """All jobs, or those with ``status``, in submission order."""
+        query, params = "SELECT * FROM jobs ORDER BY position", ()
+        if status is not None:
+            query, params = "SELECT * FROM jobs WHERE status = ? ORDER BY position", (status,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [JobRecord.from_row(row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_store(store: JobStore, worker_name: str | None = None, embedding_cache=None, fuse_lora: bool = True,
+              writer: io.ImageWriter | None = None, poll_seconds: float = 5.0) -> batch.BatchReport:
+    """Render queued jobs of a store until every job is done or failed.
+
+    Each job is claimed, rendered under a renewed lease and recorded as
+    done only once its images are on disk, so a crash at any point leaves
+    the job to be resumed. While other workers still hold jobs, the run
+    polls every ``poll_seconds`` and takes over those whose worker dies.
+    Pipelines are kept loaded across jobs. Failing jobs are recorded and
+    the run goes on.
+    """
+    worker_name = worker_name or default_worker_name()
+    report = batch.BatchReport()
+    pipelines = worker.PipelineCache()
+    runtime_config = None
+    run_start = time.perf_counter()
+
+    waiting = False
+    while True:
+        record = store.claim(worker_name)
+        if record is None:
+            running = store.counts()["running"]
+            if not running:
+                break
+            if not waiting:
+                print(f"Waiting for {running} job{'s' if running > 1 else ''} leased to other workers")
+            waiting = True
+            time.sleep(poll_seconds)
+            continue
+        waiting = False
+        job_start = time.perf_counter()
+        try:
+            with store.keep_leased(record.job_id, worker_name):
+                variants = generate.variant_configs(record.config)
+                outputs = batch.restore_job(variants, writer)
+                if outputs is None:
+                    if runtime_config is None:
+                        runtime_config = generate.prepare_runtime()
+                    pipe = pipelines.get(record.config, runtime_config)
+                    outputs = [path for path, _ in batch.render_job(pipe, variants, runtime_config,
+                                                                    embedding_cache, writer, fuse_lora)]
+                if writer is not None:
+                    writer.flush()
+        except Exception:
+            store.fail(record.job_id, traceback.format_exc())
+            print(f"Job {record.job_id} failed: {traceback.format_exc().strip().splitlines()[-1]}")
+            continue
+
+        seconds = time.perf_counter() - job_start
+        store.complete(record.job_id, outputs, seconds)
+        for output_path in outputs:
+            report.results.append(batch.JobResult(index=record.position, output_path=output_path,
+                                                  seconds=seconds / len(outputs)))
+            print(f"[{len(report.results)}] {output_path} in {seconds / len(outputs):.2f}s")
+
+    report.total_seconds = time.perf_counter() - run_start
+    print(f"Rendered {len(report.results)} images in {report.total_seconds:.2f}s "
+          f"({report.images_per_second:.3f} img/s); job store: {store.counts()}")
+    return report
@@ -0,0 +1,465 @@
+"""LoRA adapter management for resident FLUX pipelines."""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import config, pipeline
+
+
+# Safetensors headers larger than this are treated as corrupt
+_MAX_HEADER_BYTES = 100 * 1024 * 1024
+
+# Key prefixes used by FLUX LoRA files: diffusers/PEFT, kohya and BFL formats
+_FLUX_KEY_PREFIXES = (
+    "transformer.",
+    "base_model.model.",
+    "lora_unet_",
+    "diffusion_model.",
+    "text_encoder.",
+    "lora_te1_",
+    "lora_te_",
+)
+
+# Prefixes of keys that patch the text encoder rather than the transformer
+_TEXT_ENCODER_KEY_PREFIXES = ("text_encoder.", "lora_te1_", "lora_te_")
+
+_DOWN_SUFFIXES = (".lora_A.weight", ".lora_down.weight")
+_UP_SUFFIXES = (".lora_B.weight", ".lora_up.weight")
+
+# Config keys used by common trainers for rank and alpha
+_RANK_KEYS = ("r", "rank", "lora_rank", "network_dim")
+_ALPHA_KEYS = ("lora_alpha", "alpha", "network_alpha")
+
+
+@dataclass
+class LoraFileInfo:
+    """Facts about a LoRA safetensors file read from its header alone."""
+    path: str
+    header_sha256: str
+    shapes: dict[str, list[int]]
+    metadata: dict[str, str]
+    ranks: set[int]
+    has_alpha_keys: bool
+
+    @property
+    def rank(self) -> int:
+        """Largest rank across all LoRA layers."""
+        return max(self.ranks)
+
+
+@dataclass
+class LoraConfig:
+    """Rank, alpha and target modules parsed from a LoRA config JSON."""
+    rank: int | None = None
+    alpha: float | None = None
+    target_modules: list[str] | None = None
+
+
+@dataclass
+class LoraAdapterFile:
+    """A validated LoRA file with its tensors and parsed config."""
+    info: LoraFileInfo
+    config: LoraConfig
+    state_dict: dict
+
+    @property
+    def alpha_scale(self) -> float:
+        """Multiplier implied by the config's alpha/rank.
+
+        Files that carry ``.alpha`` tensors already encode this, so the config
+        alpha is only applied when the weights do not.
+        """
+        if self.config.alpha is None or self.info.has_alpha_keys:
+            return 1.0
+        rank = self.config.rank or self.info.rank
+        return self.config.alpha / rank
+
+
+# Parsed LoRA files keyed by (resolved path, size, mtime, header hash), least recent first
+_ADAPTER_CACHE: OrderedDict[tuple, LoraAdapterFile] = OrderedDict()
+_MAX_CACHED_ADAPTERS = 8
+
+# Full-content digests keyed by (resolved path, size, mtime), least recent first
+_DIGEST_CACHE: OrderedDict[tuple, str] = OrderedDict()
+_MAX_CACHED_DIGESTS = 256
+
+
+def _remember(cache: OrderedDict, identity: tuple, value, max_entries: int):
+    """Store a value under a file identity, replacing older versions of the same file."""
+    for stale in [key for key in cache if key[0] == identity[0] and key != identity]:
+        del cache[stale]
+    cache[identity] = value
+    cache.move_to_end(identity)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+
+
+def read_safetensors_header(lora_path: str) -> tuple[dict, bytes]:
+    """Memory-map a safetensors file and return its parsed header.
+
+    Only the header is read; tensor data is not touched. Returns the header
+    dict and its raw bytes.
+    """
+    with open(lora_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 8:
+            raise ValueError(f"'{lora_path}' is too small to be a safetensors file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            (header_size,) = struct.unpack("<Q", mapped[:8])
+            if header_size > min(size - 8, _MAX_HEADER_BYTES):
+                raise ValueError(f"'{lora_path}' has an invalid safetensors header size ({header_size})")
+            raw = mapped[8:8 + header_size]
+
+    try:
+        header = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"'{lora_path}' has a corrupt safetensors header: {e}")
+
+    data_size = size - 8 - header_size
+    for name, entry in header.items():
+        if name == "__metadata__":
+            continue
+        begin, end = entry["data_offsets"]
+        if not 0 <= begin <= end <= data_size:
+            raise ValueError(f"'{lora_path}' tensor '{name}' points outside the file")
+    return header, raw
+
+
+def inspect_lora_file(lora_path: str) -> LoraFileInfo:
+    """Validate a LoRA file's keys and ranks from its header.
+
+    Raises ValueError when the file has no LoRA layers, uses key prefixes that
+    do not belong to a FLUX model, or has mismatched down/up projections.
+    """
+    header, raw = read_safetensors_header(lora_path)
+    metadata = header.pop("__metadata__", {}) or {}
+    shapes = {name: entry["shape"] for name, entry in header.items()}
+
+    foreign = sorted({name.split(".")[0] for name in shapes if not name.startswith(_FLUX_KEY_PREFIXES)})
+    if foreign:
+        raise ValueError(
+            f"'{lora_path}' contains keys that do not match a FLUX model: {', '.join(foreign[:5])}"
+        )
+
+    ranks = set()
+    for name, shape in shapes.items():
+        for down_suffix, up_suffix in zip(_DOWN_SUFFIXES, _UP_SUFFIXES):
+            if not name.endswith(down_suffix):
+                continue
+            rank = shape[0]
+            up_name = name[:-len(down_suffix)] + up_suffix
+            up_shape = shapes.get(up_name)
+            if up_shape is None:
+                raise ValueError(f"'{lora_path}' is missing '{up_name}'")
+            if up_shape[-1] != rank:
+                raise ValueError(
+                    f"'{lora_path}' layer '{name[:-len(down_suffix)]}' has rank {rank} "
+                    f"but its up projection expects {up_shape[-1]}"
+                )
+            ranks.add(rank)
+
+    if not ranks:
+        raise ValueError(f"'{lora_path}' does not contain any LoRA layers")
+
+    return LoraFileInfo(
+        path=lora_path,
+        header_sha256=hashlib.sha256(raw).hexdigest(),
+        shapes=shapes,
+        metadata=metadata,
+        ranks=ranks,
+        has_alpha_keys=any(name.endswith(".alpha") for name in shapes),
+    )
+
+
+def _find_config_value(data: dict, keys: tuple):
+    """Look up the first matching key at the top level or one level down."""
+    for key in keys:
+        if key in data:
+            return data[key]
+    for value in data.values():
+        if isinstance(value, dict):
+            for key in keys:
+                if key in value:
+                    return value[key]
+    return None
+
+
+def read_lora_config(lora_config_path: str | None) -> LoraConfig:
+    """Parse rank, alpha and target modules from a LoRA config JSON."""
+    if not lora_config_path:
+        return LoraConfig()
+
+    with open(lora_config_path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"LoRA config '{lora_config_path}' must be a JSON object")
+
+    rank = _find_config_value(data, _RANK_KEYS)
+    alpha = _find_config_value(data, _ALPHA_KEYS)
+    target_modules = _find_config_value(data, ("target_modules",))
+    if isinstance(target_modules, str):
+        target_modules = [target_modules]
+    return LoraConfig(
+        rank=int(rank) if rank is not None else None,
+        alpha=float(alpha) if alpha is not None else None,
+        target_modules=list(target_modules) if target_modules else None,
+    )
+
+
+def _check_config_matches(info: LoraFileInfo, lora_config: LoraConfig):
+    """Reject configs that disagree with the weights they describe."""
+    if lora_config.rank is not None and lora_config.rank not in info.ranks:
+        raise ValueError(
+            f"LoRA config rank {lora_config.rank} does not match the weights in "
+            f"'{info.path}' (rank {sorted(info.ranks)})"
+        )
+    if lora_config.target_modules:
+        targets = set(lora_config.target_modules)
+        layers = {
+            name.rsplit(".", 3)[-3]
+            for name in info.shapes
+            if name.endswith(_DOWN_SUFFIXES) and name.count(".") >= 3
+        }
+        untargeted = sorted(layers - targets)
+        if layers and untargeted:
+            print(f"Warning: LoRA '{info.path}' has layers outside config target_modules: {', '.join(untargeted)}")
+
+
+def validate_against_transformer(info: LoraFileInfo, transformer):
+    """Check diffusers-format LoRA shapes against the loaded FLUX transformer.
+
+    Only ``transformer.``-prefixed keys can be mapped to modules. The check is
+    skipped when the transformer exposes no modules.
+    """
+    named_modules = getattr(transformer, "named_modules", None)
+    modules = dict(named_modules()) if callable(named_modules) else {}
+    if not modules:
+        return
+
+    for name, shape in info.shapes.items():
+        if not name.startswith("transformer.") or not name.endswith(_DOWN_SUFFIXES):
+            continue
+        module_name = name[len("transformer."):].rsplit(".", 2)[0]
+        module = modules.get(module_name)
+        if module is None:
+            raise ValueError(f"LoRA layer '{module_name}' does not exist in the FLUX transformer")
+        in_features = getattr(module, "in_features", None)
+        out_features = getattr(module, "out_features", None)
+        if in_features is None or out_features is None:
+            continue
+        if shape[-1] != in_features:
+            raise ValueError(
+                f"LoRA layer '{module_name}' expects {shape[-1]} input features, "
+                f"the FLUX transformer has {in_features}"
+            )
+        if shape[0] > min(in_features, out_features):
+            raise ValueError(f"LoRA layer '{module_name}' rank {shape[0]} exceeds the layer size")
+
+
+def _load_tensors(lora_path: str) -> dict:
+    """Load tensors through safetensors' memory-mapped reader."""
+    from safetensors import safe_open
+
+    tensors = {}
+    with safe_open(lora_path, framework="pt", device="cpu") as f:
+        for name in f.keys():
+            tensors[name] = f.get_tensor(name)
+    return tensors
+
+
+def load_lora_file(lora_path: str, lora_config_path: str | None = None) -> LoraAdapterFile:
+    """Validate and load a LoRA file, reusing earlier loads of the same file.
+
+    The header is checked before any tensor data is read. Loaded adapters are
+    cached by path, size, mtime and header hash, so repeat loads return the
+    same tensors without touching the file again. Only the most recently
+    used adapters stay cached.
+    """
+    resolved = str(Path(lora_path).resolve())
+    stat = os.stat(resolved)
+    info = inspect_lora_file(resolved)
+    lora_config = read_lora_config(lora_config_path)
+    _check_config_matches(info, lora_config)
+
+    identity = (resolved, stat.st_size, stat.st_mtime_ns, info.header_sha256)
+    adapter = _ADAPTER_CACHE.get(identity)
+    if adapter is None:
+        adapter = LoraAdapterFile(info=info, config=lora_config, state_dict=_load_tensors(resolved))
+        _remember(_ADAPTER_CACHE, identity, adapter, _MAX_CACHED_ADAPTERS)
+    else:
+        _ADAPTER_CACHE.move_to_end(identity)
+    if adapter.config != lora_config:
+        adapter = LoraAdapterFile(info=info, config=lora_config, state_dict=adapter.state_dict)
+    return adapter
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's full contents, memoized until the file changes.
+
+    Unlike ``LoraFileInfo.header_sha256`` this covers the tensor data, so
+    two adapters with identical shapes but different weights differ.
+    """
+    resolved = str(Path(path).resolve())
+    stat = os.stat(resolved)
+    identity = (resolved, stat.st_size, stat.st_mtime_ns)
+    digest = _DIGEST_CACHE.get(identity)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(resolved, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _remember(_DIGEST_CACHE, identity, digest, _MAX_CACHED_DIGESTS)
+    return digest
+
+
+def patches_text_encoder(lora_path: str) -> bool:
+    """Whether a LoRA file has layers for the CLIP text encoder.
+
+    Adapters that only touch the transformer leave prompt embeddings
+    unchanged, so those can be shared across LoRA scales.
+    """
+    info = inspect_lora_file(lora_path)
+    return any(name.startswith(_TEXT_ENCODER_KEY_PREFIXES) for name in info.shapes)
+
+
+def clear_lora_cache():
+    """Drop all cached LoRA adapters."""
+    _ADAPTER_CACHE.clear()
+    _DIGEST_CACHE.clear()
+
+
+def adapter_name_for(lora_path: str) -> str:
+    """Derive a stable adapter name from a LoRA file path."""
+    resolved = str(Path(lora_path).resolve())
+    stem = re.sub(r"[^0-9A-Za-z_]", "_", Path(lora_path).stem)
+    digest = hashlib.sha1(resolved.encode("utf-8")).hexdigest()[:8]
+    return f"{stem}_{digest}"
+
+
+class LoraManager:
+    """Loads named adapters on a resident pipeline and switches them per request.
+
+    Adapters stay loaded once added, so switching between them only changes
+    which ones are active and with what weight. In fused mode (the default)
+    active adapters are merged into the base weights, which keeps inference
+    as fast as the single-shot path; switching costs an unfuse and a fuse.
+    In unfused mode adapters run as separate PEFT layers, which makes
+    switching nearly free at a small per-step cost; use it when scales change
+    on most requests.
+    """
+
+    def __init__(self, pipe, fuse: bool = True):
+        # Weak, so the pipeline (the key of _MANAGERS) can be freed with its manager
+        self._pipe = weakref.ref(pipe)
+        self.fuse = fuse
+        self.loaded: dict[str, str] = {}
+        self.alpha_scales: dict[str, float] = {}
+        self.active: dict[str, float] = {}
+        self.fused = False
+        self.switches = 0
+
+    @property
+    def pipe(self):
+        pipe = self._pipe()
+        if pipe is None:
+            raise RuntimeError("The pipeline of this LoraManager has been released")
+        return pipe
+
+    def load_adapter(self, lora_path: str, name: str | None = None, lora_config_path: str | None = None) -> str:
+        """Load a LoRA file as a named adapter if it is not loaded yet."""
+        if not pipeline.PEFT_AVAILABLE:
+            raise RuntimeError(
+                "PEFT library is required for LoRA support. Please install it with:\n"
+                "pip install peft>=0.7.0"
+            )
+
+        name = name or adapter_name_for(lora_path)
+        if name in self.loaded:
+            return name
+
+        adapter = load_lora_file(lora_path, lora_config_path)
+        validate_against_transformer(adapter.info, getattr(self.pipe, "transformer", None))
+
+        # Adapters can only be added to unfused weights
+        self._unfuse()
+        self.pipe.load_lora_weights(adapter.state_dict, adapter_name=name)
+        self.loaded[name] = lora_path
+        self.alpha_scales[name] = adapter.alpha_scale
+        # Newly loaded adapters become active; restore the previous selection.
+        # Fusing is left to the next set_active call.
+        self._apply(self.active, fuse=False)
+        return name
+
+    def unload_adapter(self, name: str):
+        """Remove an adapter from the pipeline."""
+        if name not in self.loaded:
+            return
+        self._unfuse()
+        self.pipe.delete_adapters(name)
+        del self.loaded[name]
+        del self.alpha_scales[name]
+        self.active.pop(name, None)
+        self._apply(self.active, fuse=self.fuse)
+
+    def set_active(self, adapters: dict[str, float]):
+        """Activate exactly the given adapters with per-adapter weights."""
+        wants_fused = self.fuse and bool(adapters)
+        if adapters == self.active and self.fused == wants_fused:
+            return
+
+        start = time.perf_counter()
+        self._unfuse()
+        self._apply(adapters, fuse=self.fuse)
+        self.active = dict(adapters)
+        self.switches += 1
+        print(f"LoRA adapters set to {self.active or 'none'} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def activate_for(self, gen_config: config.GenerationConfig):
+        """Activate the adapter requested by a config, or none."""
+        if gen_config.lora_path:
+            name = self.load_adapter(gen_config.lora_path, lora_config_path=gen_config.lora_config_path)
+            self.set_active({name: gen_config.lora_scale})
+        else:
+            self.set_active({})
+
+    def _unfuse(self):
+        if self.fused:
+            self.pipe.unfuse_lora()
+            self.fused = False
+
+    def _apply(self, adapters: dict[str, float], fuse: bool):
+        if not self.loaded:
+            return
+        if not adapters:
+            self.pipe.disable_lora()
+            return
+
+        names = list(adapters)
+        self.pipe.enable_lora()
+        weights = [adapters[name] * self.alpha_scales.get(name, 1.0) for name in names]
+        self.pipe.set_adapters(names, adapter_weights=weights)
+        if fuse:
+            self.pipe.fuse_lora(adapter_names=names, lora_scale=1.0)
+            self.fused = True
+
+
+_MANAGERS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_lora_manager(pipe, fuse: bool = True) -> LoraManager:
+    """Return the LoraManager attached to a pipeline, creating it on first use."""
+    manager = _MANAGERS.get(pipe)
+    if manager is None:
+        manager = LoraManager(pipe, fuse=fuse)
+        _MANAGERS[pipe] = manager
+    return manager
@@ -0,0 +1,261 @@
+"""Device memory estimates, admission control and out-of-memory fallbacks."""
+
+import dataclasses
+import gc
+import sys
+from dataclasses import dataclass, field
+
+from . import config, pipeline
+
+
+# Activation element sizes; quantized weights still compute in the dtype
+_ACTIVATION_BYTES = {"fp32": 4, "bf16": 2, "fp16": 2, None: 4}
+
+# FLUX transformer: 16x16 pixel patches, 3072 hidden size, and a rough count
+# of hidden-sized activations kept alive per token at the peak of a block.
+# The T5 encoder is 4096 wide and is estimated the same way.
+_PATCH_PIXELS = 16
+_HIDDEN_SIZE = 3072
+_T5_HIDDEN_SIZE = 4096
+_ACTIVATIONS_PER_TOKEN = 48
+
+# VAE decoder activations per output pixel at its widest (full resolution) stage
+_VAE_ACTIVATIONS_PER_PIXEL = 768
+
+# Sequential offload keeps roughly one transformer block on the device
+_SEQUENTIAL_RESIDENT_FRACTION = 1 / 50
+
+# Share of free device memory that admitted work may plan to use
+_BUDGET_FRACTION = 0.9
+
+# Smallest edge downscaling may produce, and the size step it keeps; the
+# scale drops in eighths down to a quarter
+_MIN_DOWNSCALE_EDGE = 256
+_DOWNSCALE_STEP = 64
+
+# Offload mode tried next after running out of memory
+_STRONGER_OFFLOAD = {"none": "model", "model": "sequential"}
+
+
+@dataclass
+class MemoryEstimate:
+    """Predicted device memory of each pipeline phase, in bytes."""
+    encode_bytes: int
+    denoise_bytes: int
+    decode_bytes: int
+
+    @property
+    def peak_bytes(self) -> int:
+        return max(self.encode_bytes, self.denoise_bytes, self.decode_bytes)
+
+
+def estimate_peak_bytes(gen_config: config.GenerationConfig, batch_size: int = 1,
+                        offload: str = "none") -> MemoryEstimate:
+    """Predict peak device memory for one pipeline call.
+
+    Each phase (text encoding, denoising, VAE decode) holds the weights the
+    offload mode keeps on the device plus its activations. Activations grow
+    with resolution and batch size; sliced decoding caps the decoder's at
+    one image and tiled decoding at one tile. ``offload`` must be a concrete mode, not ``auto``. These are rough
+    estimates meant for admission decisions, not exact accounting.
+    """
+    weights = pipeline.estimate_component_bytes(gen_config.dtype, gen_config.quantize)
+    if offload == "none":
+        resident = {phase: sum(weights.values()) for phase in ("encode", "denoise", "decode")}
+    elif offload == "model":
+        resident = {
+            "encode": weights["text_encoder_2"] + weights["text_encoder"],
+            "denoise": weights["transformer"],
+            "decode": weights["vae"],
+        }
+    else:
+        layer = int(max(weights.values()) * _SEQUENTIAL_RESIDENT_FRACTION)
+        resident = {phase: layer for phase in ("encode", "denoise", "decode")}
+
+    element = _ACTIVATION_BYTES.get(gen_config.dtype, 4)
+    tokens = (gen_config.height // _PATCH_PIXELS) * (gen_config.width // _PATCH_PIXELS) \
+        + gen_config.max_sequence_length
+    denoise = tokens * batch_size * _HIDDEN_SIZE * element * _ACTIVATIONS_PER_TOKEN
+
+    # Sliced and tiled decoding work on one image at a time
+    vae_decode = pipeline.resolve_vae_decode(gen_config, batch_size)
+    pixels = gen_config.height * gen_config.width
+    if vae_decode == "tiled":
+        pixels = min(pixels, gen_config.vae_tile_size ** 2)
+    decode_batch = batch_size if vae_decode == "full" else 1
+    decode = pixels * decode_batch * element * _VAE_ACTIVATIONS_PER_PIXEL
+
+    encode = gen_config.max_sequence_length * batch_size * _T5_HIDDEN_SIZE * element * _ACTIVATIONS_PER_TOKEN
+    return MemoryEstimate(
+        encode_bytes=resident["encode"] + encode,
+        denoise_bytes=resident["denoise"] + denoise,
+        decode_bytes=resident["decode"] + decode,
+    )
+
+
+def device_budget_bytes(runtime_config: config.RuntimeConfig) -> int | None:
+    """Device memory admitted work may use, or None when unknown (no CUDA)."""
+    if not runtime_config.has_cuda or runtime_config.free_device_memory is None:
+        return None
+    return int(runtime_config.free_device_memory * _BUDGET_FRACTION)
+
+
+def _offload_for(gen_config: config.GenerationConfig, runtime_config: config.RuntimeConfig) -> str:
+    return pipeline.resolve_offload(gen_config.offload, runtime_config, gen_config.dtype, gen_config.quantize)
+
+
+def max_batch_size(gen_config: config.GenerationConfig, runtime_config: config.RuntimeConfig,
+                   limit: int, offload: str | None = None) -> int:
+    """Largest batch up to ``limit`` predicted to fit, and at least 1."""
+    budget = device_budget_bytes(runtime_config)
+    if budget is None:
+        return limit
+    offload = offload or _offload_for(gen_config, runtime_config)
+    for batch_size in range(limit, 1, -1):
+        if estimate_peak_bytes(gen_config, batch_size, offload).peak_bytes <= budget:
+            return batch_size
+    return 1
+
+
+@dataclass
+class AdmissionPlan:
+    """How a group of same-shape configs will be rendered."""
+    gen_configs: list[config.GenerationConfig]
+    batch_size: int
+    estimate: MemoryEstimate | None = None
+    actions: list[str] = field(default_factory=list)
+
+    @property
+    def chunks(self) -> list[list[config.GenerationConfig]]:
+        """The configs split into pipeline calls of at most ``batch_size``."""
+        return [self.gen_configs[i:i + self.batch_size] for i in range(0, len(self.gen_configs), self.batch_size)]
+
+
+def _downscaled(gen_config: config.GenerationConfig, scale: float) -> config.GenerationConfig:
+    height = max(_MIN_DOWNSCALE_EDGE, int(gen_config.height * scale) // _DOWNSCALE_STEP * _DOWNSCALE_STEP)
+    width = max(_MIN_DOWNSCALE_EDGE, int(gen_config.width * scale) // _DOWNSCALE_STEP * _DOWNSCALE_STEP)
+    return dataclasses.replace(gen_config, height=height, width=width)
+
+
+def plan_admission(gen_configs: list[config.GenerationConfig], runtime_config: config.RuntimeConfig,
+                   offload: str | None = None) -> AdmissionPlan:
+    """Decide ahead of rendering how to keep same-shape configs within device memory.
+
+    Work that fits is admitted as is. Otherwise the batch is split into the
+    largest calls that fit, then VAE decoding is tiled, and finally, only
+    for configs with ``allow_downscale``, the resolution is reduced in 64px
+    steps. Work that still does not fit is admitted anyway, leaving the
+    out-of-memory fallbacks of ``render_admitted`` as the last line.
+    """
+    budget = device_budget_bytes(runtime_config)
+    if budget is None:
+        return AdmissionPlan(gen_configs=list(gen_configs), batch_size=len(gen_configs))
+
+    first = gen_configs[0]
+    offload = offload or _offload_for(first, runtime_config)
+    plan = AdmissionPlan(
+        gen_configs=list(gen_configs),
+        batch_size=max_batch_size(first, runtime_config, len(gen_configs), offload),
+    )
+    if plan.batch_size < len(gen_configs):
+        plan.actions.append(f"split batch of {len(gen_configs)} into calls of {plan.batch_size}")
+
+    def fits(candidate):
+        plan.estimate = estimate_peak_bytes(candidate, plan.batch_size, offload)
+        return plan.estimate.peak_bytes <= budget
+
+    if fits(first):
+        return plan
+
+    if pipeline.resolve_vae_decode(first, plan.batch_size) != "tiled":
+        tiled = dataclasses.replace(first, vae_decode="tiled")
+        plan.gen_configs = [dataclasses.replace(c, vae_decode="tiled") for c in plan.gen_configs]
+        plan.actions.append("tile VAE decoding")
+        if fits(tiled):
+            return plan
+        first = tiled
+
+    if first.allow_downscale:
+        for step in range(1, 7):
+            scale = 1 - step * 0.125
+            candidate = _downscaled(first, scale)
+            if fits(candidate):
+                break
+        plan.gen_configs = [_downscaled(c, scale) for c in plan.gen_configs]
+        plan.actions.append(f"downscale {first.height}x{first.width} to {candidate.height}x{candidate.width}")
+        if plan.estimate.peak_bytes <= budget:
+            return plan
+
+    plan.actions.append(
+        f"admit over budget (estimated {plan.estimate.peak_bytes / 1024 ** 3:.1f} GiB, "
+        f"budget {budget / 1024 ** 3:.1f} GiB)"
+    )
+    return plan
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """Whether an exception is a device out-of-memory error."""
+    return type(error).__name__ == "OutOfMemoryError" or "out of memory" in str(error).lower()
+
+
+def release_device_memory():
+    """Return cached allocator blocks to the device after a failed call."""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _render_with_fallback(pipe, gen_configs: list[config.GenerationConfig], render,
+                          runtime_config: config.RuntimeConfig) -> list:
+    """Call ``render`` and retry after out-of-memory errors with cheaper settings.
+
+    Fallbacks in order: halve the batch, move to the next stronger offload
+    mode, tile VAE decoding. The error is re-raised once none is left.
+    """
+    while True:
+        try:
+            vae_decode = pipeline.apply_vae_decode(pipe, gen_configs[0], len(gen_configs))
+            return render(pipe, gen_configs)
+        except Exception as e:
+            if not is_out_of_memory(e):
+                raise
+            release_device_memory()
+
+            if len(gen_configs) > 1:
+                half = len(gen_configs) // 2
+                print(f"Memory fallback: out of memory with a batch of {len(gen_configs)}, "
+                      f"retrying as {half} + {len(gen_configs) - half}")
+                return (_render_with_fallback(pipe, gen_configs[:half], render, runtime_config)
+                        + _render_with_fallback(pipe, gen_configs[half:], render, runtime_config))
+
+            stronger = _STRONGER_OFFLOAD.get(pipeline.offload_mode_of(pipe))
+            if stronger is not None and runtime_config.has_cuda:
+                print(f"Memory fallback: out of memory, switching offload to '{stronger}'")
+                pipeline.apply_offload(pipe, stronger, runtime_config)
+                continue
+
+            if vae_decode != "tiled":
+                print("Memory fallback: out of memory, switching to tiled VAE decoding")
+                gen_configs = [dataclasses.replace(c, vae_decode="tiled") for c in gen_configs]
+                continue
+            raise
+
+
+def render_admitted(pipe, gen_configs: list[config.GenerationConfig], render,
+                    runtime_config: config.RuntimeConfig) -> tuple[list[config.GenerationConfig], list]:
+    """Render same-shape configs within device memory.
+
+    ``render(pipe, configs)`` must return one image per config, e.g.
+    ``generate.render_batch``. The configs are first planned with
+    ``plan_admission`` and each resulting call is protected by out-of-memory
+    fallbacks. Returns the configs as rendered (changed when downscaled)
+    and their images.
+    """
+    plan = plan_admission(gen_configs, runtime_config, pipeline.offload_mode_of(pipe))
+    for action in plan.actions:
+        print(f"Memory admission: {action}")
+    images = []
+    for chunk in plan.chunks:
+        images.extend(_render_with_fallback(pipe, chunk, render, runtime_config))
+    return plan.gen_configs, images
@@ -0,0 +1,91 @@
+"""Lightweight timing and memory measurements for generation runs."""
+
+import resource
+import sys
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes() -> int:
+    """Current resident set size of this process, or the peak if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def proportional_rss_bytes() -> int:
+    """Proportional set size: resident memory with shared pages split between their users.
+
+    Unlike RSS, summing it over processes that map the same weights counts
+    those weights once. Falls back to the current RSS where unavailable.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return current_rss_bytes()
+
+
+def _cuda():
+    """Return torch.cuda if torch is already imported and CUDA is usable."""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda
+
+
+# Peak carried over from CUDA counter resets made by take_device_peak_memory
+_carried_peak_bytes = 0
+
+
+def device_peak_memory_bytes() -> int | None:
+    """Peak CUDA memory allocated since the last reset, or None without CUDA."""
+    cuda = _cuda()
+    return max(cuda.max_memory_allocated(), _carried_peak_bytes) if cuda else None
+
+
+def reset_device_peak_memory():
+    """Reset the CUDA peak memory counter if CUDA is in use."""
+    global _carried_peak_bytes
+    _carried_peak_bytes = 0
+    cuda = _cuda()
+    if cuda:
+        cuda.reset_peak_memory_stats()
+
+
+def take_device_peak_memory() -> int | None:
+    """Peak CUDA memory since the previous call, or None without CUDA.
+
+    Starts a new measurement window for the next call while
+    ``device_peak_memory_bytes`` keeps reporting the peak since the last
+    ``reset_device_peak_memory``.
+    """
+    global _carried_peak_bytes
+    cuda = _cuda()
+    if not cuda:
+        return None
+    peak = cuda.max_memory_allocated()
+    _carried_peak_bytes = max(_carried_peak_bytes, peak)
+    cuda.reset_peak_memory_stats()
+    return peak
+
+
+def format_bytes(num_bytes: int | None) -> str:
+    """Human readable size, e.g. '11.9 GiB'."""
+    if num_bytes is None:
+        return "n/a"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num_bytes) < 1024 or unit == "GiB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
@@ -1,25 +1,232 @@
 """FLUX pipeline loading and management."""
 
-# Import PEFT for LoRA support
-try:
-    import peft
-    PEFT_AVAILABLE = True
-except ImportError:
-    PEFT_AVAILABLE = False
+import importlib.util
+import time
+import weakref
 
+from . import metrics, trace
 
-def load_flux_pipeline(gen_config, runtime_config):
-    """Load and return FLUX pipeline with error handling."""
-    from diffusers import FluxPipeline
+# PEFT provides LoRA support. Only check that it is installed: diffusers
+# imports it when adapters are loaded
+PEFT_AVAILABLE = importlib.util.find_spec("peft") is not None
+
+
+OFFLOAD_MODES = ("none", "model", "sequential", "auto")
+
+# VAE decode strategies: the whole batch at once, one image at a time
+# (sliced), overlapping tiles of one image at a time (tiled), or picked from
+# resolution and batch size (auto)
+VAE_DECODE_MODES = ("full", "sliced", "tiled", "auto")
+
+# auto tiles images larger than this, i.e. anything above 1024x1024
+VAE_AUTO_TILE_PIXELS = 1024 * 1024
+
+# CLI dtype names mapped to torch dtype attribute names
+DTYPES = {"fp32": "float32", "bf16": "bfloat16", "fp16": "float16"}
+_DTYPE_BYTES = {"fp32": 4, "bf16": 2, "fp16": 2}
+
+# Approximate parameter counts of the FLUX.1 pipeline components
+FLUX_COMPONENT_PARAMS = {
+    "transformer": 11_900_000_000,
+    "text_encoder_2": 4_760_000_000,
+    "text_encoder": 123_000_000,
+    "vae": 84_000_000,
+}
+
+# Extra room over the weights needed for activations during inference
+_ACTIVATION_HEADROOM = 1.2
+
+
+def estimate_component_bytes(dtype: str | None = None, quantize: str | None = None) -> dict[str, int]:
+    """Estimate the weight footprint of each FLUX component.
+
+    Without an explicit dtype the pipeline loads in fp32. int8 quantization
+    stores one byte per weight for the quantized components.
+    """
+    from . import quantize as quantize_module
+
+    bytes_per_param = _DTYPE_BYTES.get(dtype, 4)
+    estimate = {}
+    for name, params in FLUX_COMPONENT_PARAMS.items():
+        if quantize and name in quantize_module.QUANTIZED_COMPONENTS:
+            estimate[name] = params
+        else:
+            estimate[name] = params * bytes_per_param
+    return estimate
+
+
+def resolve_torch_dtype(dtype: str | None):
+    """Map a CLI dtype name to a torch dtype, or None for the pipeline default."""
+    if dtype is None:
+        return None
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype '{dtype}', expected one of {', '.join(DTYPES)}")
+    import torch
+    return getattr(torch, DTYPES[dtype])
+
+
+def resolve_offload(requested: str, runtime_config, dtype: str | None = None, quantize: str | None = None) -> str:
+    """Turn the requested offload mode into a concrete one.
+
+    ``auto`` keeps the whole pipeline on the GPU when free device memory
+    covers all weights plus activation headroom, offloads whole models when
+    only the largest component fits, and falls back to sequential (per-layer)
+    offload otherwise. Without CUDA there is nothing to offload to.
+    """
+    if requested not in OFFLOAD_MODES:
+        raise ValueError(f"Unknown offload mode '{requested}', expected one of {', '.join(OFFLOAD_MODES)}")
+    if requested != "auto":
+        return requested
+    if not runtime_config.has_cuda:
+        return "none"
+
+    free = runtime_config.free_device_memory
+    if free is None:
+        return "model"
+
+    components = estimate_component_bytes(dtype, quantize)
+    if free >= sum(components.values()) * _ACTIVATION_HEADROOM:
+        return "none"
+    if free >= max(components.values()) * _ACTIVATION_HEADROOM:
+        return "model"
+    return "sequential"
+
+
+# Concrete offload mode each loaded pipeline currently runs with
+_OFFLOAD_MODES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def apply_offload(pipe, mode: str, runtime_config):
+    """Place the pipeline according to a concrete offload mode."""
+    _OFFLOAD_MODES[pipe] = mode
+    if mode == "model":
+        # Whole components move to the GPU only while they run
+        pipe.enable_model_cpu_offload()
+    elif mode == "sequential":
+        # Individual layers move to the GPU as they run: lowest memory, slowest
+        pipe.enable_sequential_cpu_offload()
+    elif runtime_config.has_cuda:
+        pipe.to("cuda")
+
+
+def offload_mode_of(pipe) -> str | None:
+    """The concrete offload mode last applied to a pipeline, or None if unknown."""
+    return _OFFLOAD_MODES.get(pipe)
+
+
+def resolve_vae_decode(gen_config, batch_size: int = 1) -> str:
+    """Turn the configured VAE decode mode into a concrete one.
+
+    ``auto`` tiles images above 1024x1024, slices batches of smaller images
+    and decodes single small images in one go.
+    """
+    mode = gen_config.vae_decode
+    if mode not in VAE_DECODE_MODES:
+        raise ValueError(f"Unknown VAE decode mode '{mode}', expected one of {', '.join(VAE_DECODE_MODES)}")
+    if gen_config.vae_tile_size < 64 or gen_config.vae_tile_size % 8:
+        raise ValueError(f"vae_tile_size must be a multiple of 8 and at least 64, got {gen_config.vae_tile_size}")
+    if not 0 <= gen_config.vae_tile_overlap < 0.5:
+        raise ValueError(f"vae_tile_overlap must be in [0, 0.5), got {gen_config.vae_tile_overlap}")
+    if mode != "auto":
+        return mode
+    if gen_config.height * gen_config.width > VAE_AUTO_TILE_PIXELS:
+        return "tiled"
+    return "sliced" if batch_size > 1 else "full"
+
+
+def apply_vae_decode(pipe, gen_config, batch_size: int = 1) -> str:
+    """Configure the pipeline's VAE for the config's decode mode and return the concrete mode.
+
+    Tiled decoding also slices, so tiles of one image are decoded at a time.
+    A pipeline without a VAE only supports the plain ``full`` mode.
+    """
+    mode = resolve_vae_decode(gen_config, batch_size)
+    vae = getattr(pipe, "vae", None)
+    if vae is None:
+        if mode != "full":
+            raise ValueError(f"VAE decode mode '{mode}' needs a pipeline with a VAE, but {type(pipe).__name__} has none")
+        return mode
+    if mode in ("sliced", "tiled"):
+        vae.enable_slicing()
+    elif getattr(vae, "use_slicing", False):
+        vae.disable_slicing()
+
+    if mode == "tiled":
+        vae.enable_tiling()
+        # FLUX defaults to 1024px tiles, which saves nothing at common sizes
+        vae.tile_sample_min_size = gen_config.vae_tile_size
+        vae.tile_latent_min_size = gen_config.vae_tile_size // 8
+        vae.tile_overlap_factor = gen_config.vae_tile_overlap
+    elif getattr(vae, "use_tiling", False):
+        vae.disable_tiling()
+    return mode
+
+
+def pipeline_cache_key(gen_config, include_lora: bool = True) -> tuple:
+    """Return the settings that identify a loaded pipeline.
+
+    Jobs with equal keys can share one pipeline instance. LoRA settings are included unless the caller swaps
+    adapters itself (see ``lora.LoraManager``).
+    """
+    key = (gen_config.model_id, gen_config.model_revision, gen_config.dtype, gen_config.quantize,
+           gen_config.offload, gen_config.compile)
+    if include_lora:
+        key += (gen_config.lora_path, gen_config.lora_config_path, gen_config.lora_scale)
+    return key
+
+
+def load_flux_pipeline(gen_config, runtime_config, apply_lora: bool = True):
+    """Load and return FLUX pipeline with error handling.
+
+    With ``apply_lora=False`` the base model is returned without the
+    configured LoRA, for callers that manage adapters per request.
+    """
+    from . import stub
+
+    offload = resolve_offload(gen_config.offload, runtime_config, gen_config.dtype, gen_config.quantize)
+    load_start = time.perf_counter()
+
+    load_kwargs = {}
+    source = gen_config.model_id
+    torch_dtype = resolve_torch_dtype(gen_config.dtype)
+    if torch_dtype is not None:
+        load_kwargs["torch_dtype"] = torch_dtype
+    if gen_config.snapshot_dir and not stub.is_stub_model(gen_config.model_id):
+        from . import snapshot
+        # The snapshot pins the revision; nothing is resolved against the hub
+        with trace.span("open_snapshot"):
+            source = str(snapshot.open_snapshot(gen_config))
+        load_kwargs["local_files_only"] = True
+    elif gen_config.model_revision:
+        load_kwargs["revision"] = gen_config.model_revision
+    if gen_config.quantize and gen_config.shared_weights_dir:
+        raise ValueError("Shared weights cannot be combined with --quantize")
+    if gen_config.quantize:
+        from . import quantize
+        # Pre-quantized components replace their full-precision counterparts
+        load_kwargs.update(quantize.load_cached_components(gen_config))
+    elif gen_config.shared_weights_dir and not stub.is_stub_model(gen_config.model_id):
+        from . import shared_weights
+        # Memory-mapped components whose pages are shared with other processes
+        with trace.span("map_shared_weights"):
+            load_kwargs.update(shared_weights.load_shared_components(gen_config, runtime_config.hf_token))
+
+    if stub.is_stub_model(gen_config.model_id):
+        # Deterministic CPU stand-in for benchmarks and tests
+        FluxPipeline = stub.StubFluxPipeline
+    else:
+        from diffusers import FluxPipeline
 
     try:
         # For FLUX models, use CPU offload without device_map for better memory management
-        # Let the pipeline use default dtype to avoid deprecation warnings
-        pipe = FluxPipeline.from_pretrained(
-            gen_config.model_id,
-            low_cpu_mem_usage=True,
-            token=runtime_config.hf_token,
-        )
+        # Without --dtype the pipeline uses its default dtype to avoid deprecation warnings
+        with trace.span("from_pretrained"):
+            pipe = FluxPipeline.from_pretrained(
+                source,
+                low_cpu_mem_usage=True,
+                token=runtime_config.hf_token,
+                **load_kwargs,
+            )
     except Exception as e:
         if "401" in str(e) or "authorization" in str(e).lower():
             raise RuntimeError(
@@ -31,13 +238,28 @@ def load_flux_pipeline(gen_config, runtime_config):
         else:
             raise
 
-    # Enable CPU offload for memory efficiency - this is crucial for large models like FLUX
-    pipe.enable_model_cpu_offload()
+    if gen_config.quantize:
+        with trace.span("quantize"):
+            quantize.quantize_pipeline(pipe, gen_config, already_quantized=set(load_kwargs))
+
+    # CPU offload trades speed for memory; skip it when the model fits on the device
+    with trace.span("offload", mode=offload):
+        apply_offload(pipe, offload, runtime_config)
+    if gen_config.compile:
+        from . import compilation
+        with trace.span("compile"):
+            compilation.compile_pipeline(pipe, gen_config)
+    print(
+        f"Pipeline loaded in {time.perf_counter() - load_start:.1f}s "
+        f"(dtype: {gen_config.dtype or 'default'}, quantize: {gen_config.quantize or 'none'}, "
+        f"offload: {offload}, peak RSS: {metrics.format_bytes(metrics.peak_rss_bytes())})"
+    )
 
     # Load and apply LoRA if specified
-    if gen_config.lora_path:
+    if apply_lora and gen_config.lora_path:
         try:
-            apply_lora_to_pipeline(pipe, gen_config)
+            with trace.span("lora_fuse", lora_path=gen_config.lora_path):
+                apply_lora_to_pipeline(pipe, gen_config)
         except RuntimeError as e:
             if "PEFT library is required" in str(e):
                 print(f"Warning: {e}")
@@ -56,23 +278,24 @@ def apply_lora_to_pipeline(pipe, gen_config):
             "pip install peft>=0.7.0"
         )
 
+    from . import lora
+
     try:
-        # Load LoRA weights
-        if gen_config.lora_config_path:
-            # If config file is provided, use it for more control
-            pipe.load_lora_weights(
-                gen_config.lora_path,
-                weight_name=None,  # Will be inferred from safetensors file
-                adapter_name="custom_lora"
-            )
-        else:
-            # Load from safetensors directly
-            pipe.load_lora_weights(gen_config.lora_path, adapter_name="custom_lora")
+        # Validate the file from its header and parse the config before
+        # loading tensors through the memory-mapped, cached loader
+        adapter = lora.load_lora_file(gen_config.lora_path, gen_config.lora_config_path)
+        lora.validate_against_transformer(adapter.info, getattr(pipe, "transformer", None))
+
+        pipe.load_lora_weights(adapter.state_dict, adapter_name="custom_lora")
 
         # Fuse LoRA weights into the model for better performance
-        pipe.fuse_lora(adapter_names=["custom_lora"], lora_scale=gen_config.lora_scale)
+        lora_scale = gen_config.lora_scale * adapter.alpha_scale
+        pipe.fuse_lora(adapter_names=["custom_lora"], lora_scale=lora_scale)
 
-        print(f"LoRA applied successfully: {gen_config.lora_path} (scale: {gen_config.lora_scale})")
+        print(
+            f"LoRA applied successfully: {gen_config.lora_path} "
+            f"(rank: {adapter.info.rank}, scale: {lora_scale})"
+        )
 
     except Exception as e:
         error_msg = f"Failed to apply LoRA from '{gen_config.lora_path}': {e}\n"
@@ -0,0 +1,301 @@
+"""Process pool with one resident pipeline worker per device or CPU slice."""
+
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from . import batch, config, device, embeddings, env, generate, io, pipeline, shared_weights, stub, worker
+
+
+@dataclass(frozen=True)
+class DeviceSlot:
+    """Where one pool worker runs: a CUDA device or a set of pinned CPUs."""
+    name: str
+    cuda_device: int | None = None
+    cpus: tuple[int, ...] = ()
+
+
+def _split_cpus(cpus: tuple[int, ...], count: int) -> list[tuple[int, ...]]:
+    """Split CPUs into ``count`` contiguous slices; CPUs are shared when too few."""
+    if count <= len(cpus):
+        size, extra = divmod(len(cpus), count)
+        slices, start = [], 0
+        for index in range(count):
+            end = start + size + (1 if index < extra else 0)
+            slices.append(cpus[start:end])
+            start = end
+        return slices
+    return [(cpus[index % len(cpus)],) for index in range(count)]
+
+
+def detect_slots(spec: str = "auto") -> list[DeviceSlot]:
+    """Turn a device spec into worker slots.
+
+    ``auto`` uses every CUDA device, or one CPU slice per NUMA node without
+    CUDA. ``cuda:0,cuda:2`` lists devices explicitly, ``cpu`` means one
+    slice per NUMA node and ``cpu:N`` splits the usable CPUs into N slices.
+    """
+    spec = spec.strip()
+    if spec == "auto":
+        count = device.cuda_device_count()
+        if count:
+            return [DeviceSlot(name=f"cuda:{index}", cuda_device=index) for index in range(count)]
+        spec = "cpu"
+
+    if spec == "cpu" or spec.startswith("cpu:"):
+        if spec == "cpu":
+            slices = device.numa_cpu_slices()
+        else:
+            try:
+                count = int(spec[len("cpu:"):])
+            except ValueError:
+                raise ValueError(f"Invalid device spec '{spec}', expected cpu:N")
+            if count < 1:
+                raise ValueError("cpu:N needs at least one slice")
+            usable = tuple(cpu for cpu_slice in device.numa_cpu_slices() for cpu in cpu_slice)
+            slices = _split_cpus(usable, count)
+        return [DeviceSlot(name=f"cpu:{index}", cpus=cpus) for index, cpus in enumerate(slices)]
+
+    slots = []
+    for part in spec.split(","):
+        name = part.strip()
+        if not name.startswith("cuda:") or not name[len("cuda:"):].isdigit():
+            raise ValueError(f"Invalid device '{name}', expected cuda:N, cpu, cpu:N or auto")
+        slots.append(DeviceSlot(name=name, cuda_device=int(name[len("cuda:"):])))
+    return slots
+
+
+def _bind_to_slot(slot: DeviceSlot):
+    """Restrict this process to its slot before torch is imported."""
+    if slot.cuda_device is not None:
+        # The worker's device then appears as cuda:0
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(slot.cuda_device)
+    else:
+        # CPU slots render on the CPU even on GPU hosts
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    if slot.cpus:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, slot.cpus)
+        for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[variable] = str(len(slot.cpus))
+
+
+def _worker_main(slot: DeviceSlot, tasks, results, options: dict):
+    """Pool worker: render jobs from ``tasks`` on pipelines it owns."""
+    _bind_to_slot(slot)
+    env.apply_compatibility_settings()
+    runtime_config = config.RuntimeConfig.from_env()
+    print(f"[{slot.name}] worker {os.getpid()} started "
+          f"(cuda: {runtime_config.has_cuda}, cpus: {len(slot.cpus) or 'all'})")
+    pipelines = worker.PipelineCache(options["memory_budget_bytes"])
+    embedding_cache = embeddings.make_embedding_cache(options["embedding_cache_size"], options["embedding_cache_dir"])
+    writer = io.ImageWriter(**options["writer_options"]) if options["writer_options"] is not None else None
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            index, job = task
+            results.put(("started", slot.name, index))
+            try:
+                variants = generate.variant_configs(job)
+                job_start = time.perf_counter()
+                restored = batch.restore_job(variants, writer)
+                if restored is not None:
+                    seconds = (time.perf_counter() - job_start) / len(restored)
+                    outputs = [(path, seconds) for path in restored]
+                else:
+                    pipe = pipelines.get(job, runtime_config)
+                    outputs = batch.render_job(pipe, variants, runtime_config, embedding_cache, writer,
+                                               options["fuse_lora"])
+                if writer is not None:
+                    # Report a job only once its images are on disk
+                    writer.flush()
+                results.put(("done", slot.name, (index, outputs)))
+            except Exception:
+                results.put(("failed", slot.name, (index, traceback.format_exc())))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+@dataclass
+class JobFailure:
+    """A job that raised, or whose worker died, with the error text."""
+    index: int
+    worker: str
+    error: str
+
+
+@dataclass
+class PoolReport:
+    """Results and failures collected from every pool worker."""
+    results: list[batch.JobResult] = field(default_factory=list)
+    failures: list[JobFailure] = field(default_factory=list)
+    jobs_per_worker: dict[str, int] = field(default_factory=dict)
+    total_seconds: float = 0.0
+
+    @property
+    def images_per_second(self) -> float:
+        if self.total_seconds <= 0:
+            return 0.0
+        return len(self.results) / self.total_seconds
+
+
+def _dispatch_order(item: tuple[int, config.GenerationConfig]) -> tuple:
+    """Queue jobs sharing a pipeline and LoRA together so workers switch rarely."""
+    _, job = item
+    return (repr(pipeline.pipeline_cache_key(job, include_lora=False)),
+            job.lora_path or "", job.lora_scale if job.lora_path else 0.0)
+
+
+class WorkerPool:
+    """Runs batch jobs on one spawned worker process per DeviceSlot.
+
+    Each worker loads and keeps its own pipelines, LoRA state and caches.
+    Jobs go through one shared queue, so whichever worker is free takes the
+    next job. Results and failures, including workers that die mid-job, are
+    collected centrally by ``run``.
+    """
+
+    def __init__(self, slots: list[DeviceSlot], fuse_lora: bool = True, embedding_cache_size: int = 0,
+                 embedding_cache_dir: str | None = None, writer_options: dict | None = None,
+                 memory_budget_bytes: int | None = None):
+        if not slots:
+            raise ValueError("WorkerPool needs at least one slot")
+        self.slots = slots
+        self._options = {
+            "fuse_lora": fuse_lora,
+            "embedding_cache_size": embedding_cache_size,
+            "embedding_cache_dir": embedding_cache_dir,
+            "writer_options": writer_options,
+            "memory_budget_bytes": memory_budget_bytes,
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks = None
+        self._results = None
+        self._processes: dict[str, multiprocessing.Process] = {}
+
+    def start(self):
+        """Spawn one worker process per slot."""
+        if self._processes:
+            return
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        for slot in self.slots:
+            process = self._context.Process(
+                target=_worker_main,
+                args=(slot, self._tasks, self._results, self._options),
+                name=f"flux-pool-{slot.name}",
+                daemon=True,
+            )
+            process.start()
+            self._processes[slot.name] = process
+
+    def _export_shared_weights(self, jobs: list[config.GenerationConfig]):
+        """Export weights of jobs with ``shared_weights_dir`` once, before any worker maps them."""
+        exported = set()
+        for job in jobs:
+            key = pipeline.pipeline_cache_key(job, include_lora=False) + (job.shared_weights_dir,)
+            if not job.shared_weights_dir or stub.is_stub_model(job.model_id) or key in exported:
+                continue
+            exported.add(key)
+            shared_weights.export_shared_weights(job, os.getenv("HF_TOKEN"), job.shared_weights_dir)
+            if self._options["fuse_lora"] and any(other.lora_path for other in jobs):
+                print("Warning: fused LoRA adapters write to the shared weights and give each worker "
+                      "a private copy of them; use --lora_mode unfused")
+
+    def run(self, jobs: list[config.GenerationConfig]) -> PoolReport:
+        """Render every job on the pool and return results and failures.
+
+        Jobs with ``shared_weights_dir`` set have their weights exported
+        here first, so every worker maps the same files instead of loading
+        its own copy.
+        """
+        self._export_shared_weights(jobs)
+        self.start()
+        report = PoolReport(jobs_per_worker={slot.name: 0 for slot in self.slots})
+        start = time.perf_counter()
+        for item in sorted(enumerate(jobs), key=_dispatch_order):
+            self._tasks.put(item)
+
+        remaining = set(range(len(jobs)))
+        in_flight: dict[str, int] = {}
+        while remaining:
+            try:
+                kind, worker_name, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._fail_dead_workers(report, in_flight, remaining)
+                continue
+
+            if kind == "started":
+                in_flight[worker_name] = payload
+            elif kind == "done":
+                index, outputs = payload
+                in_flight.pop(worker_name, None)
+                remaining.discard(index)
+                report.jobs_per_worker[worker_name] += 1
+                for output_path, seconds in outputs:
+                    report.results.append(batch.JobResult(index=index, output_path=output_path, seconds=seconds))
+                    print(f"[{len(report.results)}] {worker_name}: {output_path} in {seconds:.2f}s")
+            elif kind == "failed":
+                index, error = payload
+                in_flight.pop(worker_name, None)
+                remaining.discard(index)
+                report.failures.append(JobFailure(index=index, worker=worker_name, error=error))
+                print(f"Job {index} failed on {worker_name}: {error.strip().splitlines()[-1]}")
+
+        report.total_seconds = time.perf_counter() - start
+        print(
+            f"Pool rendered {len(report.results)} images in {report.total_seconds:.2f}s "
+            f"({report.images_per_second:.3f} img/s, {len(report.failures)} failed jobs, "
+            f"jobs per worker: {report.jobs_per_worker})"
+        )
+        return report
+
+    def _fail_dead_workers(self, report: PoolReport, in_flight: dict[str, int], remaining: set[int]):
+        """Record the jobs of workers that exited; fail everything if none is left.
+
+        Called after a second without any message. A worker that dies after
+        taking a job but before its "started" message was sent leaves that
+        job unaccounted for: once some worker has exited and the task
+        queue is drained, jobs no live worker reported are failed too.
+        """
+        exited = [name for name, process in self._processes.items() if process.exitcode is not None]
+        for name in exited:
+            if name not in in_flight:
+                continue
+            index = in_flight.pop(name)
+            remaining.discard(index)
+            report.failures.append(JobFailure(index=index, worker=name,
+                                              error=f"worker exited with code {self._processes[name].exitcode}"))
+        if len(exited) == len(self._processes):
+            for index in sorted(remaining):
+                report.failures.append(JobFailure(index=index, worker="", error="no pool workers left"))
+            remaining.clear()
+        elif exited and self._tasks.empty():
+            for index in sorted(remaining - set(in_flight.values())):
+                report.failures.append(JobFailure(index=index, worker="",
+                                                  error=f"lost when worker {', '.join(exited)} exited"))
+                remaining.discard(index)
+
+    def close(self):
+        """Let workers finish queued work and stop them."""
+        if not self._processes:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes.values():
+            process.join()
+        self._processes.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
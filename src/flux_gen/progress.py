@@ -0,0 +1,192 @@
+"""Per-step progress events, latent previews and cancellation of running jobs."""
+
+import contextlib
+import threading
+import time
+from dataclasses import dataclass
+
+from . import memory
+
+
+# Linear projection of the 16 FLUX latent channels to RGB, with its bias.
+# Good enough to show composition and colours while denoising, at no VAE cost.
+FLUX_LATENT_RGB_FACTORS = (
+    (-0.0346, 0.0244, 0.0681),
+    (0.0034, 0.0210, 0.0687),
+    (0.0275, -0.0668, -0.0433),
+    (-0.0174, 0.0160, 0.0617),
+    (0.0859, 0.0721, 0.0329),
+    (0.0004, 0.0383, 0.0115),
+    (0.0405, 0.0861, 0.0915),
+    (-0.0236, -0.0185, -0.0259),
+    (-0.0245, 0.0250, 0.1180),
+    (0.1008, 0.0755, -0.0421),
+    (-0.0515, 0.0201, 0.0011),
+    (0.0428, -0.0012, -0.0036),
+    (0.0817, 0.0765, 0.0749),
+    (-0.1264, -0.0522, -0.1103),
+    (-0.0280, -0.0881, -0.0499),
+    (-0.1262, -0.0982, -0.0778),
+)
+FLUX_LATENT_RGB_BIAS = (-0.0329, -0.0718, -0.0851)
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised inside the denoising loop when a job's CancellationToken is set."""
+
+
+class CancellationToken:
+    """Thread-safe flag asking a running job to stop at its next step."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled("Generation cancelled")
+
+
+@dataclass
+class ProgressEvent:
+    """One finished denoising step."""
+    step: int  # 1-based
+    total_steps: int
+    timestep: float
+    elapsed_seconds: float
+    preview: object = None  # PIL image decoded from the latents, when requested
+
+    @property
+    def fraction(self) -> float:
+        return self.step / self.total_steps if self.total_steps else 1.0
+
+    @property
+    def eta_seconds(self) -> float:
+        """Remaining time extrapolated from the mean step time so far."""
+        return self.elapsed_seconds / self.step * (self.total_steps - self.step) if self.step else 0.0
+
+
+def latent_preview(latents, height: int, width: int):
+    """Project packed FLUX latents of the first image to a small RGB preview.
+
+    ``latents`` has the packed ``(batch, tokens, 64)`` layout of the
+    denoising loop; the preview has 1/8 of the output resolution.
+    """
+    import torch
+    from PIL import Image
+
+    latent_height, latent_width = height // 8, width // 8
+    sample = latents[:1].detach().float()
+    channels = sample.shape[-1] // 4
+    # Undo FluxPipeline._pack_latents: 2x2 patches of 16 channels per token
+    sample = sample.view(1, latent_height // 2, latent_width // 2, channels, 2, 2)
+    sample = sample.permute(0, 3, 1, 4, 2, 5).reshape(channels, latent_height, latent_width)
+
+    factors = torch.tensor(FLUX_LATENT_RGB_FACTORS, device=sample.device)
+    bias = torch.tensor(FLUX_LATENT_RGB_BIAS, device=sample.device)
+    rgb = torch.einsum("chw,cr->hwr", sample, factors) + bias
+    pixels = ((rgb.clamp(-1, 1) + 1) * 127.5).to(torch.uint8).cpu().numpy()
+    return Image.fromarray(pixels, "RGB")
+
+
+class ProgressTracker:
+    """Turns denoising step callbacks into ProgressEvents for a listener.
+
+    ``listener(event)`` is called on the rendering thread after every step;
+    with ``preview_every`` > 0 every n-th event (and the last) carries a
+    latent preview. When ``token`` is cancelled the next step raises
+    GenerationCancelled, which aborts the pipeline call.
+    """
+
+    def __init__(self, listener=None, token: CancellationToken | None = None, preview_every: int = 0):
+        self.listener = listener
+        self.token = token
+        self.preview_every = preview_every
+        self._start = time.perf_counter()
+        self._total_steps = 0
+        self._size = (0, 0)
+
+    def begin(self, total_steps: int, height: int, width: int):
+        """Reset the clock for a new pipeline call."""
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        self._start = time.perf_counter()
+        self._total_steps = total_steps
+        self._size = (height, width)
+
+    def _wants_preview(self, step: int) -> bool:
+        return self.preview_every > 0 and (step % self.preview_every == 0 or step == self._total_steps)
+
+    def step_callback(self, pipe, step: int, timestep, callback_kwargs: dict) -> dict:
+        """``callback_on_step_end`` hook emitting one event per step."""
+        if self.listener is not None:
+            done = step + 1
+            latents = callback_kwargs.get("latents")
+            preview = None
+            if latents is not None and self._wants_preview(done):
+                preview = latent_preview(latents, *self._size)
+            self.listener(ProgressEvent(
+                step=done,
+                total_steps=self._total_steps,
+                timestep=float(timestep),
+                elapsed_seconds=time.perf_counter() - self._start,
+                preview=preview,
+            ))
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        return callback_kwargs
+
+
+_LOCAL = threading.local()
+
+
+def active() -> ProgressTracker | None:
+    """The tracker of the current thread, or None."""
+    return getattr(_LOCAL, "tracker", None)
+
+
+@contextlib.contextmanager
+def track(listener=None, token: CancellationToken | None = None, preview_every: int = 0):
+    """Report progress of pipeline calls made by this thread inside the block."""
+    previous = active()
+    _LOCAL.tracker = ProgressTracker(listener, token, preview_every)
+    try:
+        yield _LOCAL.tracker
+    finally:
+        _LOCAL.tracker = previous
+
+
+def pipeline_kwargs(gen_config) -> dict:
+    """Extra pipeline call arguments: the step callback and, for previews, the latents."""
+    tracker = active()
+    if tracker is None:
+        return {}
+    tracker.begin(gen_config.num_inference_steps, gen_config.height, gen_config.width)
+    kwargs = {"callback_on_step_end": tracker.step_callback}
+    if tracker.preview_every > 0:
+        kwargs["callback_on_step_end_tensor_inputs"] = ["latents"]
+    return kwargs
+
+
+@contextlib.contextmanager
+def cancellable(pipe):
+    """Free device memory as soon as a pipeline call is cancelled.
+
+    Offload hooks are reset so the cancelled call's components leave the
+    device, and the allocator cache is returned before the error propagates.
+    """
+    try:
+        yield pipe
+    except GenerationCancelled:
+        free_hooks = getattr(pipe, "maybe_free_model_hooks", None)
+        if callable(free_hooks):
+            free_hooks()
+        memory.release_device_memory()
+        print("Generation cancelled, device memory released")
+        raise
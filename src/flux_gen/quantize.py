@@ -0,0 +1,157 @@
+"""Weight-only int8 quantization of the FLUX transformer and T5 encoder."""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from . import env, metrics
+
+
+QUANTIZE_MODES = ("int8",)
+
+# Components large enough to be worth quantizing
+QUANTIZED_COMPONENTS = ("transformer", "text_encoder_2")
+
+
+def _require_quanto():
+    """Import optimum-quanto or explain how to install it."""
+    try:
+        import optimum.quanto as quanto
+    except ImportError:
+        raise RuntimeError(
+            "optimum-quanto is required for --quantize. Please install it with:\n"
+            "pip install optimum-quanto>=0.2.4"
+        )
+    return quanto
+
+
+def checkpoint_dir(gen_config) -> Path:
+    """Directory holding the pre-quantized checkpoint for a config."""
+    root = Path(gen_config.quantized_cache_dir) if gen_config.quantized_cache_dir else env.cache_dir("quantized")
+    model = re.sub(r"[^0-9A-Za-z_.-]", "--", gen_config.model_id)
+    if gen_config.model_revision:
+        model += "@" + re.sub(r"[^0-9A-Za-z_.-]", "--", gen_config.model_revision)
+    return root / f"{model}-{gen_config.dtype or 'default'}-{gen_config.quantize}"
+
+
+def component_class(name: str):
+    """Model class of a large pipeline component."""
+    if name == "transformer":
+        from diffusers import FluxTransformer2DModel
+        return FluxTransformer2DModel
+    from transformers import T5EncoderModel
+    return T5EncoderModel
+
+
+def _save_component(module, component_dir: Path):
+    """Write a quantized module as safetensors plus its quantization map.
+
+    Files are written under temporary names and renamed into place, the
+    quantization map last: a checkpoint with a map is complete, whatever
+    crashes or concurrent writers happened before.
+    """
+    quanto = _require_quanto()
+    from safetensors.torch import save_file
+
+    component_dir.mkdir(parents=True, exist_ok=True)
+    if hasattr(module, "save_config"):
+        module.save_config(component_dir)
+    else:
+        module.config.save_pretrained(component_dir)
+    partial_weights = component_dir / f"model.safetensors.{os.getpid()}.partial"
+    save_file(module.state_dict(), partial_weights)
+    os.replace(partial_weights, component_dir / "model.safetensors")
+    partial_map = component_dir / f"quantization_map.json.{os.getpid()}.partial"
+    with open(partial_map, "w") as f:
+        json.dump(quanto.quantization_map(module), f)
+    os.replace(partial_map, component_dir / "quantization_map.json")
+
+
+def empty_component(name: str, component_dir: Path):
+    """Build a component from its saved config on the meta device, without weights."""
+    import torch
+
+    component_cls = component_class(name)
+    with torch.device("meta"):
+        if hasattr(component_cls, "from_config"):
+            return component_cls.from_config(component_cls.load_config(component_dir))
+        from transformers import AutoConfig
+        return component_cls(AutoConfig.from_pretrained(component_dir))
+
+
+def _load_component(name: str, component_dir: Path):
+    """Rebuild a quantized module from its checkpoint without full-precision weights."""
+    quanto = _require_quanto()
+    import torch
+    from safetensors.torch import load_file
+
+    module = empty_component(name, component_dir)
+
+    with open(component_dir / "quantization_map.json") as f:
+        quantization_map = json.load(f)
+    quanto.requantize(
+        module,
+        state_dict=load_file(component_dir / "model.safetensors"),
+        quantization_map=quantization_map,
+        device=torch.device("cpu"),
+    )
+    module.eval()
+    return module
+
+
+def load_cached_components(gen_config) -> dict:
+    """Load pre-quantized components written by an earlier run.
+
+    Returns a mapping of component name to module, suitable as keyword
+    arguments to ``FluxPipeline.from_pretrained`` so those components are not
+    loaded in full precision at all.
+    """
+    if not gen_config.quantize:
+        return {}
+
+    components = {}
+    root = checkpoint_dir(gen_config)
+    for name in QUANTIZED_COMPONENTS:
+        component_dir = root / name
+        if (component_dir / "quantization_map.json").exists():
+            start = time.perf_counter()
+            try:
+                components[name] = _load_component(name, component_dir)
+            except Exception as e:
+                # Corrupt files raise safetensors, JSON or requantize errors; quantize afresh instead
+                print(f"Warning: ignoring unreadable pre-quantized {name} in {component_dir}: {e}")
+                continue
+            print(f"Loaded pre-quantized {name} from {component_dir} in {time.perf_counter() - start:.1f}s")
+    return components
+
+
+def quantize_pipeline(pipe, gen_config, already_quantized=()):
+    """Quantize the large components of a loaded pipeline to int8 weights.
+
+    Components listed in ``already_quantized`` (loaded from the cache) are
+    skipped. Freshly quantized components are written to the checkpoint
+    directory so later startups can skip the conversion.
+    """
+    if gen_config.quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode '{gen_config.quantize}'")
+    quanto = _require_quanto()
+
+    root = checkpoint_dir(gen_config)
+    for name in QUANTIZED_COMPONENTS:
+        if name in already_quantized:
+            continue
+        module = getattr(pipe, name)
+        start = time.perf_counter()
+        quanto.quantize(module, weights=quanto.qint8)
+        quanto.freeze(module)
+        print(
+            f"Quantized {name} to {gen_config.quantize} in {time.perf_counter() - start:.1f}s "
+            f"(peak RSS: {metrics.format_bytes(metrics.peak_rss_bytes())})"
+        )
+        try:
+            _save_component(module, root / name)
+            print(f"Saved pre-quantized {name} to {root / name}")
+        except OSError as e:
+            print(f"Warning: could not cache quantized {name}: {e}")
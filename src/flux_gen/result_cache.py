@@ -0,0 +1,204 @@
+"""Content-addressed on-disk cache of generated images."""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from . import config, io
+
+
+def result_cache_key(gen_config: config.GenerationConfig) -> str | None:
+    """Return the canonical hash of everything that determines a job's pixels.
+
+    Covers model and revision, effective prompt, size, steps, guidance, T5
+    length, seed, dtype and quantization, and the LoRA file and config by
+    content digest together with the scale. Output location and performance
+    settings (offload, attention backend, compile) are left out. Returns
+    None for unseeded jobs, whose output is random.
+    """
+    if gen_config.seed is None:
+        return None
+
+    material = {
+        "model_id": gen_config.model_id,
+        "model_revision": gen_config.model_revision,
+        "prompt": gen_config.effective_prompt,
+        "height": gen_config.height,
+        "width": gen_config.width,
+        "num_inference_steps": gen_config.num_inference_steps,
+        "guidance_scale": gen_config.guidance_scale,
+        "max_sequence_length": gen_config.max_sequence_length,
+        "seed": gen_config.seed,
+        "dtype": gen_config.dtype,
+        "quantize": gen_config.quantize,
+    }
+    if gen_config.lora_path:
+        from . import lora
+
+        material["lora_sha256"] = lora.file_sha256(gen_config.lora_path)
+        material["lora_scale"] = gen_config.lora_scale
+        if gen_config.lora_config_path:
+            material["lora_config_sha256"] = lora.file_sha256(gen_config.lora_config_path)
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    """Stores rendered images as PNG plus JSON metadata, bounded in total size.
+
+    Entries live in ``cache_dir/<key[:2]>/<key>.png``. Recency is the file
+    modification time, refreshed on every hit, so least recently used
+    entries are evicted first once the total exceeds ``max_bytes``, also
+    across restarts.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        # key -> (last used, size of image and metadata)
+        self._entries: dict[str, tuple[float, int]] = {}
+        self._scan()
+
+    def _image_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.png"
+
+    def _metadata_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _scan(self):
+        """Index entries left by earlier processes."""
+        if not self.cache_dir.exists():
+            return
+        for image_path in self.cache_dir.glob("*/*.png"):
+            metadata_path = image_path.with_suffix(".json")
+            if not metadata_path.exists():
+                continue
+            stat = image_path.stat()
+            self._entries[image_path.stem] = (stat.st_mtime, stat.st_size + metadata_path.stat().st_size)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def lookup(self, gen_config: config.GenerationConfig) -> Path | None:
+        """Return the cached image path for a job, or None on a miss.
+
+        Unseeded jobs are neither hits nor misses; bypassed jobs count as
+        ``bypassed``.
+        """
+        key = result_cache_key(gen_config)
+        if key is None:
+            return None
+        with self._lock:
+            if gen_config.bypass_result_cache:
+                self.bypassed += 1
+                return None
+            image_path = self._image_path(key)
+            if key not in self._entries or not image_path.exists():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(image_path, (now, now))
+            self._entries[key] = (now, self._entries[key][1])
+            self.hits += 1
+            return image_path
+
+    def restore(self, gen_config: config.GenerationConfig, output_path: Path | None = None) -> Path | None:
+        """Copy a cached result to ``output_path`` (default: the job's path).
+
+        Returns the written path on a hit and None on a miss.
+        """
+        cached = self.lookup(gen_config)
+        if cached is None:
+            return None
+        output_path = Path(output_path or gen_config.output_path)
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(cached, tmp_path)
+        os.replace(tmp_path, output_path)
+        print(f"Result cache hit: {output_path}")
+        return output_path
+
+    def store(self, gen_config: config.GenerationConfig, image, render_seconds: float | None = None) -> Path | None:
+        """Cache an image rendered for a job; unseeded jobs are not stored."""
+        key = result_cache_key(gen_config)
+        if key is None:
+            return None
+
+        image_path = self._image_path(key)
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        # Restored copies carry the same regeneration metadata as fresh renders
+        size = io.write_image_atomic(image, image_path, format="PNG",
+                                     pnginfo=io.png_info(io.image_metadata(gen_config)))
+        metadata = {
+            "key": key,
+            "model_id": gen_config.model_id,
+            "model_revision": gen_config.model_revision,
+            "prompt": gen_config.effective_prompt,
+            "height": gen_config.height,
+            "width": gen_config.width,
+            "num_inference_steps": gen_config.num_inference_steps,
+            "guidance_scale": gen_config.guidance_scale,
+            "seed": gen_config.seed,
+            "lora_path": gen_config.lora_path,
+            "lora_scale": gen_config.lora_scale,
+            "render_seconds": render_seconds,
+            "created_at": time.time(),
+        }
+        metadata_path = self._metadata_path(key)
+        tmp_path = metadata_path.with_name(f".{metadata_path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(metadata, indent=2))
+        os.replace(tmp_path, metadata_path)
+
+        with self._lock:
+            self._entries[key] = (time.time(), size + metadata_path.stat().st_size)
+            self._evict()
+        return image_path
+
+    def _evict(self):
+        """Remove least recently used entries until within ``max_bytes``."""
+        while len(self._entries) > 1 and self.total_bytes > self.max_bytes:
+            key = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[key]
+            self._image_path(key).unlink(missing_ok=True)
+            self._metadata_path(key).unlink(missing_ok=True)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the cache size."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# One cache per directory, shared by every job of the process
+_CACHES: dict[str, ResultCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def cache_for(gen_config: config.GenerationConfig) -> ResultCache | None:
+    """The ResultCache configured for a job, or None when caching is off."""
+    if not gen_config.result_cache_dir:
+        return None
+    root = str(Path(gen_config.result_cache_dir).expanduser().resolve())
+    with _CACHES_LOCK:
+        cache = _CACHES.get(root)
+        if cache is None:
+            cache = _CACHES[root] = ResultCache(Path(root), int(gen_config.result_cache_max_gb * 1024 ** 3))
+        return cache
@@ -0,0 +1,180 @@
+"""Dynamic request batching by shape bucket."""
+
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from . import config, pipeline
+
+
+def bucket_key(gen_config: config.GenerationConfig) -> tuple:
+    """Return the settings that must match for requests to share a batch."""
+    return (
+        pipeline.pipeline_cache_key(gen_config),
+        gen_config.height,
+        gen_config.width,
+        gen_config.num_inference_steps,
+        gen_config.guidance_scale,
+        gen_config.max_sequence_length,
+        gen_config.vae_decode,
+        gen_config.vae_tile_size,
+        gen_config.vae_tile_overlap,
+    )
+
+
+@dataclass
+class _Pending:
+    """A queued request waiting for its batch."""
+    gen_config: config.GenerationConfig
+    future: Future
+    enqueued_at: float
+
+
+class BatchScheduler:
+    """Groups queued requests into batched pipeline calls.
+
+    Requests with the same ``bucket_key`` are dispatched together once the
+    bucket holds ``max_batch_size`` requests or its oldest request has waited
+    ``max_wait_seconds``. ``render_batch`` receives the list of configs and
+    must return one image per config, in order. All rendering happens on the
+    scheduler thread, so the pipeline is never called concurrently. An
+    optional ``batch_limit(gen_config)`` caps the batch size per bucket
+    below ``max_batch_size``, e.g. to what fits in device memory.
+    """
+
+    def __init__(self, render_batch, max_batch_size: int = 4, max_wait_seconds: float = 0.05,
+                 batch_limit=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._render_batch = render_batch
+        self._batch_limit = batch_limit
+        self._buckets: dict[tuple, list[_Pending]] = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.batches = 0
+        self.requests = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be dispatched."""
+        with self._condition:
+            return sum(len(bucket) for bucket in self._buckets.values())
+
+    @property
+    def fill_ratio(self) -> float:
+        """Mean fraction of max_batch_size used by dispatched batches."""
+        if self.batches == 0:
+            return 0.0
+        return self.requests / (self.batches * self.max_batch_size)
+
+    def start(self):
+        """Start the dispatch thread."""
+        with self._condition:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="flux-batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Dispatch remaining requests and stop the dispatch thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, gen_config: config.GenerationConfig) -> Future:
+        """Queue a request and return a future resolving to its image."""
+        future = Future()
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Scheduler is stopped")
+            key = bucket_key(gen_config)
+            self._buckets.setdefault(key, []).append(_Pending(gen_config, future, time.monotonic()))
+            self._condition.notify_all()
+            self.start()
+        return future
+
+    def stats(self) -> dict:
+        """Return queue and batching counters for tuning."""
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "requests": self.requests,
+            "fill_ratio": self.fill_ratio,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+    def _next_ready_batch(self) -> list[_Pending] | None:
+        """Pop the next batch that is full or has waited long enough.
+
+        Must be called with the condition held. Returns None and leaves the
+        queue untouched when nothing is ready yet.
+        """
+        now = time.monotonic()
+        ready_key = None
+        oldest = None
+        for key, bucket in self._buckets.items():
+            if len(bucket) >= self._limit_for(bucket):
+                ready_key = key
+                break
+            waited = now - bucket[0].enqueued_at
+            if (waited >= self.max_wait_seconds or self._stopping) and (
+                oldest is None or bucket[0].enqueued_at < oldest
+            ):
+                ready_key = key
+                oldest = bucket[0].enqueued_at
+
+        if ready_key is None:
+            return None
+
+        bucket = self._buckets[ready_key]
+        limit = self._limit_for(bucket)
+        batch, rest = bucket[:limit], bucket[limit:]
+        if rest:
+            self._buckets[ready_key] = rest
+        else:
+            del self._buckets[ready_key]
+        return batch
+
+    def _limit_for(self, bucket: list[_Pending]) -> int:
+        if self._batch_limit is None:
+            return self.max_batch_size
+        return max(1, min(self.max_batch_size, self._batch_limit(bucket[0].gen_config)))
+
+    def _wait_timeout(self) -> float | None:
+        """Time until the oldest queued request reaches max_wait_seconds."""
+        if not self._buckets:
+            return None
+        oldest = min(bucket[0].enqueued_at for bucket in self._buckets.values())
+        return max(0.0, oldest + self.max_wait_seconds - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_ready_batch()
+                while batch is None:
+                    if self._stopping and not self._buckets:
+                        return
+                    self._condition.wait(self._wait_timeout())
+                    batch = self._next_ready_batch()
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                images = self._render_batch([pending.gen_config for pending in batch])
+                if len(images) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} images from batch, got {len(images)}")
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+
+            for pending, image in zip(batch, images):
+                pending.future.set_result(image)
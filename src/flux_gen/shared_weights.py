@@ -0,0 +1,168 @@
+"""Read-only model weights shared between processes through memory-mapped files."""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from . import env, metrics, quantize
+
+
+# Components holding nearly all of the weights; the rest load per process
+SHARED_COMPONENTS = ("transformer", "text_encoder_2")
+
+WEIGHTS_NAME = "model.safetensors"
+
+# safetensors dtype names mapped to torch dtype attribute names
+_SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def default_root() -> Path:
+    """Shared memory (``/dev/shm``) where available, else the flux_gen cache."""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm / "flux_gen"
+    return env.cache_dir("shared_weights")
+
+
+def shared_weights_dir(gen_config, root: str | Path | None = None) -> Path:
+    """Directory holding the exported components of a config's model and dtype."""
+    root = Path(root) if root else default_root()
+    model = re.sub(r"[^0-9A-Za-z_.-]", "--", gen_config.model_id)
+    if gen_config.model_revision:
+        model += "@" + re.sub(r"[^0-9A-Za-z_.-]", "--", gen_config.model_revision)
+    return root / f"{model}-{gen_config.dtype or 'default'}"
+
+
+def _is_exported(component_dir: Path) -> bool:
+    return (component_dir / WEIGHTS_NAME).exists()
+
+
+def _unique_state_dict(module) -> dict:
+    """State dict without aliases of tied weights, which safetensors rejects."""
+    state, seen = {}, set()
+    for name, tensor in module.state_dict().items():
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape))
+        if tensor.numel() and key in seen:
+            continue
+        seen.add(key)
+        state[name] = tensor.contiguous()
+    return state
+
+
+def _export_component(name: str, gen_config, token: str | None, component_dir: Path):
+    """Load one component and write its weights and config for mapping."""
+    from safetensors.torch import save_file
+    from . import pipeline, snapshot
+
+    load_kwargs = {"subfolder": name, "low_cpu_mem_usage": True}
+    torch_dtype = pipeline.resolve_torch_dtype(gen_config.dtype)
+    if torch_dtype is not None:
+        load_kwargs["torch_dtype"] = torch_dtype
+    source = gen_config.model_id
+    if gen_config.snapshot_dir:
+        snapshot.verify_snapshot(gen_config.snapshot_dir, gen_config.model_id, gen_config.model_revision)
+        source = str(Path(gen_config.snapshot_dir).expanduser())
+        load_kwargs["local_files_only"] = True
+    else:
+        load_kwargs["token"] = token
+        if gen_config.model_revision:
+            load_kwargs["revision"] = gen_config.model_revision
+
+    module = quantize.component_class(name).from_pretrained(source, **load_kwargs)
+    component_dir.mkdir(parents=True, exist_ok=True)
+    if hasattr(module, "save_config"):
+        module.save_config(component_dir)
+    else:
+        module.config.save_pretrained(component_dir)
+    # Written under a temporary name so concurrent starts never map a partial file
+    partial = component_dir / f"{WEIGHTS_NAME}.{os.getpid()}.partial"
+    save_file(_unique_state_dict(module), partial)
+    os.replace(partial, component_dir / WEIGHTS_NAME)
+
+
+def export_shared_weights(gen_config, token: str | None = None, root: str | Path | None = None) -> Path:
+    """Write the large components of a model once, for every process to map.
+
+    Components are stored in the configured dtype so mapping them needs no
+    conversion. Already exported components are kept. Returns the export
+    directory.
+    """
+    if gen_config.quantize:
+        raise ValueError("Shared weights cannot be combined with --quantize")
+    target = shared_weights_dir(gen_config, root)
+    for name in SHARED_COMPONENTS:
+        if _is_exported(target / name):
+            continue
+        start = time.perf_counter()
+        _export_component(name, gen_config, token, target / name)
+        print(
+            f"Exported shared {name} to {target / name} in {time.perf_counter() - start:.1f}s "
+            f"(peak RSS: {metrics.format_bytes(metrics.peak_rss_bytes())})"
+        )
+    return target
+
+
+def map_safetensors(path: Path) -> dict:
+    """Tensors of a safetensors file, backed by a private mapping of the file.
+
+    Nothing is read up front: pages are loaded on first access and, as long
+    as nobody writes to them, are the same physical pages in every process
+    that maps the file (copy-on-write).
+    """
+    import torch
+
+    path = Path(path)
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(str(path), shared=False, nbytes=path.stat().st_size)
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        raw = torch.empty(0, dtype=torch.uint8).set_(storage, data_start + start, (end - start,))
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+        tensors[name] = raw.view(dtype).view(info["shape"])
+    return tensors
+
+
+def _attach_component(name: str, component_dir: Path):
+    """Build a component on the meta device and point its weights at the mapped file."""
+    module = quantize.empty_component(name, component_dir)
+    module.load_state_dict(map_safetensors(component_dir / WEIGHTS_NAME), strict=False, assign=True)
+    if hasattr(module, "tie_weights"):
+        # Restores weights dropped from the file as aliases of others
+        module.tie_weights()
+    tensors = list(module.named_parameters()) + list(module.named_buffers())
+    missing = [key for key, tensor in tensors if tensor.device.type == "meta"]
+    if missing:
+        raise RuntimeError(f"Shared {name} in {component_dir} lacks weights: {', '.join(missing[:5])}")
+    module.eval()
+    return module
+
+
+def load_shared_components(gen_config, token: str | None = None) -> dict:
+    """Map the large components from ``gen_config.shared_weights_dir``.
+
+    Exports them first when no process has yet. Returns a mapping of
+    component name to module, suitable as keyword arguments to
+    ``FluxPipeline.from_pretrained``.
+    """
+    target = export_shared_weights(gen_config, token, gen_config.shared_weights_dir)
+    components = {}
+    start = time.perf_counter()
+    for name in SHARED_COMPONENTS:
+        components[name] = _attach_component(name, target / name)
+    print(
+        f"Mapped shared {', '.join(SHARED_COMPONENTS)} from {target} in {time.perf_counter() - start:.1f}s "
+        f"(RSS: {metrics.format_bytes(metrics.current_rss_bytes())}, "
+        f"proportional: {metrics.format_bytes(metrics.proportional_rss_bytes())})"
+    )
+    return components
@@ -0,0 +1,246 @@
+"""Pinned local model snapshots with checksums, for hub-free startup."""
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import env
+
+
+MANIFEST_NAME = "flux_gen_snapshot.json"
+
+# Read size for hashing and readahead
+_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Download and hub metadata files that are not part of the model
+_IGNORED_PARTS = (".cache", ".huggingface", ".git")
+
+
+def default_snapshot_dir(model_id: str, revision: str | None = None) -> Path:
+    """Directory a model snapshot is materialized in by default."""
+    name = re.sub(r"[^0-9A-Za-z_.-]", "--", model_id)
+    if revision:
+        name += "@" + re.sub(r"[^0-9A-Za-z_.-]", "--", revision)
+    return env.cache_dir("snapshots") / name
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_files(root: Path) -> list[Path]:
+    """Model files of a snapshot, relative to ``root``."""
+    files = []
+    for path in sorted(root.rglob("*")):
+        relative = path.relative_to(root)
+        if path.is_file() and relative.name != MANIFEST_NAME and not set(relative.parts) & set(_IGNORED_PARTS):
+            files.append(relative)
+    return files
+
+
+def write_manifest(root: Path, model_id: str, revision: str | None, commit: str | None,
+                   max_workers: int = 8) -> dict:
+    """Hash every file of a snapshot and record it with the pinned commit."""
+    root = Path(root)
+    files = _snapshot_files(root)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = list(executor.map(lambda relative: _sha256(root / relative), files))
+    manifest = {
+        "model_id": model_id,
+        "revision": revision,
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {
+            relative.as_posix(): {"size": (root / relative).stat().st_size, "sha256": digest}
+            for relative, digest in zip(files, digests)
+        },
+    }
+    with open(root / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def read_manifest(root: Path) -> dict:
+    """Load the manifest of a snapshot directory."""
+    manifest_path = Path(root) / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise RuntimeError(
+            f"No model snapshot in '{root}' ({MANIFEST_NAME} is missing). Create one with:\n"
+            "python src/prefetch.py --model_id <model> --model_revision <revision> --snapshot_dir <dir>"
+        )
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def verify_snapshot(root: Path, model_id: str | None = None, revision: str | None = None,
+                    full: bool = False, max_workers: int = 8) -> dict:
+    """Check a snapshot against its manifest and return the manifest.
+
+    Without ``full`` only presence and sizes are checked, which is instant;
+    ``full`` re-hashes every file in parallel. ``model_id`` and ``revision``
+    (a branch, tag or commit prefix) must match what was prefetched.
+    """
+    root = Path(root)
+    manifest = read_manifest(root)
+    if model_id is not None and manifest["model_id"] != model_id:
+        raise RuntimeError(f"Snapshot '{root}' holds '{manifest['model_id']}', not '{model_id}'")
+    if revision and revision != manifest["revision"] and not (manifest["commit"] or "").startswith(revision):
+        raise RuntimeError(
+            f"Snapshot '{root}' is pinned to {manifest['revision']} ({manifest['commit']}), not '{revision}'"
+        )
+
+    problems = []
+    for name, entry in manifest["files"].items():
+        path = root / name
+        if not path.is_file():
+            problems.append(f"missing {name}")
+        elif path.stat().st_size != entry["size"]:
+            problems.append(f"size mismatch {name}")
+    if full and not problems:
+        names = list(manifest["files"])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            digests = executor.map(lambda name: _sha256(root / name), names)
+            problems = [f"checksum mismatch {name}" for name, digest in zip(names, digests)
+                        if digest != manifest["files"][name]["sha256"]]
+    if problems:
+        raise RuntimeError(f"Snapshot '{root}' is corrupt: {', '.join(problems[:5])}. Prefetch it again.")
+    return manifest
+
+
+def prefetch(model_id: str, revision: str | None = None, snapshot_dir: str | None = None,
+             token: str | None = None, max_workers: int = 8) -> Path:
+    """Download a pinned revision of ``model_id`` into a local snapshot.
+
+    The revision (default: ``main``) is resolved to its commit first, so the
+    snapshot never drifts. An existing snapshot of the same commit is only
+    verified. Returns the snapshot directory.
+    """
+    from huggingface_hub import HfApi, snapshot_download
+
+    root = Path(snapshot_dir) if snapshot_dir else default_snapshot_dir(model_id, revision)
+    commit = HfApi().model_info(model_id, revision=revision, token=token).sha
+
+    if (root / MANIFEST_NAME).exists():
+        try:
+            manifest = verify_snapshot(root, model_id, commit)
+            print(f"Snapshot of {model_id}@{commit[:12]} already in {root} ({len(manifest['files'])} files)")
+            return root
+        except RuntimeError as e:
+            print(f"Refreshing snapshot: {e}")
+
+    start = time.perf_counter()
+    snapshot_download(repo_id=model_id, revision=commit, local_dir=root, token=token, max_workers=max_workers)
+    download_seconds = time.perf_counter() - start
+    manifest = write_manifest(root, model_id, revision, commit, max_workers)
+    total_bytes = sum(entry["size"] for entry in manifest["files"].values())
+    print(
+        f"Snapshot of {model_id}@{commit[:12]} written to {root}: {len(manifest['files'])} files, "
+        f"{total_bytes / 1024 ** 3:.1f} GiB, downloaded in {download_seconds:.1f}s, "
+        f"hashed in {time.perf_counter() - start - download_seconds:.1f}s"
+    )
+    return root
+
+
+def _weight_files(root: Path, manifest: dict) -> list[Path]:
+    """Weight files, largest first, so the longest reads start earliest."""
+    names = [name for name in manifest["files"] if name.endswith((".safetensors", ".bin"))]
+    return [root / name for name in sorted(names, key=lambda name: -manifest["files"][name]["size"])]
+
+
+def _read_through(path: Path):
+    with open(path, "rb", buffering=0) as f:
+        buffer = bytearray(_CHUNK_BYTES)
+        while f.readinto(buffer):
+            pass
+
+
+def readahead(root: Path, manifest: dict, max_workers: int = 8) -> threading.Thread | None:
+    """Read the snapshot's weight files into the page cache in the background.
+
+    Files are read in parallel while ``from_pretrained`` parses configs and
+    builds modules, so its own sequential reads are served from memory.
+    Skipped when the weights would not fit in available memory.
+    """
+    files = _weight_files(Path(root), manifest)
+    total_bytes = sum(path.stat().st_size for path in files)
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        available = None
+    if not files or (available is not None and total_bytes > available):
+        return None
+
+    def run():
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_read_through, files))
+
+    thread = threading.Thread(target=run, name="flux-snapshot-readahead", daemon=True)
+    thread.start()
+    return thread
+
+
+def evict_page_cache(root: Path, manifest: dict):
+    """Drop the snapshot's files from the page cache to measure a cold start."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for name in manifest["files"]:
+        fd = os.open(Path(root) / name, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def open_snapshot(gen_config, max_workers: int = 8) -> Path:
+    """Prepare ``gen_config.snapshot_dir`` for loading without the hub.
+
+    Verifies the snapshot against the configured model and revision, turns
+    on hub offline mode for libraries imported afterwards and starts the
+    parallel readahead. Returns the directory to pass to ``from_pretrained``.
+    """
+    root = Path(gen_config.snapshot_dir).expanduser()
+    manifest = verify_snapshot(root, gen_config.model_id, gen_config.model_revision)
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    readahead(root, manifest, max_workers)
+    print(f"Loading {gen_config.model_id}@{(manifest['commit'] or 'local')[:12]} from snapshot {root}")
+    return root
+
+
+def compare_cold_start(gen_config, runtime_config, snapshot_dir: Path) -> dict:
+    """Time a hub-resolved pipeline load against a load from the snapshot.
+
+    The snapshot is evicted from the page cache first, so both loads start
+    cold as far as the snapshot is concerned. The hub-resolved load uses the
+    Hugging Face cache and downloads into it when the model is missing.
+    """
+    from . import pipeline
+
+    base = dataclasses.replace(gen_config, compile=False, lora_path=None)
+    start = time.perf_counter()
+    pipeline.load_flux_pipeline(dataclasses.replace(base, snapshot_dir=None), runtime_config, apply_lora=False)
+    hub_seconds = time.perf_counter() - start
+
+    evict_page_cache(snapshot_dir, read_manifest(snapshot_dir))
+    start = time.perf_counter()
+    pipeline.load_flux_pipeline(dataclasses.replace(base, snapshot_dir=str(snapshot_dir)), runtime_config,
+                                apply_lora=False)
+    snapshot_seconds = time.perf_counter() - start
+
+    result = {
+        "hub_seconds": hub_seconds,
+        "snapshot_seconds": snapshot_seconds,
+        "speedup": hub_seconds / snapshot_seconds if snapshot_seconds > 0 else 0.0,
+    }
+    print(f"Cold start: hub-resolved {hub_seconds:.1f}s, snapshot {snapshot_seconds:.1f}s "
+          f"({result['speedup']:.2f}x faster)")
+    return result
@@ -0,0 +1,222 @@
+"""Staged execution: text encoding, denoising, VAE decoding and writing overlap across jobs."""
+
+import contextlib
+import queue
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import attention, config, embeddings, generate, io, pipeline, result_cache, stub, trace
+
+
+STAGES = ("encode", "denoise", "decode", "write")
+
+# Marks the end of the job stream on every queue
+_DONE = object()
+
+
+def decode_latents(pipe, latents, height: int, width: int) -> list:
+    """Decode packed latents from ``output_type="latent"`` into PIL images.
+
+    Mirrors the tail of ``FluxPipeline.__call__``: unpack, undo the VAE
+    scaling and shift, decode and post-process.
+    """
+    if isinstance(pipe, stub.StubFluxPipeline):
+        return pipe.decode_latents(latents, height, width)
+    import torch
+
+    latents = pipe._unpack_latents(latents, height, width, pipe.vae_scale_factor)
+    latents = latents / pipe.vae.config.scaling_factor + pipe.vae.config.shift_factor
+    with torch.inference_mode():
+        decoded = pipe.vae.decode(latents, return_dict=False)[0]
+    return pipe.image_processor.postprocess(decoded, output_type="pil")
+
+
+@dataclass
+class StageStats:
+    """Busy time of one stage over a staged run."""
+    name: str
+    busy_seconds: float = 0.0
+    items: int = 0
+
+    def utilization(self, total_seconds: float) -> float:
+        return self.busy_seconds / total_seconds if total_seconds > 0 else 0.0
+
+
+@dataclass
+class StagedJob:
+    """One job's variants as they move through the stages."""
+    index: int
+    variants: list[config.GenerationConfig]
+    payload: object = None
+    started: float = 0.0
+    seconds: float = 0.0
+    outputs: list[Path] = field(default_factory=list)
+    error: str | None = None
+    failed_stage: str | None = None
+    exception: BaseException | None = None
+
+
+@dataclass
+class StagedReport:
+    """Finished jobs, in completion order, and per-stage utilization."""
+    jobs: list[StagedJob] = field(default_factory=list)
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    total_seconds: float = 0.0
+
+    @property
+    def failures(self) -> list[StagedJob]:
+        return [job for job in self.jobs if job.error is not None]
+
+    def utilization(self) -> dict[str, float]:
+        return {name: stats.utilization(self.total_seconds) for name, stats in self.stages.items()}
+
+
+class StagedRunner:
+    """Runs jobs on one pipeline as a four-stage assembly line.
+
+    Each stage (encode, denoise, decode, write) has its own thread and the
+    stages are connected by queues of ``queue_size`` jobs, so while job N
+    denoises, job N+1 is encoded and job N-1 is decoded and written, and at
+    most a few jobs' tensors are alive at once. On CUDA every stage issues
+    its work on its own stream. With CPU offload the components move
+    between host and device per call, so the device stages take turns
+    instead; writing still overlaps. All jobs share the pipeline's current
+    LoRA state. A job that fails in any stage is reported and skipped by
+    the later stages.
+    """
+
+    def __init__(self, pipe, embedding_cache=None, writer: io.ImageWriter | None = None, queue_size: int = 2):
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.pipe = pipe
+        # Encoding always goes through a cache so the denoise stage gets embeddings
+        self.embedding_cache = embedding_cache if embedding_cache is not None else embeddings.PromptEmbeddingCache()
+        self.writer = writer
+        self.queue_size = queue_size
+        self.stats = {name: StageStats(name) for name in STAGES}
+        offload = pipeline.offload_mode_of(pipe)
+        self._device_lock = threading.Lock() if offload in ("model", "sequential") else None
+
+    def _encode(self, job: StagedJob):
+        first = job.variants[0]
+        prompt_embeds, pooled_prompt_embeds = self.embedding_cache.get_or_encode(self.pipe, first)
+        return dict(prompt_embeds=prompt_embeds, pooled_prompt_embeds=pooled_prompt_embeds)
+
+    def _denoise(self, job: StagedJob):
+        first = job.variants[0]
+        with trace.span("render", height=first.height, width=first.width, batch_size=len(job.variants)):
+            return attention.run_with_backend(
+                first,
+                lambda: self.pipe(**job.payload, output_type="latent",
+                                  **generate.pipeline_kwargs(job.variants, len(job.variants))).images,
+            )
+
+    def _decode(self, job: StagedJob):
+        first = job.variants[0]
+        pipeline.apply_vae_decode(self.pipe, first, len(job.variants))
+        with trace.span("vae_decode", batch_size=len(job.variants)):
+            return decode_latents(self.pipe, job.payload, first.height, first.width)
+
+    def _write(self, job: StagedJob):
+        io.ensure_output_directory(job.variants[0].out_dir)
+        seconds = (time.perf_counter() - job.started) / len(job.variants)
+        for variant, image in zip(job.variants, job.payload):
+            # Seeded images carry the settings needed to regenerate them
+            metadata = io.image_metadata(variant) if variant.seed is not None else None
+            cache = result_cache.cache_for(variant)
+            if cache is not None:
+                cache.store(variant, image, seconds)
+            if self.writer is None:
+                io.save_generated_image(image, variant.output_path, metadata)
+                job.outputs.append(variant.output_path)
+            else:
+                self.writer.submit(image, variant.output_path, metadata)
+                job.outputs.append(self.writer.output_path_for(variant.output_path))
+        return None
+
+    def _stage_loop(self, name: str, work, inbox: queue.Queue, outbox: queue.Queue):
+        stats = self.stats[name]
+        uses_device = name != "write"
+        stream = _cuda_stream() if uses_device else None
+        lock = self._device_lock if uses_device and self._device_lock is not None else contextlib.nullcontext()
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                outbox.put(_DONE)
+                return
+            if job.error is None:
+                start = time.perf_counter()
+                try:
+                    with lock, _on_stream(stream):
+                        job.payload = work(job)
+                        if stream is not None:
+                            # Hand finished tensors to the next stage's stream
+                            stream.synchronize()
+                except Exception as e:
+                    job.error = f"{name}: {traceback.format_exc()}"
+                    job.failed_stage, job.exception = name, e
+                    job.payload = None
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += 1
+            outbox.put(job)
+
+    def run(self, jobs: list[list[config.GenerationConfig]]) -> StagedReport:
+        """Render each job's variants (see ``generate.variant_configs``) and return the report."""
+        self.stats = {name: StageStats(name) for name in STAGES}
+        report = StagedReport(stages=self.stats)
+        if not jobs:
+            return report
+
+        run_start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        work = {"encode": self._encode, "denoise": self._denoise, "decode": self._decode, "write": self._write}
+        threads = [
+            threading.Thread(target=self._stage_loop, args=(name, work[name], queues[i], queues[i + 1]),
+                             name=f"flux-stage-{name}", daemon=True)
+            for i, name in enumerate(STAGES)
+        ]
+        for thread in threads:
+            thread.start()
+
+        def feed():
+            for index, variants in enumerate(jobs):
+                queues[0].put(StagedJob(index=index, variants=variants, started=time.perf_counter()))
+            queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name="flux-stage-feed", daemon=True)
+        feeder.start()
+        while (job := queues[-1].get()) is not _DONE:
+            job.seconds = (time.perf_counter() - job.started) / len(job.variants)
+            job.payload = None
+            report.jobs.append(job)
+            if job.error is None:
+                for output_path in job.outputs:
+                    print(f"[staged {len(report.jobs)}/{len(jobs)}] {output_path} in {job.seconds:.2f}s")
+            else:
+                print(f"Job {job.index} failed in {job.failed_stage}: {job.error.strip().splitlines()[-1]}")
+        for thread in threads + [feeder]:
+            thread.join()
+
+        report.total_seconds = time.perf_counter() - run_start
+        print("Stage utilization: " + ", ".join(
+            f"{name} {share:.0%}" for name, share in report.utilization().items()
+        ) + f" over {report.total_seconds:.2f}s")
+        return report
+
+
+def _cuda_stream():
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda.Stream()
+
+
+def _on_stream(stream):
+    """Make ``stream`` current for the block; a no-op without CUDA."""
+    if stream is None:
+        return contextlib.nullcontext()
+    return sys.modules["torch"].cuda.stream(stream)
@@ -0,0 +1,184 @@
+"""Deterministic CPU stand-in for FluxPipeline, used by benchmarks and tests."""
+
+import hashlib
+import random
+from types import SimpleNamespace
+
+
+# Model IDs starting with this prefix load StubFluxPipeline instead of diffusers
+STUB_PREFIX = "stub:"
+
+# Latent channels and VAE downscale of FLUX, used to size the simulated work
+_LATENT_CHANNELS = 16
+_VAE_SCALE = 8
+
+# Simulated bf16 decoder activation bytes per output pixel in flight
+_DECODE_BYTES_PER_PIXEL = 1536
+
+
+def is_stub_model(model_id: str) -> bool:
+    """Whether a model ID selects the stub pipeline."""
+    return model_id.startswith(STUB_PREFIX)
+
+
+class _StubModule:
+    """Component placeholder with no parameters or submodules."""
+
+    def named_modules(self):
+        return iter(())
+
+    def parameters(self):
+        return iter(())
+
+
+class _StubVae(_StubModule):
+    """VAE placeholder that simulates the decode memory of each strategy.
+
+    Follows AutoencoderKL: slicing decodes one image at a time, tiling
+    decodes tiles of ``tile_sample_min_size`` pixels when the image is larger.
+    ``peak_decode_bytes`` holds the simulated activation peak of the last
+    decode.
+    """
+
+    def __init__(self):
+        self.use_slicing = False
+        self.use_tiling = False
+        self.tile_sample_min_size = 1024
+        self.tile_overlap_factor = 0.25
+        self.peak_decode_bytes = 0
+
+    def enable_slicing(self):
+        self.use_slicing = True
+
+    def disable_slicing(self):
+        self.use_slicing = False
+
+    def enable_tiling(self):
+        self.use_tiling = True
+
+    def disable_tiling(self):
+        self.use_tiling = False
+
+    def simulate_decode(self, batch_size: int, height: int, width: int):
+        tile = self.tile_sample_min_size
+        pixels = tile * tile if self.use_tiling and max(height, width) > tile else height * width
+        images = 1 if self.use_slicing else batch_size
+        self.peak_decode_bytes = images * pixels * _DECODE_BYTES_PER_PIXEL
+
+
+class StubFluxPipeline:
+    """Mimics the FluxPipeline calls flux_gen makes, without any model weights.
+
+    Each denoising step hashes a latent-sized buffer, so latency grows with
+    resolution, batch size and step count the way the real model does.
+    Images are pseudo-random noise seeded from the prompt, sampling settings
+    and generator seed, so identical calls give identical pixels.
+    """
+
+    def __init__(self, model_id: str = STUB_PREFIX, work_factor: int = 1):
+        self.model_id = model_id
+        self.work_factor = work_factor
+        self.transformer = _StubModule()
+        self.vae = _StubVae()
+        self.text_encoder = _StubModule()
+        self.text_encoder_2 = _StubModule()
+        self.adapters = {}
+        self.active_adapters = []
+        self.fused = False
+        self.device = "cpu"
+
+    @classmethod
+    def from_pretrained(cls, model_id: str, **kwargs):
+        """Build a stub; ``stub:N`` multiplies the simulated work per step by N."""
+        suffix = model_id[len(STUB_PREFIX):]
+        return cls(model_id, work_factor=int(suffix) if suffix.isdigit() else 1)
+
+    @property
+    def components(self) -> dict:
+        return {
+            "transformer": self.transformer,
+            "vae": self.vae,
+            "text_encoder": self.text_encoder,
+            "text_encoder_2": self.text_encoder_2,
+        }
+
+    def to(self, device):
+        self.device = str(device)
+        return self
+
+    def enable_model_cpu_offload(self):
+        pass
+
+    def enable_sequential_cpu_offload(self):
+        pass
+
+    def encode_prompt(self, prompt, prompt_2=None, max_sequence_length=512):
+        """Return stand-in embeddings: the prompt digest stands for both outputs."""
+        digest = hashlib.sha256(f"{prompt}|{max_sequence_length}".encode("utf-8")).hexdigest()
+        return digest, digest, None
+
+    def load_lora_weights(self, state_dict, adapter_name="default"):
+        self.adapters[adapter_name] = state_dict
+
+    def delete_adapters(self, names):
+        for name in [names] if isinstance(names, str) else names:
+            self.adapters.pop(name, None)
+
+    def set_adapters(self, names, adapter_weights=None):
+        self.active_adapters = list(names)
+
+    def enable_lora(self):
+        pass
+
+    def disable_lora(self):
+        self.active_adapters = []
+
+    def fuse_lora(self, adapter_names=None, lora_scale=1.0):
+        self.fused = True
+
+    def unfuse_lora(self):
+        self.fused = False
+
+    def _simulate_step(self, latent_bytes: int, seed: int):
+        buffer = random.Random(seed).randbytes(latent_bytes)
+        for _ in range(self.work_factor):
+            buffer = hashlib.sha256(buffer).digest() * (latent_bytes // 32)
+
+    def __call__(self, prompt=None, prompt_embeds=None, pooled_prompt_embeds=None, height=1024,
+                 width=1024, guidance_scale=3.5, num_inference_steps=28, num_images_per_prompt=1,
+                 generator=None, callback_on_step_end=None, output_type="pil", **kwargs):
+        if prompt is None:
+            # Embeddings from encode_prompt are the prompt digests themselves
+            prompts = prompt_embeds if isinstance(prompt_embeds, list) else [prompt_embeds]
+        else:
+            prompts = [self.encode_prompt(prompt=p)[0] for p in (prompt if isinstance(prompt, list) else [prompt])]
+        prompts = [p for p in prompts for _ in range(num_images_per_prompt)]
+        latent_bytes = (height // _VAE_SCALE) * (width // _VAE_SCALE) * _LATENT_CHANNELS * len(prompts)
+
+        for step in range(num_inference_steps):
+            self._simulate_step(latent_bytes, step)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, num_inference_steps - step, {})
+
+        # Stand-in latents: everything that determines the decoded pixels
+        generators = generator if isinstance(generator, list) else [generator] * len(prompts)
+        latents = []
+        for p, gen in zip(prompts, generators):
+            seed = gen.initial_seed() if gen is not None else None
+            latents.append(f"{p}|{height}|{width}|{guidance_scale}|{num_inference_steps}|"
+                           f"{sorted(self.active_adapters)}|{seed}")
+        if output_type == "latent":
+            return SimpleNamespace(images=latents)
+        return SimpleNamespace(images=self.decode_latents(latents, height, width))
+
+    def decode_latents(self, latents: list, height: int, width: int) -> list:
+        """Decode stand-in latents from ``output_type="latent"`` to images."""
+        from PIL import Image
+
+        self.vae.simulate_decode(len(latents), height, width)
+        images = []
+        for material in latents:
+            noise_seed = int.from_bytes(hashlib.sha256(material.encode("utf-8")).digest()[:8], "big")
+            pixels = random.Random(noise_seed).randbytes(height * width * 3)
+            images.append(Image.frombytes("RGB", (width, height), pixels))
+        return images
@@ -0,0 +1,246 @@
+"""Parameter sweeps rendered on one loaded pipeline, with a contact sheet."""
+
+import csv
+import dataclasses
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import config, embeddings, generate, io, lora, memory, pipeline, result_cache, trace
+
+
+# Columns of the per-cell timing CSV
+CSV_FIELDS = (
+    "index", "row", "column", "lora_scale", "height", "width", "num_inference_steps",
+    "guidance_scale", "seed", "output_path", "cached", "lora_switch_seconds", "render_seconds",
+)
+
+
+def parse_resolution(text: str) -> tuple[int, int]:
+    """Parse ``HEIGHTxWIDTH`` into ``(height, width)``."""
+    try:
+        height, width = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid resolution '{text}', expected HEIGHTxWIDTH")
+    return height, width
+
+
+@dataclass
+class SweepCell:
+    """One point of the parameter grid and how it was rendered."""
+    index: int
+    row: int
+    column: int
+    config: config.GenerationConfig
+    lora_switch_seconds: float = 0.0
+    render_seconds: float = 0.0
+    cached: bool = False
+
+
+@dataclass
+class SweepReport:
+    """Cells in render order plus the paths of the sweep outputs."""
+    cells: list[SweepCell] = field(default_factory=list)
+    load_seconds: float = 0.0
+    total_seconds: float = 0.0
+    sheet_path: Path | None = None
+    csv_path: Path | None = None
+
+
+def build_sweep(base: config.GenerationConfig, guidance_scales=(), steps=(), lora_scales=(),
+                resolutions=()) -> list[SweepCell]:
+    """Expand value lists into the cells of a sweep, in render order.
+
+    Empty lists keep the value from ``base``. Every cell uses the same seed
+    (``base.seed``, or one random seed for the whole sweep) so cells differ
+    only in the swept parameters. Cells are ordered by LoRA scale, then
+    resolution, so the adapter is re-fused once per scale; the resolution
+    order alternates between scales, so the shape at a scale boundary does
+    not change either. The contact sheet has one column per guidance scale
+    and one row per remaining combination.
+    """
+    if base.num_images_per_prompt != 1:
+        raise ValueError("Sweeps render one image per cell; num_images_per_prompt must be 1")
+    lora_scales = list(lora_scales) or [base.lora_scale]
+    if len(lora_scales) > 1 and not base.lora_path:
+        raise ValueError("Sweeping lora_scale requires lora_path")
+    resolutions = list(resolutions) or [(base.height, base.width)]
+    steps = list(steps) or [base.num_inference_steps]
+    guidance_scales = list(guidance_scales) or [base.guidance_scale]
+
+    seed = base.seed if base.seed is not None else random.randrange(2 ** 32)
+    stem, suffix = Path(base.output_name).stem, Path(base.output_name).suffix or ".png"
+
+    cells = []
+    row = 0
+    for lora_index, lora_scale in enumerate(lora_scales):
+        ordered_resolutions = resolutions if lora_index % 2 == 0 else resolutions[::-1]
+        for (height, width), step_count in itertools.product(ordered_resolutions, steps):
+            for column, guidance_scale in enumerate(guidance_scales):
+                index = len(cells)
+                cells.append(SweepCell(
+                    index=index,
+                    row=row,
+                    column=column,
+                    config=dataclasses.replace(
+                        base,
+                        lora_scale=lora_scale,
+                        height=height,
+                        width=width,
+                        num_inference_steps=step_count,
+                        guidance_scale=guidance_scale,
+                        seed=seed,
+                        output_name=f"{stem}_{index:03d}{suffix}",
+                    ),
+                ))
+            row += 1
+    return cells
+
+
+class _SharedPromptEncodings:
+    """Embedding cache view that encodes a prompt once for every LoRA scale.
+
+    Only used when the adapter does not patch the text encoders, where the
+    scale cannot change the embeddings.
+    """
+
+    def __init__(self, cache: embeddings.PromptEmbeddingCache):
+        self.cache = cache
+
+    def get_or_encode(self, pipe, gen_config: config.GenerationConfig) -> tuple:
+        return self.cache.get_or_encode(pipe, dataclasses.replace(gen_config, lora_scale=1.0))
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+def _cell_label(cell_config: config.GenerationConfig) -> list[str]:
+    lines = [f"{cell_config.height}x{cell_config.width}, {cell_config.num_inference_steps} steps",
+             f"guidance {cell_config.guidance_scale:g}"]
+    if cell_config.lora_path:
+        lines[1] += f", lora {cell_config.lora_scale:g}"
+    return lines
+
+
+def contact_sheet(images: list, cells: list[SweepCell], cell_size: int = 256):
+    """Arrange cell images on a labelled grid, each scaled to fit ``cell_size``."""
+    from PIL import Image, ImageDraw
+
+    label_height = 28
+    rows = max(cell.row for cell in cells) + 1
+    columns = max(cell.column for cell in cells) + 1
+    sheet = Image.new("RGB", (columns * cell_size, rows * (cell_size + label_height)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for cell, image in zip(cells, images):
+        thumbnail = image.copy()
+        thumbnail.thumbnail((cell_size, cell_size))
+        left = cell.column * cell_size
+        top = cell.row * (cell_size + label_height)
+        sheet.paste(thumbnail, (left + (cell_size - thumbnail.width) // 2, top + (cell_size - thumbnail.height) // 2))
+        for line_index, line in enumerate(_cell_label(cell.config)):
+            draw.text((left + 4, top + cell_size + 2 + line_index * 12), line, fill="black")
+    return sheet
+
+
+def write_timings(cells: list[SweepCell], csv_path: Path):
+    """Write one CSV row per cell with its parameters and timings."""
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for cell in cells:
+            writer.writerow({
+                "index": cell.index,
+                "row": cell.row,
+                "column": cell.column,
+                "lora_scale": cell.config.lora_scale if cell.config.lora_path else "",
+                "height": cell.config.height,
+                "width": cell.config.width,
+                "num_inference_steps": cell.config.num_inference_steps,
+                "guidance_scale": cell.config.guidance_scale,
+                "seed": cell.config.seed,
+                "output_path": cell.config.output_path,
+                "cached": int(cell.cached),
+                "lora_switch_seconds": f"{cell.lora_switch_seconds:.4f}",
+                "render_seconds": f"{cell.render_seconds:.4f}",
+            })
+
+
+def run_sweep(cells: list[SweepCell], embedding_cache=None, fuse_lora: bool = True,
+              cell_size: int = 256) -> SweepReport:
+    """Render every cell on one pipeline and write the contact sheet and CSV.
+
+    The pipeline is loaded once for the whole sweep and every prompt is
+    encoded once through ``embedding_cache`` (an in-memory cache is created
+    when none is given). Cells already in the result cache are restored
+    instead of rendered. Outputs land next to the cell images as
+    ``<name>_sheet.png`` and ``<name>_timings.csv``.
+    """
+    report = SweepReport(cells=cells)
+    if not cells:
+        return report
+
+    sweep_start = time.perf_counter()
+    base = cells[0].config
+    io.ensure_output_directory(base.out_dir)
+    if embedding_cache is None:
+        embedding_cache = embeddings.PromptEmbeddingCache()
+    if base.lora_path and not lora.patches_text_encoder(base.lora_path):
+        embedding_cache = _SharedPromptEncodings(embedding_cache)
+
+    images = [None] * len(cells)
+    cache = result_cache.cache_for(base)
+    if cache is not None:
+        for cell in cells:
+            restored = cache.restore(cell.config)
+            if restored is not None:
+                from PIL import Image
+
+                with Image.open(restored) as image:
+                    image.load()
+                    images[cell.index] = image.copy()
+                cell.cached = True
+
+    pending = [cell for cell in cells if not cell.cached]
+    if pending:
+        runtime_config = generate.prepare_runtime()
+        load_start = time.perf_counter()
+        with trace.span("load_pipeline", model_id=base.model_id):
+            pipe = pipeline.load_flux_pipeline(base, runtime_config, apply_lora=False)
+        lora_manager = lora.get_lora_manager(pipe, fuse=fuse_lora)
+        report.load_seconds = time.perf_counter() - load_start
+
+        for cell in pending:
+            switch_start = time.perf_counter()
+            lora_manager.activate_for(cell.config)
+            cell.lora_switch_seconds = time.perf_counter() - switch_start
+
+            render_start = time.perf_counter()
+            (cell.config,), (image,) = memory.render_admitted(
+                pipe,
+                [cell.config],
+                lambda pipe, configs: [generate.render_image(pipe, configs[0], embedding_cache)],
+                runtime_config,
+            )
+            cell.render_seconds = time.perf_counter() - render_start
+            images[cell.index] = image
+
+            io.save_generated_image(image, cell.config.output_path, io.image_metadata(cell.config))
+            if cache is not None:
+                cache.store(cell.config, image, cell.render_seconds)
+            print(f"[{cell.index + 1}/{len(cells)}] {cell.config.output_path} in {cell.render_seconds:.2f}s")
+
+    stem = Path(base.output_name).stem.rsplit("_", 1)[0]
+    report.sheet_path = base.out_dir / f"{stem}_sheet.png"
+    io.save_generated_image(contact_sheet(images, cells, cell_size), report.sheet_path)
+    report.csv_path = base.out_dir / f"{stem}_timings.csv"
+    write_timings(cells, report.csv_path)
+
+    report.total_seconds = time.perf_counter() - sweep_start
+    print(
+        f"Swept {len(cells)} cells in {report.total_seconds:.2f}s "
+        f"(load {report.load_seconds:.2f}s, {sum(c.cached for c in cells)} cached, "
+        f"prompt encodings: {embedding_cache.stats()})"
+    )
+    return report
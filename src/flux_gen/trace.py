@@ -0,0 +1,204 @@
+"""Named timing spans with memory readings, exportable as JSON lines or Chrome trace."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from . import metrics
+
+
+class Tracer:
+    """Collects spans and denoising step events for one process.
+
+    Every span records wall time, host RSS at start and end, and the peak
+    device memory reached while it was open. Nested spans are supported per
+    thread; a child's device peak also counts towards its parents.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def _fold_device_peak(self, stack: list) -> int | None:
+        """Credit the device peak since the last fold to every open span and return it."""
+        peak = metrics.take_device_peak_memory()
+        if peak is not None:
+            for entry in stack:
+                entry["device_peak_bytes"] = max(entry["device_peak_bytes"] or 0, peak)
+        return peak
+
+    def _record(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block as a span called ``name``."""
+        stack = self._stack()
+        self._fold_device_peak(stack)
+        entry = {
+            "name": name,
+            "start_us": self._now_us(),
+            "rss_start_bytes": metrics.current_rss_bytes(),
+            "device_peak_bytes": None,
+            "depth": len(stack),
+        }
+        stack.append(entry)
+        try:
+            yield entry
+        finally:
+            self._fold_device_peak(stack)
+            stack.pop()
+            entry["duration_us"] = self._now_us() - entry["start_us"]
+            entry["rss_end_bytes"] = metrics.current_rss_bytes()
+            entry["thread"] = threading.get_ident()
+            entry.update(attrs)
+            self._record(entry)
+            self.mark()
+
+    def mark(self):
+        """Start the next denoising step measurement from now."""
+        self._local.last_mark = self._now_us()
+
+    def step_callback(self, pipe, step: int, timestep, callback_kwargs: dict) -> dict:
+        """``callback_on_step_end`` hook recording one event per denoising step."""
+        now = self._now_us()
+        start = getattr(self._local, "last_mark", now)
+        peak = self._fold_device_peak(self._stack())
+        self._record({
+            "name": "denoise_step",
+            "start_us": start,
+            "duration_us": now - start,
+            "step": step,
+            "timestep": float(timestep),
+            "rss_end_bytes": metrics.current_rss_bytes(),
+            "device_peak_bytes": peak,
+            "depth": len(self._stack()),
+            "thread": threading.get_ident(),
+        })
+        self._local.last_mark = now
+        return callback_kwargs
+
+    def write_jsonl(self, path: Path):
+        """Write one JSON object per span or step event."""
+        with open(path, "w") as f:
+            for event in sorted(self.events, key=lambda e: e["start_us"]):
+                f.write(json.dumps(event) + "\n")
+
+    def write_chrome_trace(self, path: Path):
+        """Write the Chrome trace event format (chrome://tracing, Perfetto)."""
+        trace_events = []
+        for event in self.events:
+            args = {k: v for k, v in event.items() if k not in ("name", "start_us", "duration_us", "thread", "depth")}
+            trace_events.append({
+                "name": event["name"],
+                "cat": "step" if event["name"] == "denoise_step" else "stage",
+                "ph": "X",
+                "ts": event["start_us"],
+                "dur": event["duration_us"],
+                "pid": os.getpid(),
+                "tid": event["thread"],
+                "args": args,
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    def write(self, path):
+        """Write ``.jsonl`` paths as JSON lines and anything else as a Chrome trace."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".jsonl":
+            self.write_jsonl(path)
+        else:
+            self.write_chrome_trace(path)
+        print(f"Saved trace: {path}")
+
+
+_TRACER: Tracer | None = None
+
+
+def start() -> Tracer:
+    """Start collecting spans in this process."""
+    global _TRACER
+    _TRACER = Tracer()
+    return _TRACER
+
+
+def stop() -> Tracer | None:
+    """Stop collecting and return the tracer with its events."""
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    return tracer
+
+
+def active() -> Tracer | None:
+    """The running tracer, or None when tracing is off."""
+    return _TRACER
+
+
+def span(name: str, **attrs):
+    """Span on the running tracer, or a no-op context when tracing is off."""
+    if _TRACER is None:
+        return contextlib.nullcontext()
+    return _TRACER.span(name, **attrs)
+
+
+def pipeline_kwargs() -> dict:
+    """Extra pipeline call arguments: the step callback when tracing is on."""
+    if _TRACER is None:
+        return {}
+    _TRACER.mark()
+    return {"callback_on_step_end": _TRACER.step_callback}
+
+
+@contextlib.contextmanager
+def instrument_pipeline(pipe):
+    """Wrap ``encode_prompt`` and ``vae.decode`` of a pipeline in spans while tracing.
+
+    The originals are restored on exit, so an untraced pipeline is never
+    modified.
+    """
+    if _TRACER is None:
+        yield pipe
+        return
+
+    tracer = _TRACER
+    patched = []
+
+    def wrap(owner, attr, name):
+        original = getattr(owner, attr, None)
+        if original is None:
+            return
+
+        def traced(*args, **kwargs):
+            with tracer.span(name):
+                return original(*args, **kwargs)
+
+        own = attr in getattr(owner, "__dict__", {})
+        setattr(owner, attr, traced)
+        patched.append((owner, attr, original if own else None))
+
+    wrap(pipe, "encode_prompt", "text_encoding")
+    wrap(getattr(pipe, "vae", None), "decode", "vae_decode")
+    try:
+        yield pipe
+    finally:
+        for owner, attr, original in reversed(patched):
+            if original is None:
+                # Drop the instance attribute so the class method shows through again
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
@@ -0,0 +1,313 @@
+"""Resident generation worker with an in-process pipeline cache."""
+
+import gc
+import io as _io
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from . import compilation, config, generate, io, lora, memory, pipeline, result_cache, scheduler
+
+
+def estimate_pipeline_bytes(pipe) -> int:
+    """Estimate the memory held by a pipeline's model components."""
+    components = getattr(pipe, "components", None)
+    if not isinstance(components, dict):
+        return 0
+
+    total = 0
+    for component in components.values():
+        parameters = getattr(component, "parameters", None)
+        if not callable(parameters):
+            continue
+        for param in parameters():
+            total += param.numel() * param.element_size()
+    return total
+
+
+def _load_base_pipeline(gen_config, runtime_config):
+    return pipeline.load_flux_pipeline(gen_config, runtime_config, apply_lora=False)
+
+
+def _release_device_memory():
+    """Collect an evicted pipeline and return its device memory."""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# Fields naming paths the server writes to or loads models from; requests cannot override them
+SERVER_PATH_FIELDS = (
+    "out_dir",
+    "trace_out",
+    "snapshot_dir",
+    "shared_weights_dir",
+    "quantized_cache_dir",
+    "compile_cache_dir",
+    "result_cache_dir",
+)
+
+
+class PipelineCache:
+    """LRU cache of loaded pipelines bounded by an estimated memory budget.
+
+    Pipelines are keyed by ``pipeline.pipeline_cache_key`` without LoRA
+    settings; adapters are swapped per request by ``lora.LoraManager``. When
+    the total
+    estimated size exceeds ``memory_budget_bytes`` the least recently used
+    pipelines are evicted; the most recently loaded one is always kept even
+    if it alone exceeds the budget.
+    """
+
+    def __init__(self, memory_budget_bytes: int | None = None, loader=None, sizer=None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._loader = loader or _load_base_pipeline
+        self._sizer = sizer or estimate_pipeline_bytes
+        self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        """Estimated memory held by all cached pipelines."""
+        return sum(size for _, size in self._entries.values())
+
+    def get(self, gen_config: config.GenerationConfig, runtime_config: config.RuntimeConfig):
+        """Return a pipeline for the config, loading it on a miss."""
+        key = pipeline.pipeline_cache_key(gen_config, include_lora=False)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+            self.misses += 1
+            pipe = self._loader(gen_config, runtime_config)
+            self._entries[key] = (pipe, self._sizer(pipe))
+            self._evict()
+            return pipe
+
+    def _evict(self):
+        """Evict least recently used pipelines until within budget."""
+        if self.memory_budget_bytes is None:
+            return
+        while len(self._entries) > 1 and self.total_bytes > self.memory_budget_bytes:
+            key, (pipe, size) = self._entries.popitem(last=False)
+            self.evictions += 1
+            print(f"Evicting cached pipeline {key[0]} ({size / 1024 ** 3:.1f} GiB)")
+            del pipe
+            _release_device_memory()
+
+    def stats(self) -> dict:
+        """Return cache counters for health reporting."""
+        return {
+            "pipelines": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class GenerationWorker:
+    """Renders GenerationConfig payloads on cached pipelines.
+
+    Requests go through a BatchScheduler, which serializes pipeline calls and
+    merges concurrent requests with matching shapes into one batched call.
+    """
+
+    def __init__(self, defaults: config.GenerationConfig, cache: PipelineCache | None = None,
+                 runtime_config: config.RuntimeConfig | None = None,
+                 max_batch_size: int = 1, max_wait_seconds: float = 0.0, embedding_cache=None,
+                 fuse_lora: bool = True):
+        self.defaults = defaults
+        self.embedding_cache = embedding_cache
+        self.fuse_lora = fuse_lora
+        self.cache = cache if cache is not None else PipelineCache()
+        self.runtime_config = runtime_config or generate.prepare_runtime()
+        self.scheduler = scheduler.BatchScheduler(
+            self._render_batch, max_batch_size, max_wait_seconds, batch_limit=self._batch_limit,
+        )
+
+    def config_from_payload(self, payload: dict) -> config.GenerationConfig:
+        """Build the job config from a request payload over the defaults.
+
+        Clients choose only the file name of the output; where files are
+        written stays under the server's control.
+        """
+        server_only = sorted(set(payload) & set(SERVER_PATH_FIELDS))
+        if server_only:
+            raise ValueError(f"Fields set by the server cannot be sent in requests: {', '.join(server_only)}")
+        output_name = payload.get("output_name")
+        if output_name and (Path(str(output_name)).name != output_name or output_name in (".", "..")):
+            raise ValueError(f"output_name must be a plain file name, got '{output_name}'")
+        gen_config = self.defaults.with_overrides(payload)
+        if gen_config.num_images_per_prompt != 1:
+            raise ValueError("num_images_per_prompt is not supported by the worker; send one request per seed")
+        if not payload.get("output_name"):
+            gen_config = gen_config.with_overrides({"output_name": f"worker_{uuid.uuid4().hex}.png"})
+        return gen_config
+
+    def _batch_limit(self, gen_config: config.GenerationConfig) -> int:
+        """Largest batch of this shape predicted to fit in device memory."""
+        return memory.max_batch_size(gen_config, self.runtime_config, self.scheduler.max_batch_size)
+
+    def _render_batch(self, gen_configs: list[config.GenerationConfig]) -> list:
+        pipe = self.cache.get(gen_configs[0], self.runtime_config)
+        # Batches share a bucket key, so they all need the same adapter state
+        lora.get_lora_manager(pipe, fuse=self.fuse_lora).activate_for(gen_configs[0])
+        start = time.perf_counter()
+        gen_configs, images = memory.render_admitted(
+            pipe,
+            gen_configs,
+            lambda pipe, configs: generate.render_batch(pipe, configs, self.embedding_cache),
+            self.runtime_config,
+        )
+        seconds = (time.perf_counter() - start) / len(gen_configs)
+        for gen_config, image in zip(gen_configs, images):
+            cache = result_cache.cache_for(gen_config)
+            if cache is not None:
+                cache.store(gen_config, image, seconds)
+        return images
+
+    def warm_up(self, shapes: list[tuple[int, int, int]]) -> list:
+        """Load the default pipeline and compile the given shapes before serving.
+
+        Only applies when the defaults enable ``compile``; returns the
+        ``compilation.WarmupTiming`` of each shape.
+        """
+        if not self.defaults.compile or not shapes:
+            return []
+        pipe = self.cache.get(self.defaults, self.runtime_config)
+        return compilation.warm_up(pipe, self.defaults, shapes)
+
+    def result_cache_stats(self) -> dict | None:
+        """Result cache counters for the default cache directory."""
+        cache = result_cache.cache_for(self.defaults)
+        return cache.stats() if cache is not None else None
+
+    def render(self, gen_config: config.GenerationConfig):
+        """Render a config and return the generated image.
+
+        Seeded requests that match an earlier result are answered from the
+        result cache without queueing.
+        """
+        cache = result_cache.cache_for(gen_config)
+        cached = cache.lookup(gen_config) if cache is not None else None
+        if cached is not None:
+            from PIL import Image
+
+            with Image.open(cached) as image:
+                image.load()
+                return image.copy()
+        return self.scheduler.submit(gen_config).result()
+
+
+class _WorkerRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end for a GenerationWorker."""
+
+    worker: GenerationWorker = None
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "cache": self.worker.cache.stats(),
+                "scheduler": self.worker.scheduler.stats(),
+                "embeddings": self.worker.embedding_cache.stats() if self.worker.embedding_cache is not None else None,
+                "results": self.worker.result_cache_stats(),
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object")
+            return_bytes = payload.pop("return", "path") == "bytes"
+            gen_config = self.worker.config_from_payload(payload)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            start = time.perf_counter()
+            image = self.worker.render(gen_config)
+            seconds = time.perf_counter() - start
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        metadata = io.image_metadata(gen_config) if gen_config.seed is not None else None
+        if return_bytes:
+            buffer = _io.BytesIO()
+            image.save(buffer, format="PNG", pnginfo=io.png_info(metadata) if metadata else None)
+            data = buffer.getvalue()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-Render-Seconds", f"{seconds:.3f}")
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            io.ensure_output_directory(gen_config.out_dir)
+            io.save_generated_image(image, gen_config.output_path, metadata)
+            self._send_json(200, {"output_path": str(gen_config.output_path), "seconds": seconds})
+
+    def log_message(self, format, *args):
+        print(f"worker: {self.address_string()} {format % args}")
+
+
+def make_server(worker: GenerationWorker, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Create an HTTP server bound to ``host:port`` serving ``worker``."""
+    handler = type("WorkerRequestHandler", (_WorkerRequestHandler,), {"worker": worker})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(defaults: config.GenerationConfig, host: str, port: int, memory_budget_bytes: int | None = None,
+          max_batch_size: int = 1, max_wait_seconds: float = 0.0, embedding_cache=None,
+          fuse_lora: bool = True, warmup_shapes=()):
+    """Run the worker HTTP server until interrupted."""
+    worker = GenerationWorker(
+        defaults,
+        PipelineCache(memory_budget_bytes),
+        max_batch_size=max_batch_size,
+        max_wait_seconds=max_wait_seconds,
+        embedding_cache=embedding_cache,
+        fuse_lora=fuse_lora,
+    )
+    worker.warm_up(warmup_shapes)
+    server = make_server(worker, host, port)
+    print(f"Generation worker listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker.scheduler.stop()
@@ -0,0 +1,64 @@
+"""FLUX batch generation CLI wrapper."""
+
+from flux_gen.batch import read_manifest, run_batch
+from flux_gen.cli import parse_batch_args
+from flux_gen.embeddings import make_embedding_cache
+from flux_gen.io import ImageWriter
+from flux_gen.jobstore import JobStore, run_store
+from flux_gen.pool import WorkerPool, detect_slots
+
+
+def main():
+    """Entry point for rendering a manifest of FLUX jobs."""
+    args = parse_batch_args()
+    jobs = read_manifest(args.manifest, args.defaults)
+    writer_options = dict(
+        output_format=args.output_format,
+        png_compress_level=args.png_compress_level,
+        quality=args.image_quality,
+        max_workers=args.writer_threads,
+        max_pending=args.writer_queue_size,
+    )
+    if args.devices:
+        with WorkerPool(
+            detect_slots(args.devices),
+            fuse_lora=args.fuse_lora,
+            embedding_cache_size=args.embedding_cache_size,
+            embedding_cache_dir=args.embedding_cache_dir,
+            writer_options=writer_options,
+        ) as pool:
+            report = pool.run(jobs)
+        if report.failures:
+            raise SystemExit(f"{len(report.failures)} of {len(jobs)} jobs failed")
+        return
+
+    if args.job_store:
+        with JobStore(args.job_store, lease_seconds=args.lease_seconds) as store, \
+                ImageWriter(**writer_options) as writer:
+            store.submit(jobs)
+            run_store(
+                store,
+                worker_name=args.worker_name,
+                embedding_cache=make_embedding_cache(args.embedding_cache_size, args.embedding_cache_dir),
+                fuse_lora=args.fuse_lora,
+                writer=writer,
+            )
+            counts = store.counts()
+        if counts["failed"]:
+            raise SystemExit(f"{counts['failed']} jobs in {args.job_store} failed")
+        if counts["queued"] or counts["running"]:
+            raise SystemExit(f"{counts['queued'] + counts['running']} jobs in {args.job_store} are unfinished")
+        return
+
+    with ImageWriter(**writer_options) as writer:
+        run_batch(
+            jobs,
+            embedding_cache=make_embedding_cache(args.embedding_cache_size, args.embedding_cache_dir),
+            fuse_lora=args.fuse_lora,
+            writer=writer,
+            staged_queue_size=args.staged_queue_size,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""FLUX parameter sweep CLI wrapper."""
+
+from flux_gen.cli import parse_sweep_args
+from flux_gen.embeddings import make_embedding_cache
+from flux_gen.sweep import build_sweep, run_sweep
+
+
+def main():
+    """Entry point for rendering a parameter grid of one prompt."""
+    args = parse_sweep_args()
+    cells = build_sweep(
+        args.base,
+        guidance_scales=args.guidance_scales,
+        steps=args.steps,
+        lora_scales=args.lora_scales,
+        resolutions=args.resolutions,
+    )
+    run_sweep(
+        cells,
+        embedding_cache=make_embedding_cache(args.embedding_cache_size, args.embedding_cache_dir),
+        fuse_lora=args.fuse_lora,
+        cell_size=args.cell_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""FLUX model snapshot CLI wrapper."""
+
+import dataclasses
+import os
+
+from flux_gen.cli import parse_prefetch_args
+
+
+def main():
+    """Entry point for materializing a pinned model revision locally."""
+    args = parse_prefetch_args()
+    gen_config = args.config
+
+    from flux_gen import snapshot
+
+    if args.verify:
+        root = gen_config.snapshot_dir or snapshot.default_snapshot_dir(gen_config.model_id, gen_config.model_revision)
+        manifest = snapshot.verify_snapshot(root, gen_config.model_id, gen_config.model_revision,
+                                            full=True, max_workers=args.max_workers)
+        print(f"Snapshot {root} is intact ({len(manifest['files'])} files, commit {manifest['commit']})")
+        return
+
+    root = snapshot.prefetch(gen_config.model_id, gen_config.model_revision, gen_config.snapshot_dir,
+                             token=os.getenv("HF_TOKEN"), max_workers=args.max_workers)
+    print(f"Start without the hub using: --snapshot_dir {root}")
+    if args.compare_cold_start:
+        from flux_gen.generate import prepare_runtime
+
+        snapshot.compare_cold_start(dataclasses.replace(gen_config, snapshot_dir=str(root)), prepare_runtime(), root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""FLUX resident worker CLI wrapper."""
+
+from flux_gen.cli import parse_worker_args
+from flux_gen.embeddings import make_embedding_cache
+from flux_gen.worker import serve
+
+
+def main():
+    """Entry point for the resident FLUX generation worker."""
+    args = parse_worker_args()
+    serve(
+        args.defaults,
+        args.host,
+        args.port,
+        memory_budget_bytes=args.memory_budget_bytes,
+        max_batch_size=args.max_batch_size,
+        max_wait_seconds=args.max_wait_seconds,
+        embedding_cache=make_embedding_cache(args.embedding_cache_size, args.embedding_cache_dir),
+        fuse_lora=args.fuse_lora,
+        warmup_shapes=args.warmup_shapes,
+    )
+
+
+if __name__ == "__main__":
+    main()
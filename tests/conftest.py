@@ -6,3 +6,20 @@ from pathlib import Path
 # Add src to Python path for imports
 src_path = Path(__file__).parent.parent / "src"
 sys.path.insert(0, str(src_path))
+
+
+def make_config(**overrides):
+    """GenerationConfig with small test defaults; keyword arguments override fields."""
+    from flux_gen.config import GenerationConfig
+
+    values = dict(
+        model_id="test/model",
+        prompt="test prompt",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=Path("/tmp/test_outputs"),
+    )
+    values.update(overrides)
+    return GenerationConfig(**values)
@@ -0,0 +1,116 @@
+"""Tests for attention backend selection."""
+
+from functools import partial
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from flux_gen import attention
+from conftest import make_config
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path):
+    attention._RESOLVED.clear()
+    with patch.dict('os.environ', {'FLUX_GEN_CACHE_DIR': str(tmp_path)}):
+        yield tmp_path
+    attention._RESOLVED.clear()
+
+
+_config = partial(make_config, height=1024, width=1024)
+
+
+def _fake_torch():
+    torch = MagicMock()
+    torch.__version__ = "2.5.0"
+    torch.cuda.is_available.return_value = True
+    torch.cuda.get_device_name.return_value = "RTX 4090"
+    return torch
+
+
+def test_flux_sequence_length():
+    """Test the joint text+image sequence length at common resolutions."""
+    assert attention.flux_sequence_length(1024, 1024) == 4096 + 512
+    assert attention.flux_sequence_length(768, 768) == 2304 + 512
+
+
+def test_backend_for_explicit_and_forced():
+    """Test explicit backends and the math override from the environment."""
+    assert attention.backend_for(_config(attention_backend="flash")) == "flash"
+    with pytest.raises(ValueError):
+        attention.backend_for(_config(attention_backend="xformers"))
+    with patch.dict('os.environ', {'DIFFUSERS_FORCE_ATTENTION_BACKEND': 'math'}):
+        assert attention.backend_for(_config()) == "math"
+
+
+def test_backend_for_benchmarks_once_and_caches(_isolated_cache):
+    """Test that the fastest working backend is cached per device and resolution."""
+    timings = {"flash": 0.002, "efficient": 0.003, "cudnn": None, "math": 0.010}
+
+    with patch('flux_gen.attention._torch', return_value=_fake_torch()), \
+         patch('flux_gen.attention.benchmark_backends', return_value=timings) as mock_bench:
+        assert attention.backend_for(_config()) == "flash"
+        assert attention.backend_for(_config()) == "flash"
+        mock_bench.assert_called_once()
+
+        # A new process reads the winner from the cache file
+        attention._RESOLVED.clear()
+        assert attention.backend_for(_config()) == "flash"
+        mock_bench.assert_called_once()
+
+        attention.backend_for(_config(height=768, width=768))
+        assert mock_bench.call_count == 2
+
+    entries = json.loads((_isolated_cache / "attention_backends.json").read_text())
+    assert entries["cuda:RTX 4090|torch-2.5.0|default|1024x1024"]["backend"] == "flash"
+
+
+def test_backend_for_is_keyed_by_dtype_and_skips_stub():
+    """Test that each dtype gets its own benchmark and stub models get none."""
+    timings = {"flash": 0.002, "efficient": 0.003, "cudnn": None, "math": 0.010}
+
+    with patch('flux_gen.attention._torch', return_value=_fake_torch()), \
+         patch('flux_gen.pipeline.resolve_torch_dtype'), \
+         patch('flux_gen.attention.benchmark_backends', return_value=timings) as mock_bench:
+        attention.backend_for(_config(dtype="bf16"))
+        attention.backend_for(_config(dtype="fp16"))
+        assert mock_bench.call_count == 2
+
+        assert attention.backend_for(_config(model_id="stub:")) == "math"
+        assert mock_bench.call_count == 2
+
+
+def test_backend_for_falls_back_to_math():
+    """Test that math is chosen when every faster backend fails."""
+    timings = {"flash": None, "efficient": None, "cudnn": None, "math": 0.010}
+    with patch('flux_gen.attention._torch', return_value=_fake_torch()), \
+         patch('flux_gen.attention.benchmark_backends', return_value=timings):
+        assert attention.backend_for(_config()) == "math"
+
+
+def test_run_with_backend_retries_with_math():
+    """Test that a kernel failure at run time retries under math."""
+    contexts = []
+
+    def fake_context(backend):
+        contexts.append(backend)
+        return MagicMock()
+
+    fn = MagicMock(side_effect=[RuntimeError("No available kernel. Aborting execution."), "image"])
+    with patch('flux_gen.attention.attention_context', side_effect=fake_context):
+        assert attention.run_with_backend(_config(attention_backend="flash"), fn) == "image"
+
+    assert contexts == ["flash", "math"]
+
+    # An auto-selected backend that fails stays disabled for later processes
+    with patch('flux_gen.attention._torch', return_value=_fake_torch()), \
+         patch('flux_gen.attention.benchmark_backends', return_value={"flash": 0.002, "math": 0.010}), \
+         patch('flux_gen.attention.attention_context', side_effect=fake_context):
+        fn = MagicMock(side_effect=[RuntimeError("No available kernel. Aborting execution."), "image"])
+        assert attention.run_with_backend(_config(), fn) == "image"
+        attention._RESOLVED.clear()
+        assert attention.backend_for(_config()) == "math"
+
+    fn = MagicMock(side_effect=RuntimeError("CUDA out of memory"))
+    with patch('flux_gen.attention.attention_context', side_effect=fake_context):
+        with pytest.raises(RuntimeError, match="out of memory"):
+            attention.run_with_backend(_config(attention_backend="flash"), fn)
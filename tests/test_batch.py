@@ -0,0 +1,145 @@
+"""Tests for batch manifest rendering."""
+
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen.config import GenerationConfig, RuntimeConfig
+from flux_gen.batch import read_manifest, run_batch
+
+
+def _defaults(out_dir):
+    return GenerationConfig(
+        model_id="test/model",
+        prompt="default prompt",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=out_dir
+    )
+
+
+def test_read_manifest_jsonl(tmp_path):
+    """Test that JSONL rows override defaults and get unique output names."""
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text(
+        json.dumps({"prompt": "a cat", "height": 768}) + "\n"
+        + "\n"
+        + json.dumps({"prompt": "a dog", "output_name": "dog.png", "lora_path": "/l.safetensors"}) + "\n"
+    )
+
+    jobs = read_manifest(manifest, _defaults(tmp_path))
+
+    assert len(jobs) == 2
+    assert jobs[0].prompt == "a cat"
+    assert jobs[0].height == 768
+    assert jobs[0].width == 512
+    assert jobs[0].output_path == tmp_path / "job_0000.png"
+    assert jobs[1].output_path == tmp_path / "dog.png"
+    assert jobs[1].lora_path == "/l.safetensors"
+
+
+def test_read_manifest_csv_coerces_types(tmp_path):
+    """Test that CSV values are converted to the config field types."""
+    manifest = tmp_path / "jobs.csv"
+    manifest.write_text(
+        "prompt,width,guidance_scale,lora_scale,out_dir\n"
+        "a cat,1024,3.5,,other\n"
+    )
+
+    jobs = read_manifest(manifest, _defaults(tmp_path))
+
+    assert jobs[0].width == 1024
+    assert jobs[0].guidance_scale == 3.5
+    assert jobs[0].lora_scale == 1.0  # empty cell keeps default
+    assert jobs[0].out_dir == Path("other")
+
+
+def test_read_manifest_unknown_field(tmp_path):
+    """Test that unknown manifest columns are rejected."""
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text(json.dumps({"prompt": "a cat", "sampler": "euler"}) + "\n")
+
+    with pytest.raises(ValueError) as exc_info:
+        read_manifest(manifest, _defaults(tmp_path))
+
+    assert "sampler" in str(exc_info.value)
+
+
+def test_run_batch_loads_pipeline_once(tmp_path):
+    """Test that jobs sharing model and LoRA settings reuse one pipeline."""
+    defaults = _defaults(tmp_path)
+    jobs = [
+        GenerationConfig(**{**defaults.__dict__, "prompt": f"prompt {i}", "output_name": f"{i}.png"})
+        for i in range(3)
+    ]
+
+    with patch('flux_gen.generate.prepare_runtime', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.pipeline.load_flux_pipeline') as mock_load_pipe, \
+         patch('flux_gen.io.save_generated_image') as mock_save:
+
+        mock_pipe = MagicMock()
+        mock_pipe.return_value.images = [MagicMock()]
+        mock_load_pipe.return_value = mock_pipe
+
+        report = run_batch(jobs)
+
+        mock_load_pipe.assert_called_once()
+        assert mock_pipe.call_count == 3
+        saved_paths = [call.args[1] for call in mock_save.call_args_list]
+        assert saved_paths == [tmp_path / "0.png", tmp_path / "1.png", tmp_path / "2.png"]
+        assert len(report.results) == 3
+        assert report.images_per_second > 0
+
+
+def test_run_batch_hot_swaps_lora(tmp_path):
+    """Test that LoRA jobs reuse the base pipeline and are grouped by adapter."""
+    lora_file = tmp_path / "style.safetensors"
+    lora_file.write_bytes(b"weights")
+    defaults = _defaults(tmp_path)
+    jobs = [
+        GenerationConfig(**{**defaults.__dict__, "lora_path": str(lora_file), "output_name": "0.png"}),
+        GenerationConfig(**{**defaults.__dict__, "output_name": "1.png"}),
+        GenerationConfig(**{**defaults.__dict__, "lora_path": str(lora_file), "output_name": "2.png"}),
+    ]
+
+    with patch('flux_gen.generate.prepare_runtime', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.pipeline.PEFT_AVAILABLE', True), \
+         patch('flux_gen.lora.load_lora_file', return_value=MagicMock(alpha_scale=1.0)), \
+         patch('flux_gen.pipeline.load_flux_pipeline') as mock_load_pipe, \
+         patch('flux_gen.io.save_generated_image') as mock_save:
+
+        mock_pipe = MagicMock()
+        mock_pipe.return_value.images = [MagicMock()]
+        mock_load_pipe.return_value = mock_pipe
+
+        report = run_batch(jobs)
+
+        mock_load_pipe.assert_called_once()
+        assert mock_load_pipe.call_args.kwargs["apply_lora"] is False
+        mock_pipe.load_lora_weights.assert_called_once()
+        # Base-model job first, then both LoRA jobs with a single switch
+        assert [call.args[1].name for call in mock_save.call_args_list] == ["1.png", "0.png", "2.png"]
+        assert mock_pipe.fuse_lora.call_count == 1
+        assert sorted(result.index for result in report.results) == [0, 1, 2]
+
+
+def test_run_batch_with_background_writer(tmp_path):
+    """Test that a writer receives every image and is flushed before returning."""
+    defaults = _defaults(tmp_path)
+    jobs = [
+        GenerationConfig(**{**defaults.__dict__, "model_id": "stub:", "height": 32, "width": 32,
+                            "num_inference_steps": 1, "prompt": f"prompt {i}", "output_name": f"{i}.png"})
+        for i in range(3)
+    ]
+
+    from flux_gen.io import ImageWriter
+
+    with patch('flux_gen.generate.prepare_runtime', return_value=RuntimeConfig(hf_token=None, has_cuda=False)):
+        with ImageWriter("webp", max_workers=2, max_pending=1) as writer:
+            report = run_batch(jobs, writer=writer)
+
+    assert [result.output_path for result in report.results] == [tmp_path / f"{i}.webp" for i in range(3)]
+    assert all(result.output_path.exists() for result in report.results)
+    assert writer.stats.images == 3
@@ -0,0 +1,80 @@
+"""Tests for the benchmark harness and the stub pipeline."""
+
+import pytest
+from unittest.mock import patch
+from pathlib import Path
+from flux_gen import benchmark
+from flux_gen.config import GenerationConfig, RuntimeConfig
+from flux_gen.pipeline import load_flux_pipeline
+from flux_gen.stub import StubFluxPipeline
+
+
+def test_percentile_and_summarize():
+    """Test interpolated percentiles."""
+    samples = [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert benchmark.percentile(samples, 50) == 3.0
+    assert benchmark.percentile(samples, 95) == pytest.approx(4.8)
+    assert benchmark.summarize([2.0])["p95"] == 2.0
+
+
+def test_stub_pipeline_is_deterministic():
+    """Test that the stub renders identical pixels for identical calls."""
+    pipe = StubFluxPipeline()
+    first = pipe(prompt="a cat", height=64, width=96, num_inference_steps=2).images[0]
+    second = pipe(prompt="a cat", height=64, width=96, num_inference_steps=2).images[0]
+    other = pipe(prompt="a dog", height=64, width=96, num_inference_steps=2).images[0]
+
+    assert first.size == (96, 64)
+    assert first.tobytes() == second.tobytes()
+    assert first.tobytes() != other.tobytes()
+    assert len(pipe(prompt=["a", "b"], height=64, width=64, num_inference_steps=1).images) == 2
+
+
+def test_load_flux_pipeline_stub_model():
+    """Test that stub: model IDs bypass diffusers."""
+    gen_config = GenerationConfig(
+        model_id="stub:3",
+        prompt="test prompt",
+        height=64,
+        width=64,
+        guidance_scale=0.0,
+        num_inference_steps=1,
+        out_dir=Path("/tmp/test_outputs")
+    )
+    pipe = load_flux_pipeline(gen_config, RuntimeConfig(hf_token=None, has_cuda=False))
+    assert isinstance(pipe, StubFluxPipeline)
+    assert pipe.work_factor == 3
+
+
+def test_run_benchmarks_stub(tmp_path):
+    """Test a small stub matrix end to end, with LoRA cases skipped."""
+    cases = benchmark.build_matrix(resolutions=[(64, 64)], steps=[2], batch_sizes=[1, 2], lora=[False, True])
+    with patch('flux_gen.device.detect_and_report_device'):
+        results = benchmark.run_benchmarks(
+            "stub", cases, repeats=3, out_dir=tmp_path,
+            runtime_config=RuntimeConfig(hf_token=None, has_cuda=False),
+        )
+
+    single = results["cases"]["64x64-steps2-batch1-lora_off"]
+    assert single["render_seconds"]["samples"] == 3
+    assert single["end_to_end_seconds"]["samples"] == 3
+    assert single["peak_rss_bytes"] > 0
+    batched = results["cases"]["64x64-steps2-batch2-lora_off"]
+    assert batched["save_seconds"]["samples"] == 6
+    assert "end_to_end_seconds" not in batched
+    assert results["cases"]["64x64-steps2-batch1-lora_on"] == {"skipped": "LoRA unavailable"}
+    assert (tmp_path / "64x64-steps2-batch2-lora_off-1.png").exists()
+
+
+def test_compare_flags_regressions():
+    """Test that only slowdowns above threshold and noise floor are flagged."""
+    def case(p50, p95, rss):
+        return {"render_seconds": {"p50": p50, "p95": p95}, "peak_rss_bytes": rss}
+
+    baseline = {"cases": {"a": case(1.0, 1.2, 1000), "b": case(0.0001, 0.0001, 1000), "c": {"skipped": "x"}}}
+    current = {"cases": {"a": case(1.05, 1.5, 1200), "b": case(0.0005, 0.0005, 1000), "c": case(9, 9, 9)}}
+
+    regressions = benchmark.compare(baseline, current, threshold=0.10)
+
+    assert [(r.case, r.metric) for r in regressions] == [("a", "render_seconds.p95"), ("a", "peak_rss_bytes")]
+    assert regressions[0].change == pytest.approx(0.25)
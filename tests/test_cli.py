@@ -2,7 +2,7 @@
 
 import pytest
 from pathlib import Path
-from flux_gen.cli import parse_args, MODEL_ID
+from flux_gen.cli import parse_args, parse_sweep_args, MODEL_ID
 
 
 def test_parse_args_defaults():
@@ -96,3 +96,75 @@ def test_parse_args_with_lora_trigger():
         assert config.lora_trigger_word == 'alina-face'
     finally:
         sys.argv = original_argv
+
+
+def test_parse_args_offload():
+    """Test that the offload strategy is parsed into the config."""
+    import sys
+    original_argv = sys.argv
+    try:
+        sys.argv = ['generate.py']
+        assert parse_args().offload == "model"
+
+        sys.argv = ['generate.py', '--offload', 'auto']
+        assert parse_args().offload == "auto"
+    finally:
+        sys.argv = original_argv
+
+
+def test_parse_args_compile():
+    """Test that compile flags are parsed into the config."""
+    import sys
+    original_argv = sys.argv
+    try:
+        sys.argv = ['generate.py']
+        assert parse_args().compile is False
+
+        sys.argv = ['generate.py', '--compile', '--compile_cache_dir', '/tmp/compile']
+        config = parse_args()
+        assert config.compile is True
+        assert config.compile_cache_dir == '/tmp/compile'
+    finally:
+        sys.argv = original_argv
+
+
+def test_parse_args_seed_range():
+    """Test that a seed range sets the base seed and the variant count."""
+    import sys
+    original_argv = sys.argv
+    try:
+        sys.argv = ['generate.py', '--seed_range', '100-103']
+        config = parse_args()
+        assert config.seed == 100
+        assert config.num_images_per_prompt == 4
+
+        sys.argv = ['generate.py', '--seed', '5', '--num_images_per_prompt', '2']
+        config = parse_args()
+        assert (config.seed, config.num_images_per_prompt) == (5, 2)
+
+        sys.argv = ['generate.py', '--seed_range', '9-3']
+        with pytest.raises(SystemExit):
+            parse_args()
+    finally:
+        sys.argv = original_argv
+
+
+def test_parse_sweep_args():
+    """Test that sweep value lists are parsed per type."""
+    import sys
+    original_argv = sys.argv
+    try:
+        sys.argv = ['generate_sweep.py', '--guidance_scales', '2,3.5', '--steps', '4,8',
+                    '--resolutions', '768x768,1024x768']
+        args = parse_sweep_args()
+        assert args.guidance_scales == [2.0, 3.5]
+        assert args.steps == [4, 8]
+        assert args.resolutions == [(768, 768), (1024, 768)]
+        assert args.lora_scales == []
+        assert args.base.output_name == "sweep.png"
+
+        sys.argv = ['generate_sweep.py', '--steps', '4,many']
+        with pytest.raises(SystemExit):
+            parse_sweep_args()
+    finally:
+        sys.argv = original_argv
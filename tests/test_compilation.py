@@ -0,0 +1,79 @@
+"""Tests for compile and warm-up support."""
+
+from functools import partial
+import json
+import sys
+import pytest
+from unittest.mock import patch, MagicMock
+from flux_gen import compilation
+from flux_gen.cli import parse_worker_args
+from conftest import make_config
+
+
+_config = partial(make_config, height=1024, width=1024, num_inference_steps=4, compile=True)
+
+
+def test_parse_warmup_shapes():
+    """Test parsing of HEIGHTxWIDTH[xBATCH] lists."""
+    assert compilation.parse_warmup_shapes("768x768, 1024x1024x2") == [(768, 768, 1), (1024, 1024, 2)]
+    assert compilation.parse_warmup_shapes(None) == []
+    with pytest.raises(ValueError):
+        compilation.parse_warmup_shapes("1024")
+
+    with patch('sys.argv', ['serve.py', '--warmup_shapes', '1024']):
+        with pytest.raises(SystemExit):
+            parse_worker_args()
+
+
+def test_configure_cache_reports_cold_then_warm(tmp_path):
+    """Test that the inductor cache is redirected and its state detected."""
+    gen_config = _config(compile_cache_dir=str(tmp_path / "compile"))
+    with patch.dict('os.environ', {}), patch.dict(sys.modules, {'torch._inductor.config': None}):
+        assert compilation.configure_cache(gen_config) == "cold"
+        import os
+        assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == str(tmp_path / "compile")
+        assert os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] == "1"
+
+        # Warm-up timings and locks are not compiled artifacts
+        (tmp_path / "compile" / "warmup_timings.jsonl").write_text("{}\n")
+        (tmp_path / "compile" / "locks").mkdir()
+        (tmp_path / "compile" / "locks" / "abc.lock").write_bytes(b"")
+        assert compilation.configure_cache(gen_config) == "cold"
+
+        (tmp_path / "compile" / "fxgraph").mkdir()
+        (tmp_path / "compile" / "fxgraph" / "entry").write_bytes(b"graph")
+        assert compilation.configure_cache(gen_config) == "warm"
+
+
+def test_warm_up_times_each_shape_and_records(tmp_path):
+    """Test that every shape is rendered twice at its batch size and logged."""
+    gen_config = _config(compile_cache_dir=str(tmp_path), lora_path="/l.safetensors")
+    pipe = MagicMock()
+
+    with patch('flux_gen.compilation.compile_pipeline', return_value="cold") as mock_compile, \
+         patch('flux_gen.generate.render_batch') as mock_render:
+        timings = compilation.warm_up(pipe, gen_config, [(768, 768, 1), (1024, 1024, 2)])
+
+    mock_compile.assert_called_once_with(pipe, gen_config)
+    assert mock_render.call_count == 4
+    batch = mock_render.call_args_list[2].args[1]
+    assert len(batch) == 2
+    assert (batch[0].height, batch[0].width, batch[0].lora_path) == (1024, 1024, None)
+    assert [t.shape for t in timings] == ["768x768x1", "1024x1024x2"]
+
+    records = [json.loads(line) for line in (tmp_path / "warmup_timings.jsonl").read_text().splitlines()]
+    assert [r["cache_state"] for r in records] == ["cold", "cold"]
+    assert records[1]["batch_size"] == 2
+
+
+def test_compile_pipeline_only_once(tmp_path):
+    """Test that the transformer and VAE decoder are compiled a single time."""
+    fake_torch = MagicMock()
+    pipe = MagicMock(_flux_gen_compiled=False)
+    with patch.dict(sys.modules, {'torch': fake_torch}), \
+         patch('flux_gen.compilation.configure_cache', return_value="warm"):
+        assert compilation.compile_pipeline(pipe, _config(compile_cache_dir=str(tmp_path))) == "warm"
+        assert compilation.compile_pipeline(pipe, _config(compile_cache_dir=str(tmp_path))) == "warm"
+
+    pipe.transformer.compile.assert_called_once_with(dynamic=False)
+    fake_torch.compile.assert_called_once()
@@ -112,3 +112,27 @@ def test_runtime_config_detect_cuda():
     with patch.dict('sys.modules', {}, clear=True):
         with patch('builtins.__import__', side_effect=ImportError):
             assert RuntimeConfig._detect_cuda() is False
+
+
+def test_generation_config_with_overrides():
+    """Test that raw override values are coerced to field types."""
+    config = GenerationConfig(
+        model_id="test/model",
+        prompt="test prompt",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=Path("/tmp/test_outputs")
+    )
+
+    updated = config.with_overrides({"height": "768", "guidance_scale": "3.5", "out_dir": "other", "width": ""})
+
+    assert updated.height == 768
+    assert updated.guidance_scale == 3.5
+    assert updated.out_dir == Path("other")
+    assert updated.width == 512
+    assert config.height == 512
+
+    with pytest.raises(ValueError):
+        config.with_overrides({"sampler": "euler"})
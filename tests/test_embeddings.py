@@ -0,0 +1,104 @@
+"""Tests for the prompt embedding cache."""
+
+import pytest
+from unittest.mock import MagicMock
+from flux_gen.embeddings import PromptEmbeddingCache, embedding_cache_key, make_embedding_cache
+from flux_gen.generate import render_image
+from conftest import make_config
+
+
+
+
+def _encoding_pipe():
+    pipe = MagicMock()
+    pipe.encode_prompt.side_effect = lambda prompt, prompt_2, max_sequence_length: (
+        f"embeds:{prompt}", f"pooled:{prompt}", "text_ids"
+    )
+    return pipe
+
+
+def test_embedding_cache_key():
+    """Test that the key tracks the effective prompt, model weights and sequence length."""
+    base = embedding_cache_key(make_config())
+    assert base == embedding_cache_key(make_config(height=1024))
+    assert base != embedding_cache_key(make_config(prompt="other"))
+    assert base != embedding_cache_key(make_config(model_id="other/model"))
+    assert base != embedding_cache_key(make_config(max_sequence_length=256))
+    assert base != embedding_cache_key(make_config(dtype="bf16"))
+    assert base != embedding_cache_key(make_config(quantize="int8"))
+    assert base != embedding_cache_key(make_config(model_revision="v2"))
+    assert base != embedding_cache_key(make_config(lora_path="/l.safetensors", lora_trigger_word="tok"))
+
+
+def test_embedding_cache_hits_and_misses():
+    """Test that repeated prompts are encoded only once."""
+    pipe = _encoding_pipe()
+    cache = PromptEmbeddingCache(max_entries=4)
+
+    first = cache.get_or_encode(pipe, make_config())
+    second = cache.get_or_encode(pipe, make_config(width=1024))
+
+    assert first == second == ("embeds:test prompt", "pooled:test prompt")
+    pipe.encode_prompt.assert_called_once_with(prompt="test prompt", prompt_2=None, max_sequence_length=512)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_embedding_cache_lru_eviction():
+    """Test that the in-memory tier keeps only the most recent prompts."""
+    pipe = _encoding_pipe()
+    cache = PromptEmbeddingCache(max_entries=2)
+
+    for prompt in ["a", "b", "a", "c", "a", "b"]:
+        cache.get_or_encode(pipe, make_config(prompt=prompt))
+
+    assert len(cache) == 2
+    assert pipe.encode_prompt.call_count == 4  # "b" was evicted by "c"
+
+
+def test_embedding_cache_disk_tier(tmp_path):
+    """Test that encoded prompts survive in the safetensors tier."""
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("safetensors")
+
+    pipe = MagicMock()
+    pipe.encode_prompt.return_value = (torch.ones(1, 4, 8), torch.zeros(1, 8), None)
+    pipe._execution_device = torch.device("cpu")
+    pipe.text_encoder_2.dtype = torch.bfloat16
+    pipe.text_encoder.dtype = torch.float16
+
+    PromptEmbeddingCache(cache_dir=tmp_path).get_or_encode(pipe, make_config())
+    cache = PromptEmbeddingCache(cache_dir=tmp_path)
+    prompt_embeds, pooled_prompt_embeds = cache.get_or_encode(pipe, make_config())
+
+    assert pipe.encode_prompt.call_count == 1
+    assert cache.disk_hits == 1
+    assert torch.equal(prompt_embeds.float(), torch.ones(1, 4, 8))
+    # Disk hits come back in the encoders' dtypes, as fresh encodings would
+    assert prompt_embeds.dtype == torch.bfloat16 and pooled_prompt_embeds.dtype == torch.float16
+
+
+def test_render_image_uses_cached_embeddings():
+    """Test that the pipeline receives embeddings instead of the prompt."""
+    pipe = _encoding_pipe()
+    pipe.return_value.images = ["image"]
+    cache = PromptEmbeddingCache()
+
+    assert render_image(pipe, make_config(), cache) == "image"
+
+    pipe.assert_called_once_with(
+        prompt_embeds="embeds:test prompt",
+        pooled_prompt_embeds="pooled:test prompt",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        max_sequence_length=512,
+    )
+
+
+def test_make_embedding_cache_disabled():
+    """Test that a zero size without a directory disables caching."""
+    assert make_embedding_cache(0) is None
+    assert make_embedding_cache(8).max_entries == 8
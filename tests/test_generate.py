@@ -4,7 +4,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
 from flux_gen.config import GenerationConfig, RuntimeConfig
-from flux_gen.generate import run_generation
+from flux_gen.generate import pipeline_kwargs, run_generation
 
 
 def test_run_generation_full_cycle(tmp_path):
@@ -51,5 +51,95 @@ def test_run_generation_full_cycle(tmp_path):
             width=gen_config.width,
             guidance_scale=gen_config.guidance_scale,
             num_inference_steps=gen_config.num_inference_steps,
+            max_sequence_length=gen_config.max_sequence_length,
         )
         mock_save.assert_called_once_with(mock_image, gen_config.output_path)
+
+
+def test_variant_configs_seed_stamped_names(tmp_path):
+    """Test that variants get consecutive seeds and seed-stamped file names."""
+    from flux_gen.generate import variant_configs
+
+    gen_config = GenerationConfig(
+        model_id="test/model",
+        prompt="test prompt",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=tmp_path,
+        output_name="portrait.png",
+        seed=42,
+        num_images_per_prompt=3,
+    )
+
+    variants = variant_configs(gen_config)
+
+    assert [v.seed for v in variants] == [42, 43, 44]
+    assert [v.output_name for v in variants] == ["portrait_seed42.png", "portrait_seed43.png", "portrait_seed44.png"]
+    assert all(v.num_images_per_prompt == 1 for v in variants)
+    assert variant_configs(GenerationConfig(**{**gen_config.__dict__, "num_images_per_prompt": 1})) == [
+        GenerationConfig(**{**gen_config.__dict__, "num_images_per_prompt": 1})
+    ]
+
+
+def test_run_generation_variants_in_one_call(tmp_path):
+    """Test that variants share one pipeline call and carry their seed in PNG metadata."""
+    import json
+    from PIL import Image
+
+    gen_config = GenerationConfig(
+        model_id="test/model",
+        prompt="test prompt",
+        height=64,
+        width=64,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=tmp_path,
+        seed=7,
+        num_images_per_prompt=2,
+    )
+
+    with patch('flux_gen.env.apply_compatibility_settings'), \
+         patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'), \
+         patch('flux_gen.pipeline.load_flux_pipeline') as mock_load_pipe, \
+         patch('flux_gen.generate._generator_kwargs', return_value={"generator": ["g7", "g8"]}) as mock_generators:
+
+        mock_pipe = MagicMock()
+        mock_pipe.return_value.images = [Image.new("RGB", (64, 64)), Image.new("RGB", (64, 64), (9, 9, 9))]
+        mock_load_pipe.return_value = mock_pipe
+
+        run_generation(gen_config)
+
+    mock_pipe.assert_called_once()
+    kwargs = mock_pipe.call_args.kwargs
+    assert kwargs["prompt"] == "test prompt"
+    assert kwargs["num_images_per_prompt"] == 2
+    assert kwargs["generator"] == ["g7", "g8"]
+    assert [v.seed for v in mock_generators.call_args.args[0]] == [7, 8]
+
+    with Image.open(tmp_path / "flux_schnell_seed8.png") as saved:
+        assert saved.text["seed"] == "8"
+        assert json.loads(saved.text["parameters"])["seed"] == 8
+        assert saved.getpixel((0, 0)) == (9, 9, 9)
+
+
+def test_pipeline_kwargs_for_batches_and_variants(tmp_path):
+    """Test that one helper builds the call arguments of batches and seed variants."""
+    gen_config = GenerationConfig(
+        model_id="test/model",
+        prompt="test prompt",
+        height=512,
+        width=768,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=tmp_path,
+    )
+    expected = dict(height=512, width=768, guidance_scale=2.0, num_inference_steps=10, max_sequence_length=512)
+    assert pipeline_kwargs([gen_config, gen_config]) == expected
+
+    with patch('flux_gen.generate._generator_kwargs', return_value={"generator": ["g1", "g2"]}):
+        assert pipeline_kwargs([gen_config, gen_config], num_images_per_prompt=2) == {
+            **expected, "num_images_per_prompt": 2, "generator": ["g1", "g2"],
+        }
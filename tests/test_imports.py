@@ -0,0 +1,63 @@
+"""Import-time budget tests for the package and the CLI entry points."""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).parent.parent / "src"
+HEAVY_MODULES = ["torch", "diffusers", "peft", "transformers", "safetensors"]
+
+# Generous enough for slow CI machines, far below a torch import
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+def _run_python(code: str) -> tuple[dict, float]:
+    """Run code in a fresh interpreter, returning its JSON output and wall time."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True,
+    )
+    seconds = time.perf_counter() - start
+    return json.loads(result.stdout.strip().splitlines()[-1]), seconds
+
+
+def _heavy_loaded_snippet() -> str:
+    return f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+
+
+def test_import_flux_gen_is_light():
+    """Test that importing the package loads no heavy dependency."""
+    loaded, seconds = _run_python(
+        "import json, sys\n"
+        "import flux_gen\n"
+        "from flux_gen import config, cli\n"
+        + _heavy_loaded_snippet()
+    )
+    assert loaded == []
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+def test_cli_help_is_light():
+    """Test that --help of every entry point parses without heavy imports."""
+    for script in ("generate.py", "generate_batch.py", "generate_sweep.py", "prefetch.py", "serve.py"):
+        loaded, seconds = _run_python(
+            "import json, runpy, sys\n"
+            f"sys.argv = [{script!r}, '--help']\n"
+            "try:\n"
+            f"    runpy.run_path({script!r}, run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            + _heavy_loaded_snippet()
+        )
+        assert loaded == [], script
+        assert seconds < IMPORT_BUDGET_SECONDS, script
+
+
+def test_lazy_submodule_access():
+    """Test that submodules resolve on attribute access."""
+    import flux_gen
+
+    assert flux_gen.config.GenerationConfig.__name__ == "GenerationConfig"
+    assert "worker" in dir(flux_gen)
@@ -1,5 +1,6 @@
 """Tests for I/O operations."""
 
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
@@ -39,3 +40,75 @@ def test_save_generated_image(tmp_path):
 
         mock_image.save.assert_called_once_with(output_path)
         # Note: print is called but we can't easily test stdout capture with MagicMock
+
+
+def test_image_save_options():
+    """Test format presets and validation."""
+    from flux_gen.io import image_save_options
+
+    assert image_save_options("png", png_compress_level=1) == {"format": "PNG", "compress_level": 1}
+    assert image_save_options("webp") == {"format": "WEBP", "lossless": True}
+    assert image_save_options("jpeg", quality="balanced") == {"format": "JPEG", "quality": 85}
+    with pytest.raises(ValueError):
+        image_save_options("gif")
+    with pytest.raises(ValueError):
+        image_save_options("png", png_compress_level=12)
+
+
+def test_write_image_atomic_cleans_up_on_error(tmp_path):
+    """Test that a failed encode leaves neither the target nor a temp file."""
+    from flux_gen.io import write_image_atomic
+
+    image = MagicMock()
+    image.save.side_effect = OSError("disk full")
+    with pytest.raises(OSError):
+        write_image_atomic(image, tmp_path / "out.png", format="PNG")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_image_writer_writes_in_background(tmp_path):
+    """Test that the writer encodes every format and reports throughput."""
+    from PIL import Image
+    from flux_gen.io import ImageWriter
+
+    image = Image.new("RGB", (32, 32), (200, 10, 10))
+    for output_format, suffix in (("png", ".png"), ("webp", ".webp"), ("jpeg", ".jpg")):
+        with ImageWriter(output_format, max_workers=2, max_pending=2) as writer:
+            futures = [writer.submit(image, tmp_path / f"{output_format}_{i}.png") for i in range(5)]
+        assert [f.result() for f in futures] == [tmp_path / f"{output_format}_{i}{suffix}" for i in range(5)]
+        assert writer.stats.images == 5
+        assert writer.stats.bytes_written == sum(f.result().stat().st_size for f in futures)
+        assert writer.stats.images_per_second > 0
+
+    with Image.open(tmp_path / "webp_0.webp") as written:
+        assert written.getpixel((0, 0)) == (200, 10, 10)
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_image_writer_embeds_metadata(tmp_path):
+    """Test that metadata is kept as PNG text chunks and as EXIF in other formats."""
+    from PIL import Image
+    from flux_gen.io import EXIF_DESCRIPTION_TAG, ImageWriter
+
+    image = Image.new("RGB", (16, 16))
+    metadata = {"prompt": "a cat", "seed": "7"}
+    for output_format in ("png", "webp", "jpeg"):
+        with ImageWriter(output_format) as writer:
+            future = writer.submit(image, tmp_path / "out.png", metadata)
+        with Image.open(future.result()) as written:
+            if output_format == "png":
+                assert written.text == metadata
+            else:
+                assert json.loads(written.getexif()[EXIF_DESCRIPTION_TAG]) == metadata
+
+
+def test_image_writer_flush_raises_write_errors(tmp_path):
+    """Test that background write errors surface on flush."""
+    from flux_gen.io import ImageWriter
+
+    image = MagicMock()
+    image.save.side_effect = OSError("disk full")
+    writer = ImageWriter()
+    writer.submit(image, tmp_path / "out.png")
+    with pytest.raises(OSError, match="disk full"):
+        writer.close()
@@ -0,0 +1,128 @@
+"""Tests for the durable SQLite job store."""
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import patch
+from flux_gen.config import GenerationConfig, RuntimeConfig
+from flux_gen.jobstore import JobStore, job_id, run_store
+
+
+def _job(out_dir, **overrides):
+    return GenerationConfig(**{
+        "model_id": "stub:",
+        "prompt": "a lighthouse",
+        "height": 32,
+        "width": 32,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 2,
+        "out_dir": out_dir,
+        **overrides,
+    })
+
+
+def _run(store, **kwargs):
+    with patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'):
+        return run_store(store, worker_name="test", **kwargs)
+
+
+def test_job_id_is_stable(tmp_path):
+    """Test that IDs depend on the job's outputs, not on reporting options."""
+    assert job_id(_job(tmp_path)) == job_id(_job(tmp_path, progress=True, trace_out="t.json"))
+    assert job_id(_job(tmp_path)) != job_id(_job(tmp_path, output_name="other.png"))
+    assert job_id(_job(tmp_path)) != job_id(_job(tmp_path, seed=1))
+
+
+def test_resubmitted_manifest_skips_finished_jobs(tmp_path):
+    """Test that a second run renders nothing and failed jobs are retried on resubmit."""
+    jobs = [_job(tmp_path, prompt=f"prompt {i}", output_name=f"{i}.png") for i in range(3)]
+    jobs.append(_job(tmp_path, output_name="bad.png", vae_decode="chunked"))
+
+    with JobStore(tmp_path / "jobs.sqlite") as store:
+        ids = store.submit(jobs)
+        report = _run(store)
+        assert len(report.results) == 3
+        assert store.counts() == {"queued": 0, "running": 0, "done": 3, "failed": 1}
+
+        done = store.get(ids[0])
+        assert done.status == "done" and done.attempts == 1 and done.worker == "test"
+        assert done.outputs == [tmp_path / "0.png"] and done.seconds > 0
+        assert "chunked" in store.get(ids[3]).error
+
+    with JobStore(tmp_path / "jobs.sqlite") as store:
+        assert store.submit(jobs) == ids
+        assert store.counts() == {"queued": 1, "running": 0, "done": 3, "failed": 0}
+        with patch('flux_gen.batch.render_job') as mock_render:
+            mock_render.side_effect = RuntimeError("still broken")
+            assert _run(store).results == []
+        assert mock_render.call_count == 1
+        assert [record.job_id for record in store.jobs("failed")] == [ids[3]]
+
+
+def test_expired_lease_is_resumed(tmp_path):
+    """Test that the job of a dead worker is queued again, up to max_attempts."""
+    with JobStore(tmp_path / "jobs.sqlite", lease_seconds=0.0, max_attempts=2) as store:
+        (identifier,) = store.submit([_job(tmp_path)])
+
+        # A worker claims the job and dies without reporting back
+        assert store.claim("dead").job_id == identifier
+        assert store.counts()["running"] == 1
+
+        resumed = store.claim("alive")
+        assert resumed.job_id == identifier and resumed.attempts == 2 and resumed.worker == "alive"
+        assert not store.renew(identifier, "dead")
+
+        # The second lease also runs out: no attempts are left
+        assert store.claim("alive") is None
+        failed = store.get(identifier)
+        assert failed.status == "failed" and "expired after 2 attempts" in failed.error
+
+
+def test_lease_is_renewed_while_rendering(tmp_path):
+    """Test that a running job keeps its lease past lease_seconds."""
+    with JobStore(tmp_path / "jobs.sqlite", lease_seconds=0.3) as store:
+        store.submit([_job(tmp_path)])
+        record = store.claim("worker")
+        with store.keep_leased(record.job_id, "worker"):
+            time.sleep(0.5)
+            assert store.claim("other") is None
+        assert store.get(record.job_id).status == "running"
+
+
+def test_restart_resumes_job_of_crashed_process(tmp_path):
+    """Test that a restarted run takes over the job of a process that died mid-render."""
+    crashed = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                             capture_output=True, text=True, check=True)
+    crashed_name = f"{socket.gethostname()}:{crashed.stdout.strip()}"
+    jobs = [_job(tmp_path, prompt=f"prompt {i}", output_name=f"{i}.png") for i in range(2)]
+
+    with JobStore(tmp_path / "jobs.sqlite") as store:
+        ids = store.submit(jobs)
+        # One job is left by an earlier run of this worker name, one by a dead process
+        assert store.claim("test").job_id == ids[0]
+        assert store.claim(crashed_name).job_id == ids[1]
+
+    with JobStore(tmp_path / "jobs.sqlite") as store:
+        store.submit(jobs)
+        assert len(_run(store).results) == 2
+        assert store.counts() == {"queued": 0, "running": 0, "done": 2, "failed": 0}
+        assert [store.get(identifier).attempts for identifier in ids] == [2, 2]
+
+
+def test_run_waits_for_jobs_of_live_workers(tmp_path):
+    """Test that a run does not finish while another worker still holds a job."""
+    with JobStore(tmp_path / "jobs.sqlite") as store:
+        (identifier,) = store.submit([_job(tmp_path)])
+        store.claim("other-host:1")
+        finisher = threading.Timer(0.2, store.complete, (identifier, [tmp_path / "other.png"], 1.0))
+        finisher.start()
+
+        start = time.perf_counter()
+        assert _run(store, poll_seconds=0.01).results == []
+        finisher.join()
+
+        assert time.perf_counter() - start >= 0.2
+        assert store.get(identifier).status == "done"
@@ -0,0 +1,205 @@
+"""Tests for LoRA loading, validation and adapter management."""
+
+import json
+import struct
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen.lora import (
+    LoraManager,
+    adapter_name_for,
+    clear_lora_cache,
+    inspect_lora_file,
+    load_lora_file,
+    patches_text_encoder,
+    read_lora_config,
+    validate_against_transformer,
+)
+from conftest import make_config
+
+
+@pytest.fixture(autouse=True)
+def _peft_available():
+    clear_lora_cache()
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True), \
+         patch('flux_gen.lora._load_tensors', side_effect=lambda path: {"loaded_from": path}) as mock_load:
+        yield mock_load
+
+
+def _write_lora(path, rank=4, in_features=8, out_features=8,
+                layers=("transformer.single_transformer_blocks.0.attn.to_q",)):
+    """Write a minimal safetensors LoRA file without needing torch."""
+    header = {"__metadata__": {"format": "pt"}}
+    offset = 0
+    for layer in layers:
+        for suffix, shape in ((".lora_A.weight", [rank, in_features]), (".lora_B.weight", [out_features, rank])):
+            size = shape[0] * shape[1] * 2
+            header[layer + suffix] = {"dtype": "F16", "shape": shape, "data_offsets": [offset, offset + size]}
+            offset += size
+    raw = json.dumps(header).encode()
+    path.write_bytes(struct.pack("<Q", len(raw)) + raw + b"\0" * offset)
+    return str(path)
+
+
+
+
+def _lora_file(tmp_path, name="style.safetensors"):
+    return _write_lora(tmp_path / name)
+
+
+def test_adapter_name_for_is_stable(tmp_path):
+    """Test that adapter names are sanitized and path-specific."""
+    name = adapter_name_for(str(tmp_path / "my.style-v2.safetensors"))
+    assert name.startswith("my_style_v2_")
+    assert name == adapter_name_for(str(tmp_path / "my.style-v2.safetensors"))
+    assert name != adapter_name_for(str(tmp_path / "other" / "my.style-v2.safetensors"))
+
+
+def test_inspect_lora_file_reads_header(tmp_path):
+    """Test that rank and keys come from the header alone."""
+    info = inspect_lora_file(_write_lora(tmp_path / "a.safetensors", rank=16, in_features=32, out_features=32))
+
+    assert info.rank == 16
+    assert info.metadata == {"format": "pt"}
+    assert "transformer.single_transformer_blocks.0.attn.to_q.lora_A.weight" in info.shapes
+    assert not info.has_alpha_keys
+
+
+def test_inspect_lora_file_rejects_invalid_files(tmp_path):
+    """Test that non-LoRA, foreign and truncated files are rejected."""
+    with pytest.raises(ValueError, match="do not match a FLUX model"):
+        inspect_lora_file(_write_lora(tmp_path / "sdxl.safetensors", layers=("unet.down_blocks.0",)))
+
+    truncated = tmp_path / "truncated.safetensors"
+    truncated.write_bytes(Path(_write_lora(tmp_path / "ok.safetensors")).read_bytes()[:-10])
+    with pytest.raises(ValueError, match="outside the file"):
+        inspect_lora_file(str(truncated))
+
+    garbage = tmp_path / "garbage.safetensors"
+    garbage.write_bytes(b"weights")
+    with pytest.raises(ValueError):
+        inspect_lora_file(str(garbage))
+
+
+def test_patches_text_encoder(tmp_path):
+    """Test that only adapters with text encoder layers are reported."""
+    assert not patches_text_encoder(_write_lora(tmp_path / "unet.safetensors"))
+    assert patches_text_encoder(_write_lora(
+        tmp_path / "te.safetensors",
+        layers=("transformer.single_transformer_blocks.0.attn.to_q", "lora_te1_text_model_encoder_layers_0_mlp_fc1"),
+    ))
+
+
+def test_read_lora_config(tmp_path):
+    """Test that rank, alpha and target modules are parsed from config JSON."""
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"trigger_word": "tok", "lora": {"r": 4, "lora_alpha": 8, "target_modules": "to_q"}}))
+
+    lora_config = read_lora_config(str(config_path))
+
+    assert lora_config.rank == 4
+    assert lora_config.alpha == 8.0
+    assert lora_config.target_modules == ["to_q"]
+    assert read_lora_config(None).rank is None
+
+
+def test_load_lora_file_applies_config(tmp_path):
+    """Test that config alpha becomes a scale and a wrong rank is rejected."""
+    lora_path = _write_lora(tmp_path / "a.safetensors", rank=4)
+    config_path = tmp_path / "config.json"
+
+    config_path.write_text(json.dumps({"rank": 4, "alpha": 2}))
+    assert load_lora_file(lora_path, str(config_path)).alpha_scale == 0.5
+
+    config_path.write_text(json.dumps({"rank": 8}))
+    with pytest.raises(ValueError, match="does not match"):
+        load_lora_file(lora_path, str(config_path))
+
+
+def test_load_lora_file_is_cached(tmp_path, _peft_available):
+    """Test that repeat loads reuse tensors until the file changes."""
+    lora_path = _write_lora(tmp_path / "a.safetensors")
+
+    first = load_lora_file(lora_path)
+    second = load_lora_file(lora_path)
+    assert first.state_dict is second.state_dict
+    assert _peft_available.call_count == 1
+
+    _write_lora(tmp_path / "a.safetensors", rank=2)
+    assert load_lora_file(lora_path).info.rank == 2
+    assert _peft_available.call_count == 2
+
+
+def test_lora_cache_is_bounded(tmp_path, _peft_available):
+    """Test that only the most recently used adapters stay cached."""
+    paths = [_write_lora(tmp_path / f"{name}.safetensors") for name in "abc"]
+
+    with patch('flux_gen.lora._MAX_CACHED_ADAPTERS', 2):
+        for path in paths:
+            load_lora_file(path)
+        load_lora_file(paths[2])
+        assert _peft_available.call_count == 3
+        load_lora_file(paths[0])
+        assert _peft_available.call_count == 4
+
+
+def test_validate_against_transformer(tmp_path):
+    """Test that LoRA shapes are checked against transformer modules."""
+    info = inspect_lora_file(_write_lora(tmp_path / "a.safetensors", in_features=8))
+    transformer = MagicMock()
+
+    transformer.named_modules.return_value = [
+        ("single_transformer_blocks.0.attn.to_q", MagicMock(in_features=8, out_features=8)),
+    ]
+    validate_against_transformer(info, transformer)
+
+    transformer.named_modules.return_value = [
+        ("single_transformer_blocks.0.attn.to_q", MagicMock(in_features=3072, out_features=3072)),
+    ]
+    with pytest.raises(ValueError, match="input features"):
+        validate_against_transformer(info, transformer)
+
+    transformer.named_modules.return_value = [("other", MagicMock())]
+    with pytest.raises(ValueError, match="does not exist"):
+        validate_against_transformer(info, transformer)
+
+
+def test_manager_switches_without_reloading(tmp_path):
+    """Test that switching adapters and scales reuses loaded weights."""
+    style = _lora_file(tmp_path, "style.safetensors")
+    face = _lora_file(tmp_path, "face.safetensors")
+    pipe = MagicMock()
+    manager = LoraManager(pipe)
+
+    manager.activate_for(make_config(lora_path=style, lora_scale=0.8))
+    manager.activate_for(make_config(lora_path=face))
+    manager.activate_for(make_config(lora_path=style, lora_scale=0.5))
+    manager.activate_for(make_config(lora_path=style, lora_scale=0.5))  # no-op
+
+    assert pipe.load_lora_weights.call_count == 2
+    assert manager.switches == 3
+    pipe.set_adapters.assert_called_with([adapter_name_for(style)], adapter_weights=[0.5])
+    assert pipe.unfuse_lora.call_count == 2  # before loading "face" and before the scale change
+    assert pipe.fuse_lora.call_count == 3
+    assert manager.fused is True
+
+
+def test_manager_unfused_mode(tmp_path):
+    """Test that unfused mode never merges adapters into the weights."""
+    pipe = MagicMock()
+    manager = LoraManager(pipe, fuse=False)
+
+    manager.activate_for(make_config(lora_path=_lora_file(tmp_path), lora_scale=0.7))
+    manager.activate_for(make_config())
+
+    pipe.fuse_lora.assert_not_called()
+    pipe.unfuse_lora.assert_not_called()
+    pipe.disable_lora.assert_called()
+    assert manager.active == {}
+
+
+def test_manager_requires_peft(tmp_path):
+    """Test that loading an adapter without PEFT raises a clear error."""
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', False):
+        with pytest.raises(RuntimeError, match="PEFT library is required"):
+            LoraManager(MagicMock()).load_adapter(_lora_file(tmp_path))
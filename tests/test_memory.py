@@ -0,0 +1,132 @@
+"""Tests for memory estimates, admission control and OOM fallbacks."""
+
+from functools import partial
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen import pipeline
+from flux_gen.config import RuntimeConfig
+from flux_gen.memory import (
+    estimate_peak_bytes,
+    is_out_of_memory,
+    max_batch_size,
+    plan_admission,
+    render_admitted,
+)
+from conftest import make_config
+
+GiB = 1024 ** 3
+
+
+class OutOfMemoryError(RuntimeError):
+    """Stand-in for torch.cuda.OutOfMemoryError."""
+
+
+_config = partial(make_config, prompt="a harbour", height=1024, width=1024, guidance_scale=3.5,
+                  num_inference_steps=20, out_dir=Path("/tmp"), dtype="bf16", offload="model")
+
+
+def _runtime(free_gib):
+    return RuntimeConfig(hf_token=None, has_cuda=True, free_device_memory=int(free_gib * GiB))
+
+
+def test_estimate_grows_with_resolution_batch_and_offload():
+    """Test that the estimate follows resolution, batch size and offload mode."""
+    base = estimate_peak_bytes(_config(), 1, "model")
+
+    assert estimate_peak_bytes(_config(height=1536, width=1536), 1, "model").peak_bytes > base.peak_bytes
+    assert estimate_peak_bytes(_config(), 4, "model").denoise_bytes > base.denoise_bytes
+    assert estimate_peak_bytes(_config(), 1, "none").peak_bytes > base.peak_bytes
+    assert estimate_peak_bytes(_config(), 1, "sequential").peak_bytes < base.peak_bytes
+    # Model offload of bf16 FLUX peaks while the transformer runs
+    assert 22 * GiB < base.peak_bytes < 26 * GiB
+
+
+def test_vae_decode_modes_cap_decode_estimate():
+    """Test that slicing bounds decoder activations at one image and tiling at one tile."""
+    full = estimate_peak_bytes(_config(height=2048, width=2048), 2, "model")
+    sliced = estimate_peak_bytes(_config(height=2048, width=2048, vae_decode="sliced"), 2, "model")
+    tiled = estimate_peak_bytes(_config(height=2048, width=2048, vae_decode="tiled"), 2, "model")
+
+    assert full.decode_bytes > sliced.decode_bytes > tiled.decode_bytes
+    assert tiled.denoise_bytes == full.denoise_bytes
+    assert estimate_peak_bytes(_config(vae_decode="auto"), 2, "model").decode_bytes == \
+        estimate_peak_bytes(_config(vae_decode="sliced"), 2, "model").decode_bytes
+
+
+def test_max_batch_size_without_cuda_is_unlimited():
+    """Test that admission is skipped when device memory is unknown."""
+    assert max_batch_size(_config(), RuntimeConfig(hf_token=None, has_cuda=False), 8) == 8
+
+
+def test_plan_admission_splits_batches():
+    """Test that a batch over budget is split into calls that fit."""
+    configs = [_config(prompt=f"p{i}") for i in range(8)]
+
+    plan = plan_admission(configs, _runtime(30))
+
+    assert 1 < plan.batch_size < 8
+    assert sum(len(chunk) for chunk in plan.chunks) == 8
+    assert plan.estimate.peak_bytes <= 30 * GiB
+    assert plan.actions[0].startswith("split batch of 8")
+
+
+def test_plan_admission_downscale_is_opt_in():
+    """Test that resolution is only reduced for configs allowing it."""
+    kept = plan_admission([_config(height=2048, width=2048)], _runtime(22))
+    assert kept.gen_configs[0].height == 2048
+    assert kept.actions[-1].startswith("admit over budget")
+
+    shrunk = plan_admission([_config(height=2048, width=2048, allow_downscale=True)], _runtime(23.5))
+    assert shrunk.gen_configs[0].height < 2048
+    assert shrunk.gen_configs[0].vae_decode == "tiled"
+    assert any(action.startswith("downscale 2048x2048") for action in shrunk.actions)
+
+
+def test_is_out_of_memory():
+    """Test OOM detection by exception type and message."""
+    assert is_out_of_memory(OutOfMemoryError("CUDA error"))
+    assert is_out_of_memory(RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB"))
+    assert not is_out_of_memory(RuntimeError("shape mismatch"))
+
+
+def test_render_admitted_falls_back_in_order():
+    """Test that OOM retries halve the batch, then offload more, then tile the VAE."""
+    mock_pipe = MagicMock()
+    runtime = RuntimeConfig(hf_token=None, has_cuda=True)
+    pipeline.apply_offload(mock_pipe, "model", runtime)
+    attempts = []
+
+    def render(pipe, configs):
+        attempts.append((len(configs), pipeline.offload_mode_of(pipe), configs[0].vae_decode))
+        if len(attempts) < 4:
+            raise OutOfMemoryError("CUDA out of memory")
+        return [f"image {c.prompt}" for c in configs]
+
+    configs = [_config(prompt="a"), _config(prompt="b")]
+    with patch('builtins.print') as mock_print:
+        rendered, images = render_admitted(mock_pipe, configs, render, runtime)
+
+    assert attempts == [
+        (2, "model", "full"),
+        (1, "model", "full"),
+        (1, "sequential", "full"),
+        (1, "sequential", "tiled"),
+        (1, "sequential", "full"),
+    ]
+    assert images == ["image a", "image b"]
+    assert rendered == configs
+    mock_pipe.enable_sequential_cpu_offload.assert_called_once()
+    mock_pipe.vae.enable_tiling.assert_called_once()
+    logged = " ".join(str(call.args[0]) for call in mock_print.call_args_list)
+    assert "batch of 2" in logged and "'sequential'" in logged and "tiled VAE" in logged
+
+
+def test_render_admitted_reraises_other_errors():
+    """Test that non-memory errors are not retried."""
+    render = MagicMock(side_effect=ValueError("bad prompt"))
+
+    with pytest.raises(ValueError):
+        render_admitted(MagicMock(), [_config()], render, RuntimeConfig(hf_token=None, has_cuda=False))
+
+    render.assert_called_once()
@@ -0,0 +1,27 @@
+"""Tests for timing and memory measurements."""
+
+from unittest.mock import patch
+from flux_gen.metrics import (
+    current_rss_bytes, device_peak_memory_bytes, format_bytes, peak_rss_bytes, proportional_rss_bytes,
+)
+
+
+def test_rss_measurements():
+    """Test that host memory measurements are positive and consistent."""
+    assert peak_rss_bytes() > 0
+    assert 0 < current_rss_bytes() <= peak_rss_bytes() * 2
+    assert 0 < proportional_rss_bytes() <= current_rss_bytes() * 2
+
+
+def test_device_peak_memory_without_torch():
+    """Test that device memory is unavailable when torch is not loaded."""
+    with patch.dict('sys.modules', {'torch': None}):
+        assert device_peak_memory_bytes() is None
+
+
+def test_format_bytes():
+    """Test human readable sizes."""
+    assert format_bytes(None) == "n/a"
+    assert format_bytes(512) == "512 B"
+    assert format_bytes(1536) == "1.5 KiB"
+    assert format_bytes(12 * 1024 ** 3) == "12.0 GiB"
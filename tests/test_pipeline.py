@@ -1,11 +1,25 @@
 """Tests for pipeline loading and error handling."""
 
+import json
+import struct
 import pytest
 from unittest.mock import patch, MagicMock
 from flux_gen.config import GenerationConfig, RuntimeConfig
 from flux_gen.pipeline import load_flux_pipeline
 
 
+def _write_lora(path, rank=4):
+    """Write a minimal diffusers-format safetensors LoRA file."""
+    layer = "transformer.single_transformer_blocks.0.attn.to_q"
+    header = {
+        layer + ".lora_A.weight": {"dtype": "F16", "shape": [rank, 8], "data_offsets": [0, rank * 16]},
+        layer + ".lora_B.weight": {"dtype": "F16", "shape": [8, rank], "data_offsets": [rank * 16, rank * 32]},
+    }
+    raw = json.dumps(header).encode()
+    path.write_bytes(struct.pack("<Q", len(raw)) + raw + b"\0" * rank * 32)
+    return str(path)
+
+
 def test_load_flux_pipeline_success():
     """Test successful pipeline loading."""
     gen_config = GenerationConfig(
@@ -92,8 +106,9 @@ def test_load_flux_pipeline_other_error():
         assert exc_info.value == original_error
 
 
-def test_apply_lora_to_pipeline_success():
+def test_apply_lora_to_pipeline_success(tmp_path):
     """Test successful LoRA application."""
+    lora_path = _write_lora(tmp_path / "lora.safetensors")
     gen_config = GenerationConfig(
         model_id="test/model",
         prompt="test",
@@ -102,18 +117,22 @@ def test_apply_lora_to_pipeline_success():
         guidance_scale=2.0,
         num_inference_steps=10,
         out_dir=None,
-        lora_path="/path/to/lora.safetensors",
+        lora_path=lora_path,
         lora_scale=0.8
     )
 
     mock_pipeline = MagicMock()
+    state_dict = {"tensors": "mmapped"}
 
-    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True):
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True), \
+         patch('flux_gen.lora._load_tensors', return_value=state_dict):
+        from flux_gen.lora import clear_lora_cache
         from flux_gen.pipeline import apply_lora_to_pipeline
+        clear_lora_cache()
         apply_lora_to_pipeline(mock_pipeline, gen_config)
 
         mock_pipeline.load_lora_weights.assert_called_once_with(
-            "/path/to/lora.safetensors",
+            state_dict,
             adapter_name="custom_lora"
         )
         mock_pipeline.fuse_lora.assert_called_once_with(
@@ -122,8 +141,10 @@ def test_apply_lora_to_pipeline_success():
         )
 
 
-def test_apply_lora_to_pipeline_with_config():
+def test_apply_lora_to_pipeline_with_config(tmp_path):
     """Test LoRA application with config file."""
+    lora_config_path = tmp_path / "lora_config.json"
+    lora_config_path.write_text(json.dumps({"rank": 4, "lora_alpha": 2}))
     gen_config = GenerationConfig(
         model_id="test/model",
         prompt="test",
@@ -132,25 +153,29 @@ def test_apply_lora_to_pipeline_with_config():
         guidance_scale=2.0,
         num_inference_steps=10,
         out_dir=None,
-        lora_path="/path/to/lora.safetensors",
-        lora_config_path="/path/to/lora_config.json",
+        lora_path=_write_lora(tmp_path / "lora.safetensors"),
+        lora_config_path=str(lora_config_path),
         lora_scale=1.0
     )
 
     mock_pipeline = MagicMock()
+    state_dict = {"tensors": "mmapped"}
 
-    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True):
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True), \
+         patch('flux_gen.lora._load_tensors', return_value=state_dict):
+        from flux_gen.lora import clear_lora_cache
         from flux_gen.pipeline import apply_lora_to_pipeline
+        clear_lora_cache()
         apply_lora_to_pipeline(mock_pipeline, gen_config)
 
         mock_pipeline.load_lora_weights.assert_called_once_with(
-            "/path/to/lora.safetensors",
-            weight_name=None,
+            state_dict,
             adapter_name="custom_lora"
         )
+        # alpha / rank from the config scales the fused adapter
         mock_pipeline.fuse_lora.assert_called_once_with(
             adapter_names=["custom_lora"],
-            lora_scale=1.0
+            lora_scale=0.5
         )
 
 
@@ -179,7 +204,7 @@ def test_apply_lora_to_pipeline_peft_not_available():
         assert "PEFT library is required" in error_msg
 
 
-def test_apply_lora_to_pipeline_failure():
+def test_apply_lora_to_pipeline_failure(tmp_path):
     """Test LoRA application failure."""
     gen_config = GenerationConfig(
         model_id="test/model",
@@ -189,13 +214,14 @@ def test_apply_lora_to_pipeline_failure():
         guidance_scale=2.0,
         num_inference_steps=10,
         out_dir=None,
-        lora_path="/invalid/path/lora.safetensors"
+        lora_path=_write_lora(tmp_path / "lora.safetensors")
     )
 
     mock_pipeline = MagicMock()
     mock_pipeline.load_lora_weights.side_effect = Exception("LoRA load failed")
 
-    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True):
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True), \
+         patch('flux_gen.lora._load_tensors', return_value={}):
         from flux_gen.pipeline import apply_lora_to_pipeline
 
         with pytest.raises(RuntimeError) as exc_info:
@@ -204,3 +230,146 @@ def test_apply_lora_to_pipeline_failure():
         error_msg = str(exc_info.value)
         assert "Failed to apply LoRA" in error_msg
         assert "LoRA load failed" in error_msg
+
+
+def test_apply_lora_to_pipeline_invalid_file(tmp_path):
+    """Test that an invalid LoRA file is rejected before loading weights."""
+    bad_path = tmp_path / "bad.safetensors"
+    bad_path.write_bytes(b"not a safetensors file")
+    gen_config = GenerationConfig(
+        model_id="test/model",
+        prompt="test",
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        out_dir=None,
+        lora_path=str(bad_path)
+    )
+
+    mock_pipeline = MagicMock()
+
+    with patch('flux_gen.pipeline.PEFT_AVAILABLE', True):
+        from flux_gen.pipeline import apply_lora_to_pipeline
+
+        with pytest.raises(RuntimeError) as exc_info:
+            apply_lora_to_pipeline(mock_pipeline, gen_config)
+
+        assert "Failed to apply LoRA" in str(exc_info.value)
+        mock_pipeline.load_lora_weights.assert_not_called()
+
+
+def test_resolve_offload_auto():
+    """Test that auto offload picks a mode from free device memory."""
+    from flux_gen.pipeline import resolve_offload
+
+    gib = 1024 ** 3
+    assert resolve_offload("auto", RuntimeConfig(hf_token=None, has_cuda=False)) == "none"
+    assert resolve_offload("auto", RuntimeConfig(hf_token=None, has_cuda=True)) == "model"
+    assert resolve_offload("auto", RuntimeConfig(hf_token=None, has_cuda=True, free_device_memory=80 * gib), "bf16") == "none"
+    assert resolve_offload("auto", RuntimeConfig(hf_token=None, has_cuda=True, free_device_memory=30 * gib), "bf16") == "model"
+    assert resolve_offload("auto", RuntimeConfig(hf_token=None, has_cuda=True, free_device_memory=16 * gib), "bf16") == "sequential"
+    assert resolve_offload("sequential", RuntimeConfig(hf_token=None, has_cuda=True)) == "sequential"
+
+    with pytest.raises(ValueError):
+        resolve_offload("disk", RuntimeConfig(hf_token=None, has_cuda=True))
+
+
+def test_apply_offload_modes():
+    """Test that each offload mode configures the pipeline accordingly."""
+    from flux_gen.pipeline import apply_offload
+
+    cuda = RuntimeConfig(hf_token=None, has_cuda=True)
+
+    pipe = MagicMock()
+    apply_offload(pipe, "model", cuda)
+    pipe.enable_model_cpu_offload.assert_called_once()
+
+    pipe = MagicMock()
+    apply_offload(pipe, "sequential", cuda)
+    pipe.enable_sequential_cpu_offload.assert_called_once()
+
+    pipe = MagicMock()
+    apply_offload(pipe, "none", cuda)
+    pipe.to.assert_called_once_with("cuda")
+    pipe.enable_model_cpu_offload.assert_not_called()
+
+    pipe = MagicMock()
+    apply_offload(pipe, "none", RuntimeConfig(hf_token=None, has_cuda=False))
+    pipe.to.assert_not_called()
+
+
+def _vae_config(**overrides):
+    return GenerationConfig(**{
+        "model_id": "stub:",
+        "prompt": "test",
+        "height": 512,
+        "width": 512,
+        "guidance_scale": 2.0,
+        "num_inference_steps": 1,
+        "out_dir": "/tmp",
+        **overrides,
+    })
+
+
+def test_resolve_vae_decode_auto():
+    """Test that auto decoding follows resolution and batch size."""
+    from flux_gen.pipeline import resolve_vae_decode
+
+    assert resolve_vae_decode(_vae_config(vae_decode="auto")) == "full"
+    assert resolve_vae_decode(_vae_config(vae_decode="auto"), batch_size=4) == "sliced"
+    assert resolve_vae_decode(_vae_config(vae_decode="auto", height=1536, width=1024)) == "tiled"
+    assert resolve_vae_decode(_vae_config(vae_decode="sliced", height=2048, width=2048)) == "sliced"
+
+    with pytest.raises(ValueError):
+        resolve_vae_decode(_vae_config(vae_decode="chunked"))
+    with pytest.raises(ValueError):
+        resolve_vae_decode(_vae_config(vae_decode="tiled", vae_tile_size=500))
+    with pytest.raises(ValueError):
+        resolve_vae_decode(_vae_config(vae_decode="tiled", vae_tile_overlap=0.5))
+
+
+def test_apply_vae_decode_configures_vae():
+    """Test that tiled decoding sets tile size and overlap on the VAE."""
+    from flux_gen.pipeline import apply_vae_decode
+
+    pipe = MagicMock()
+    assert apply_vae_decode(pipe, _vae_config(vae_decode="tiled", vae_tile_size=384, vae_tile_overlap=0.125)) == "tiled"
+    pipe.vae.enable_slicing.assert_called_once()
+    pipe.vae.enable_tiling.assert_called_once()
+    assert (pipe.vae.tile_sample_min_size, pipe.vae.tile_latent_min_size) == (384, 48)
+    assert pipe.vae.tile_overlap_factor == 0.125
+
+    pipe = MagicMock()
+    apply_vae_decode(pipe, _vae_config())
+    pipe.vae.disable_slicing.assert_called_once()
+    pipe.vae.disable_tiling.assert_called_once()
+
+    pipe = MagicMock(vae=None)
+    assert apply_vae_decode(pipe, _vae_config()) == "full"
+    with pytest.raises(ValueError, match="needs a pipeline with a VAE"):
+        apply_vae_decode(pipe, _vae_config(vae_decode="tiled"))
+
+
+def test_vae_decode_peak_memory_per_mode():
+    """Document simulated decode peaks of a 2-image 1536x1536 batch per mode.
+
+    full: 2 images x 1536^2 px -> 6.75 GiB; sliced: 1 image -> 3.38 GiB;
+    tiled (512px tiles): 1 tile -> 0.38 GiB.
+    """
+    from flux_gen.pipeline import apply_vae_decode
+    from flux_gen.stub import StubFluxPipeline
+
+    gib = 1024 ** 3
+    peaks = {}
+    for mode in ("full", "sliced", "tiled", "auto"):
+        gen_config = _vae_config(vae_decode=mode, height=1536, width=1536)
+        pipe = StubFluxPipeline()
+        apply_vae_decode(pipe, gen_config, batch_size=2)
+        pipe(prompt="test", height=1536, width=1536, num_inference_steps=1, num_images_per_prompt=2)
+        peaks[mode] = pipe.vae.peak_decode_bytes / gib
+
+    assert peaks["full"] == pytest.approx(6.75)
+    assert peaks["sliced"] == pytest.approx(3.375)
+    assert peaks["tiled"] == pytest.approx(0.375)
+    assert peaks["auto"] == peaks["tiled"]
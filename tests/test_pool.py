@@ -0,0 +1,78 @@
+"""Tests for the multi-process worker pool."""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from flux_gen.config import GenerationConfig
+from flux_gen.pool import DeviceSlot, PoolReport, WorkerPool, detect_slots
+
+
+def _job(out_dir, **overrides):
+    return GenerationConfig(**{
+        "model_id": "stub:",
+        "prompt": "a lighthouse",
+        "height": 32,
+        "width": 32,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 2,
+        "out_dir": out_dir,
+        **overrides,
+    })
+
+
+def test_detect_slots_cuda_and_cpu():
+    """Test device specs for CUDA devices and CPU slices."""
+    with patch('flux_gen.device.cuda_device_count', return_value=2):
+        assert detect_slots("auto") == [DeviceSlot("cuda:0", cuda_device=0), DeviceSlot("cuda:1", cuda_device=1)]
+    assert detect_slots("cuda:1, cuda:3") == [DeviceSlot("cuda:1", cuda_device=1), DeviceSlot("cuda:3", cuda_device=3)]
+
+    with patch('flux_gen.device.cuda_device_count', return_value=0), \
+         patch('flux_gen.device.numa_cpu_slices', return_value=[(0, 1, 2, 3), (4, 5, 6, 7)]):
+        assert [slot.cpus for slot in detect_slots("auto")] == [(0, 1, 2, 3), (4, 5, 6, 7)]
+        assert [slot.cpus for slot in detect_slots("cpu:3")] == [(0, 1, 2), (3, 4, 5), (6, 7)]
+
+    with patch('flux_gen.device.numa_cpu_slices', return_value=[(0,)]):
+        assert [slot.cpus for slot in detect_slots("cpu:2")] == [(0,), (0,)]
+
+    with pytest.raises(ValueError):
+        detect_slots("gpu0")
+    with pytest.raises(ValueError):
+        detect_slots("cpu:0")
+
+
+def test_worker_pool_stub_jobs_and_failures(tmp_path):
+    """Test that two stub workers share the jobs and failures are collected."""
+    jobs = [_job(tmp_path, prompt=f"prompt {i}", output_name=f"{i}.png") for i in range(4)]
+    jobs.append(_job(tmp_path, output_name="bad.png", vae_decode="chunked"))
+
+    with patch('flux_gen.device.numa_cpu_slices', return_value=[(0,)]):
+        slots = detect_slots("cpu:2")
+    with WorkerPool(slots) as pool:
+        report = pool.run(jobs)
+
+    assert sorted(result.index for result in report.results) == [0, 1, 2, 3]
+    assert all((tmp_path / f"{i}.png").exists() for i in range(4))
+    assert [failure.index for failure in report.failures] == [4]
+    assert "chunked" in report.failures[0].error
+    assert sum(report.jobs_per_worker.values()) == 4
+    assert set(report.jobs_per_worker) == {"cpu:0", "cpu:1"}
+
+
+def test_job_of_worker_killed_before_reporting_is_failed():
+    """Test that a job taken by a worker that died before saying so does not hang the run."""
+    pool = WorkerPool([DeviceSlot("cpu:0"), DeviceSlot("cpu:1")])
+    pool._processes = {"cpu:0": SimpleNamespace(exitcode=-9), "cpu:1": SimpleNamespace(exitcode=None)}
+    pool._tasks = MagicMock()
+    report = PoolReport(jobs_per_worker={"cpu:0": 0, "cpu:1": 0})
+    in_flight, remaining = {"cpu:1": 1}, {0, 1}
+
+    # Tasks still queued: the live worker may yet take job 0
+    pool._tasks.empty.return_value = False
+    pool._fail_dead_workers(report, in_flight, remaining)
+    assert remaining == {0, 1} and not report.failures
+
+    pool._tasks.empty.return_value = True
+    pool._fail_dead_workers(report, in_flight, remaining)
+    assert remaining == {1} and in_flight == {"cpu:1": 1}
+    assert [failure.index for failure in report.failures] == [0]
+    assert "cpu:0" in report.failures[0].error
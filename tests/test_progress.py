@@ -0,0 +1,127 @@
+"""Tests for step progress events, latent previews and cancellation."""
+
+import pytest
+from unittest.mock import patch, MagicMock
+from flux_gen import progress, trace
+from flux_gen.config import RuntimeConfig
+from flux_gen.generate import run_generation, render_image
+from flux_gen.stub import StubFluxPipeline
+from conftest import make_config
+
+
+def _config(tmp_path, **overrides):
+    return make_config(**{
+        "model_id": "stub:",
+        "height": 64,
+        "width": 64,
+        "guidance_scale": 0.0,
+        "num_inference_steps": 4,
+        "out_dir": tmp_path / "outputs",
+        **overrides,
+    })
+
+
+def _run(gen_config, **kwargs):
+    with patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'):
+        run_generation(gen_config, **kwargs)
+
+
+def test_no_step_kwargs_without_tracker(tmp_path):
+    """Test that pipelines get no progress arguments outside a tracked block."""
+    assert progress.active() is None
+    assert progress.pipeline_kwargs(_config(tmp_path)) == {}
+
+
+def test_run_generation_streams_step_events(tmp_path):
+    """Test that every denoising step reaches the listener with an ETA."""
+    events = []
+    _run(_config(tmp_path), listener=events.append)
+
+    assert [event.step for event in events] == [1, 2, 3, 4]
+    assert all(event.total_steps == 4 for event in events)
+    assert events[-1].fraction == 1.0 and events[-1].eta_seconds == 0.0
+    assert all(event.preview is None for event in events)
+    assert (tmp_path / "outputs" / "flux_schnell.png").exists()
+    assert progress.active() is None
+
+
+def test_cancellation_stops_denoising_and_frees_memory(tmp_path):
+    """Test that a cancelled token aborts at the next step and releases the device."""
+    token = progress.CancellationToken()
+    events = []
+
+    def listener(event):
+        events.append(event)
+        if event.step == 1:
+            token.cancel()
+
+    with patch('flux_gen.memory.release_device_memory') as mock_release:
+        with pytest.raises(progress.GenerationCancelled):
+            _run(_config(tmp_path), listener=listener, token=token)
+
+    assert [event.step for event in events] == [1]
+    mock_release.assert_called_once()
+    assert not (tmp_path / "outputs" / "flux_schnell.png").exists()
+
+
+def test_cancelled_token_skips_pipeline_call(tmp_path):
+    """Test that a job cancelled before rendering never starts denoising."""
+    pipe = StubFluxPipeline()
+    pipe.maybe_free_model_hooks = MagicMock()
+    token = progress.CancellationToken()
+    token.cancel()
+
+    with progress.track(token=token), pytest.raises(progress.GenerationCancelled):
+        render_image(pipe, _config(tmp_path))
+    pipe.maybe_free_model_hooks.assert_called_once()
+
+
+def test_progress_and_trace_callbacks_compose(tmp_path):
+    """Test that tracing and progress both see every step of one call."""
+    events = []
+    tracer = trace.start()
+    try:
+        with progress.track(events.append):
+            render_image(StubFluxPipeline(), _config(tmp_path, num_inference_steps=3))
+    finally:
+        trace.stop()
+
+    assert len(events) == 3
+    assert [event["name"] for event in tracer.events].count("denoise_step") == 3
+
+
+def test_tracker_previews_every_n_steps():
+    """Test that previews are attached every n-th step and on the last one."""
+    events = []
+    tracker = progress.ProgressTracker(events.append, preview_every=2)
+    tracker.begin(total_steps=5, height=64, width=64)
+    with patch('flux_gen.progress.latent_preview', return_value="preview") as mock_preview:
+        for step in range(5):
+            assert tracker.step_callback(None, step, 1000 - step, {"latents": "latents"}) == {"latents": "latents"}
+
+    assert [event.preview for event in events] == [None, "preview", None, "preview", "preview"]
+    mock_preview.assert_called_with("latents", 64, 64)
+
+
+def test_print_progress_saves_previews(tmp_path, capsys):
+    """Test the CLI listener output and preview file."""
+    from PIL import Image
+    from flux_gen.generate import _print_progress
+
+    listener = _print_progress(_config(tmp_path, progress=True, preview_every=1))
+    listener(progress.ProgressEvent(step=2, total_steps=4, timestep=500.0, elapsed_seconds=1.0,
+                                    preview=Image.new("RGB", (8, 8))))
+
+    assert "Step 2/4 (50%)" in capsys.readouterr().out
+    assert (tmp_path / "outputs" / "flux_schnell_preview.png").exists()
+
+
+def test_latent_preview_unpacks_flux_latents():
+    """Test that packed latents project to an RGB image at 1/8 resolution."""
+    torch = pytest.importorskip("torch")
+    latents = torch.zeros(2, (128 // 16) * (96 // 16), 64)
+
+    preview = progress.latent_preview(latents, 128, 96)
+    assert preview.size == (96 // 8, 128 // 8)
+    assert preview.mode == "RGB"
@@ -0,0 +1,113 @@
+"""Tests for int8 weight quantization and dtype selection."""
+
+from functools import partial
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen.pipeline import estimate_component_bytes, resolve_torch_dtype
+from flux_gen.quantize import checkpoint_dir, load_cached_components, quantize_pipeline
+from conftest import make_config
+
+
+_config = partial(make_config, model_id="black-forest-labs/FLUX.1-schnell", dtype="bf16", quantize="int8")
+
+
+def test_checkpoint_dir(tmp_path):
+    """Test that checkpoints are separated by model, dtype and mode."""
+    path = checkpoint_dir(_config(quantized_cache_dir=str(tmp_path)))
+    assert path == tmp_path / "black-forest-labs--FLUX.1-schnell-bf16-int8"
+
+    with patch.dict('os.environ', {'FLUX_GEN_CACHE_DIR': str(tmp_path)}):
+        assert checkpoint_dir(_config(dtype=None)).parent == tmp_path / "quantized"
+
+
+def test_estimate_component_bytes_by_mode():
+    """Test that dtype and quantization shrink the estimated footprint."""
+    fp32 = estimate_component_bytes()
+    bf16 = estimate_component_bytes("bf16")
+    int8 = estimate_component_bytes("bf16", "int8")
+
+    assert bf16["transformer"] * 2 == fp32["transformer"]
+    assert int8["transformer"] * 2 == bf16["transformer"]
+    assert int8["text_encoder_2"] * 2 == bf16["text_encoder_2"]
+    assert int8["vae"] == bf16["vae"]  # VAE stays in the base dtype
+
+
+def test_resolve_torch_dtype():
+    """Test dtype name validation."""
+    assert resolve_torch_dtype(None) is None
+    with pytest.raises(ValueError):
+        resolve_torch_dtype("int4")
+
+
+def test_quantize_pipeline_saves_checkpoint(tmp_path):
+    """Test that fresh quantization freezes and caches each component."""
+    quanto = MagicMock()
+    pipe = MagicMock()
+
+    with patch('flux_gen.quantize._require_quanto', return_value=quanto), \
+         patch('flux_gen.quantize._save_component') as mock_save:
+        quantize_pipeline(pipe, _config(quantized_cache_dir=str(tmp_path)), already_quantized={"text_encoder_2"})
+
+    quanto.quantize.assert_called_once_with(pipe.transformer, weights=quanto.qint8)
+    quanto.freeze.assert_called_once_with(pipe.transformer)
+    mock_save.assert_called_once_with(pipe.transformer, checkpoint_dir(_config(quantized_cache_dir=str(tmp_path))) / "transformer")
+
+
+def test_load_cached_components(tmp_path):
+    """Test that only components with a saved checkpoint are loaded."""
+    config = _config(quantized_cache_dir=str(tmp_path))
+    assert load_cached_components(config) == {}
+    assert load_cached_components(_config(quantize=None)) == {}
+
+    component_dir = checkpoint_dir(config) / "transformer"
+    component_dir.mkdir(parents=True)
+    (component_dir / "quantization_map.json").write_text("{}")
+
+    with patch('flux_gen.quantize._load_component', return_value="quantized transformer") as mock_load:
+        assert load_cached_components(config) == {"transformer": "quantized transformer"}
+        mock_load.assert_called_once_with("transformer", component_dir)
+
+
+def test_load_cached_components_skips_corrupt_checkpoints(tmp_path):
+    """Test that an unreadable checkpoint is ignored so the component is quantized again."""
+    config = _config(quantized_cache_dir=str(tmp_path))
+    component_dir = checkpoint_dir(config) / "transformer"
+    component_dir.mkdir(parents=True)
+    (component_dir / "quantization_map.json").write_text("{")
+
+    with patch('flux_gen.quantize._load_component', side_effect=ValueError("Expecting property name")):
+        assert load_cached_components(config) == {}
+
+
+def test_save_component_is_atomic(tmp_path):
+    """Test that a crash while saving never leaves a checkpoint that looks complete."""
+    from flux_gen.quantize import _save_component
+
+    quanto = MagicMock()
+    quanto.quantization_map.return_value = {"layer": {"weights": "qint8"}}
+    safetensors_torch = MagicMock()
+    modules = {'safetensors': MagicMock(torch=safetensors_torch), 'safetensors.torch': safetensors_torch}
+    component_dir = tmp_path / "transformer"
+
+    with patch('flux_gen.quantize._require_quanto', return_value=quanto), patch.dict('sys.modules', modules):
+        safetensors_torch.save_file.side_effect = OSError("disk full")
+        with pytest.raises(OSError):
+            _save_component(MagicMock(), component_dir)
+        assert not (component_dir / "quantization_map.json").exists()
+        assert not (component_dir / "model.safetensors").exists()
+
+        safetensors_torch.save_file.side_effect = lambda state_dict, path: Path(path).write_bytes(b"weights")
+        _save_component(MagicMock(), component_dir)
+
+    assert (component_dir / "model.safetensors").read_bytes() == b"weights"
+    assert json.loads((component_dir / "quantization_map.json").read_text()) == {"layer": {"weights": "qint8"}}
+    assert not list(component_dir.glob("*.partial"))
+
+
+def test_quantize_requires_quanto():
+    """Test that a missing optimum-quanto gives an install hint."""
+    with patch.dict('sys.modules', {'optimum': None, 'optimum.quanto': None}):
+        with pytest.raises(RuntimeError, match="optimum-quanto"):
+            quantize_pipeline(MagicMock(), _config())
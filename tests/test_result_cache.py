@@ -0,0 +1,116 @@
+"""Tests for the content-addressed result cache."""
+
+from functools import partial
+import json
+import pytest
+from unittest.mock import patch
+from PIL import Image
+from flux_gen import result_cache
+from flux_gen.batch import restore_job, run_batch
+from flux_gen.config import RuntimeConfig
+from flux_gen.io import EXIF_DESCRIPTION_TAG, ImageWriter
+from flux_gen.result_cache import ResultCache, result_cache_key
+from conftest import make_config
+
+
+_config = partial(make_config, height=64, width=64, num_inference_steps=4, seed=7)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    result_cache._CACHES.clear()
+    yield
+    result_cache._CACHES.clear()
+
+
+def test_result_cache_key_is_canonical(tmp_path):
+    """Test which settings change the key."""
+    assert result_cache_key(_config(seed=None)) is None
+    assert result_cache_key(_config()) == result_cache_key(
+        _config(out_dir=tmp_path, output_name="other.png", offload="none", attention_backend="math")
+    )
+    assert result_cache_key(_config()) != result_cache_key(_config(seed=8))
+    assert result_cache_key(_config()) != result_cache_key(_config(model_revision="abc123"))
+
+    lora_file = tmp_path / "style.safetensors"
+    lora_file.write_bytes(b"weights-v1")
+    with_lora = result_cache_key(_config(lora_path=str(lora_file)))
+    assert with_lora != result_cache_key(_config(lora_path=str(lora_file), lora_scale=0.5))
+    lora_file.write_bytes(b"weights-v2-changed")
+    assert result_cache_key(_config(lora_path=str(lora_file))) != with_lora
+
+
+def test_result_cache_store_restore_and_stats(tmp_path):
+    """Test hits, misses, bypass and metadata."""
+    cache = ResultCache(tmp_path / "cache", max_bytes=10 ** 9)
+    gen_config = _config(out_dir=tmp_path)
+
+    assert cache.restore(gen_config) is None
+    cache.store(gen_config, Image.new("RGB", (64, 64), (1, 2, 3)), render_seconds=1.5)
+    assert cache.restore(gen_config) == tmp_path / "flux_schnell.png"
+    with Image.open(tmp_path / "flux_schnell.png") as restored:
+        assert restored.getpixel((0, 0)) == (1, 2, 3)
+    assert cache.restore(_config(out_dir=tmp_path, bypass_result_cache=True)) is None
+
+    key = result_cache_key(gen_config)
+    metadata = json.loads((tmp_path / "cache" / key[:2] / f"{key}.json").read_text())
+    assert metadata["seed"] == 7 and metadata["render_seconds"] == 1.5
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["bypassed"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+    # A new process sees the same entries
+    assert ResultCache(tmp_path / "cache", max_bytes=10 ** 9).lookup(gen_config) is not None
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    """Test size-bounded LRU eviction."""
+    image = Image.new("RGB", (64, 64))
+    cache = ResultCache(tmp_path, max_bytes=10 ** 9)
+    cache.store(_config(seed=1), image)
+    entry_bytes = cache.total_bytes
+    cache.max_bytes = int(entry_bytes * 2.5)
+
+    cache.store(_config(seed=2), image)
+    assert cache.lookup(_config(seed=1)) is not None  # seed 2 becomes least recent
+    cache.store(_config(seed=3), image)
+
+    assert cache.evictions == 1
+    assert cache.lookup(_config(seed=2)) is None
+    assert cache.lookup(_config(seed=1)) is not None
+
+
+def test_run_batch_skips_cached_jobs(tmp_path):
+    """Test that a rerun of a seeded batch renders nothing."""
+    jobs = [
+        _config(model_id="stub:", out_dir=tmp_path / "out", output_name=f"{i}.png", seed=i,
+                result_cache_dir=str(tmp_path / "cache"))
+        for i in range(3)
+    ]
+
+    with patch('flux_gen.generate.prepare_runtime', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.generate._generator_kwargs', return_value={}):
+        run_batch(jobs)
+        first = (tmp_path / "out" / "1.png").read_bytes()
+        (tmp_path / "out" / "1.png").unlink()
+
+        with patch('flux_gen.pipeline.load_flux_pipeline') as mock_load:
+            report = run_batch(jobs)
+        mock_load.assert_not_called()
+
+    assert (tmp_path / "out" / "1.png").read_bytes() == first
+    assert len(report.results) == 3
+    assert result_cache.cache_for(jobs[0]).stats()["hits"] == 3
+
+
+def test_reencoded_restore_keeps_metadata(tmp_path):
+    """Test that cached results re-encoded to another format keep their settings."""
+    job = _config(out_dir=tmp_path / "out", output_name="a.png", result_cache_dir=str(tmp_path / "cache"))
+    result_cache.cache_for(job).store(job, Image.new("RGB", (64, 64)), 1.0)
+
+    with ImageWriter("webp") as writer:
+        assert restore_job([job], writer) == [tmp_path / "out" / "a.webp"]
+
+    with Image.open(tmp_path / "out" / "a.webp") as restored:
+        assert json.loads(restored.getexif()[EXIF_DESCRIPTION_TAG])["seed"] == "7"
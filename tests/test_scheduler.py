@@ -0,0 +1,103 @@
+"""Tests for shape-bucket request batching."""
+
+import threading
+import pytest
+from unittest.mock import MagicMock
+from flux_gen.scheduler import BatchScheduler, bucket_key
+from conftest import make_config
+
+
+
+
+def test_bucket_key_ignores_prompt():
+    """Test that only shape, sampling and LoRA settings define a bucket."""
+    assert bucket_key(make_config(prompt="a")) == bucket_key(make_config(prompt="b"))
+    assert bucket_key(make_config()) != bucket_key(make_config(width=768))
+    assert bucket_key(make_config()) != bucket_key(make_config(lora_path="/l.safetensors"))
+    assert bucket_key(make_config()) != bucket_key(make_config(max_sequence_length=256))
+    assert bucket_key(make_config()) != bucket_key(make_config(vae_decode="tiled"))
+    assert bucket_key(make_config(vae_decode="tiled")) != bucket_key(make_config(vae_decode="tiled", vae_tile_size=256))
+    assert bucket_key(make_config(vae_decode="tiled")) != bucket_key(make_config(vae_decode="tiled", vae_tile_overlap=0.5))
+
+
+def test_scheduler_groups_same_shape_requests():
+    """Test that matching requests are merged and results split back out."""
+    calls = []
+    release = threading.Event()
+
+    def render_batch(configs):
+        release.wait(timeout=5)
+        calls.append([c.prompt for c in configs])
+        return [f"image:{c.prompt}" for c in configs]
+
+    scheduler = BatchScheduler(render_batch, max_batch_size=3, max_wait_seconds=0.05)
+    try:
+        futures = [scheduler.submit(make_config(prompt=f"p{i}")) for i in range(3)]
+        odd = scheduler.submit(make_config(prompt="wide", width=1024))
+        release.set()
+
+        assert [f.result(timeout=5) for f in futures] == ["image:p0", "image:p1", "image:p2"]
+        assert odd.result(timeout=5) == "image:wide"
+    finally:
+        scheduler.stop()
+
+    assert ["p0", "p1", "p2"] in calls
+    assert ["wide"] in calls
+    stats = scheduler.stats()
+    assert stats["batches"] == 2
+    assert stats["queue_depth"] == 0
+    assert stats["fill_ratio"] == pytest.approx(4 / 6)
+
+
+def test_scheduler_propagates_errors():
+    """Test that a failed batch fails every request in it."""
+    scheduler = BatchScheduler(MagicMock(side_effect=RuntimeError("OOM")), max_batch_size=2, max_wait_seconds=0.0)
+    try:
+        future = scheduler.submit(make_config())
+        with pytest.raises(RuntimeError, match="OOM"):
+            future.result(timeout=5)
+    finally:
+        scheduler.stop()
+
+
+def test_render_batch_uses_prompt_list():
+    """Test that batched rendering passes all prompts in one pipeline call."""
+    from flux_gen.generate import render_batch
+
+    mock_pipe = MagicMock()
+    mock_pipe.return_value.images = ["img0", "img1"]
+    configs = [make_config(prompt="a"), make_config(prompt="b", lora_path="/l.safetensors", lora_trigger_word="tok")]
+
+    images = render_batch(mock_pipe, configs)
+
+    assert images == ["img0", "img1"]
+    mock_pipe.assert_called_once_with(
+        prompt=["a", "tok, b"],
+        height=512,
+        width=512,
+        guidance_scale=2.0,
+        num_inference_steps=10,
+        max_sequence_length=512,
+    )
+
+
+def test_scheduler_batch_limit_caps_batches():
+    """Test that a per-shape batch limit splits a full bucket."""
+    calls = []
+    release = threading.Event()
+
+    def render_batch(configs):
+        release.wait(timeout=5)
+        calls.append(len(configs))
+        return [c.prompt for c in configs]
+
+    scheduler = BatchScheduler(render_batch, max_batch_size=4, max_wait_seconds=0.05,
+                               batch_limit=lambda config: 2 if config.height > 512 else 4)
+    try:
+        futures = [scheduler.submit(make_config(prompt=f"p{i}", height=1024)) for i in range(4)]
+        release.set()
+        assert [f.result(timeout=5) for f in futures] == ["p0", "p1", "p2", "p3"]
+    finally:
+        scheduler.stop()
+
+    assert calls == [2, 2]
@@ -0,0 +1,86 @@
+"""Tests for model weights shared between processes."""
+
+from functools import partial
+import pytest
+from unittest.mock import patch
+from flux_gen import pipeline, shared_weights
+from flux_gen.cli import parse_batch_args
+from flux_gen.config import RuntimeConfig
+from flux_gen.pool import DeviceSlot, WorkerPool
+from conftest import make_config
+
+
+_config = partial(make_config, model_id="black-forest-labs/FLUX.1-schnell", dtype="bf16")
+
+
+def test_shared_weights_dir(tmp_path):
+    """Test that exports are separated by model, revision and dtype."""
+    path = shared_weights.shared_weights_dir(_config(model_revision="v1"), tmp_path)
+    assert path == tmp_path / "black-forest-labs--FLUX.1-schnell@v1-bf16"
+
+
+def test_export_only_missing_components(tmp_path):
+    """Test that components another process exported are kept."""
+    target = shared_weights.shared_weights_dir(_config(), tmp_path)
+    (target / "transformer").mkdir(parents=True)
+    (target / "transformer" / shared_weights.WEIGHTS_NAME).write_bytes(b"")
+
+    with patch('flux_gen.shared_weights._export_component') as mock_export:
+        assert shared_weights.export_shared_weights(_config(), "token", tmp_path) == target
+    mock_export.assert_called_once_with("text_encoder_2", _config(), "token", target / "text_encoder_2")
+
+    with pytest.raises(ValueError, match="quantize"):
+        shared_weights.export_shared_weights(_config(quantize="int8"), root=tmp_path)
+
+
+def test_shared_weights_reject_quantize(tmp_path):
+    """Test that quantized configs fail instead of silently loading private copies."""
+    with patch('sys.argv', ['generate_batch.py', 'jobs.jsonl', '--quantize', 'int8',
+                            '--shared_weights_dir', str(tmp_path)]):
+        with pytest.raises(SystemExit):
+            parse_batch_args()
+
+    gen_config = _config(dtype=None, quantize="int8", shared_weights_dir=str(tmp_path))
+    with pytest.raises(ValueError, match="quantize"):
+        pipeline.load_flux_pipeline(gen_config, RuntimeConfig(hf_token=None, has_cuda=False))
+
+
+def test_map_safetensors_is_copy_on_write(tmp_path):
+    """Test that mapped tensors match the file and writes stay private."""
+    torch = pytest.importorskip("torch")
+    from safetensors.torch import save_file
+
+    path = tmp_path / "model.safetensors"
+    tensors = {
+        "a.weight": torch.arange(12, dtype=torch.bfloat16).reshape(3, 4),
+        "b.bias": torch.ones(5, dtype=torch.float32),
+        "c.index": torch.tensor([1, 2, 3], dtype=torch.int64),
+    }
+    save_file(tensors, path)
+
+    mapped = shared_weights.map_safetensors(path)
+    for name, tensor in tensors.items():
+        assert mapped[name].dtype == tensor.dtype
+        assert torch.equal(mapped[name], tensor)
+
+    mapped["b.bias"].zero_()
+    assert torch.equal(shared_weights.map_safetensors(path)["b.bias"], tensors["b.bias"])
+
+
+def test_pool_exports_each_model_once(tmp_path):
+    """Test that the pool exports shared weights before workers start."""
+    shared = str(tmp_path / "shm")
+    jobs = [
+        _config(shared_weights_dir=shared, prompt="one"),
+        _config(shared_weights_dir=shared, prompt="two"),
+        _config(shared_weights_dir=shared, dtype="fp16"),
+        _config(),
+        _config(model_id="stub:", shared_weights_dir=shared),
+    ]
+    pool = WorkerPool([DeviceSlot("cpu:0", cpus=(0,))])
+
+    with patch('flux_gen.shared_weights.export_shared_weights') as mock_export:
+        pool._export_shared_weights(jobs)
+
+    assert [call.args[0].dtype for call in mock_export.call_args_list] == ["bf16", "fp16"]
+    assert all(call.args[2] == shared for call in mock_export.call_args_list)
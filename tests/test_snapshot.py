@@ -0,0 +1,113 @@
+"""Tests for pinned local model snapshots."""
+
+from functools import partial
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen import snapshot
+from conftest import make_config
+
+MODEL_ID = "black-forest-labs/FLUX.1-schnell"
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+
+
+def _write_model(root: Path):
+    (root / "transformer").mkdir(parents=True)
+    (root / "model_index.json").write_text('{"_class_name": "FluxPipeline"}')
+    (root / "transformer" / "diffusion_pytorch_model.safetensors").write_bytes(b"\x01" * 4096)
+    (root / ".cache" / "huggingface").mkdir(parents=True)
+    (root / ".cache" / "huggingface" / "download.lock").write_text("")
+
+
+_config = partial(make_config, model_id=MODEL_ID)
+
+
+def test_default_snapshot_dir(tmp_path):
+    """Test that snapshots are separated by model and revision."""
+    with patch.dict('os.environ', {'FLUX_GEN_CACHE_DIR': str(tmp_path)}):
+        path = snapshot.default_snapshot_dir(MODEL_ID, "v1.0")
+    assert path == tmp_path / "snapshots" / "black-forest-labs--FLUX.1-schnell@v1.0"
+
+
+def test_manifest_records_checksums(tmp_path):
+    """Test that the manifest hashes model files and skips download metadata."""
+    _write_model(tmp_path)
+    manifest = snapshot.write_manifest(tmp_path, MODEL_ID, "main", COMMIT, max_workers=2)
+
+    assert sorted(manifest["files"]) == ["model_index.json", "transformer/diffusion_pytorch_model.safetensors"]
+    weights = manifest["files"]["transformer/diffusion_pytorch_model.safetensors"]
+    assert weights["size"] == 4096 and len(weights["sha256"]) == 64
+    assert snapshot.read_manifest(tmp_path) == json.loads((tmp_path / snapshot.MANIFEST_NAME).read_text())
+
+
+def test_verify_snapshot_checks_model_revision_and_files(tmp_path):
+    """Test that verification catches wrong models, revisions and corruption."""
+    _write_model(tmp_path)
+    snapshot.write_manifest(tmp_path, MODEL_ID, "main", COMMIT)
+
+    assert snapshot.verify_snapshot(tmp_path, MODEL_ID, "main")["commit"] == COMMIT
+    assert snapshot.verify_snapshot(tmp_path, MODEL_ID, COMMIT[:8])["commit"] == COMMIT
+    with pytest.raises(RuntimeError, match="holds"):
+        snapshot.verify_snapshot(tmp_path, "other/model")
+    with pytest.raises(RuntimeError, match="pinned"):
+        snapshot.verify_snapshot(tmp_path, MODEL_ID, "dev")
+
+    # Same size, different content: only a full check notices
+    (tmp_path / "transformer" / "diffusion_pytorch_model.safetensors").write_bytes(b"\x02" * 4096)
+    snapshot.verify_snapshot(tmp_path, MODEL_ID)
+    with pytest.raises(RuntimeError, match="checksum mismatch"):
+        snapshot.verify_snapshot(tmp_path, MODEL_ID, full=True)
+
+    (tmp_path / "model_index.json").unlink()
+    with pytest.raises(RuntimeError, match="missing model_index.json"):
+        snapshot.verify_snapshot(tmp_path)
+
+
+def test_verify_snapshot_without_manifest(tmp_path):
+    """Test that a directory that was never prefetched is rejected."""
+    with pytest.raises(RuntimeError, match="prefetch.py .*--model_revision <revision>"):
+        snapshot.verify_snapshot(tmp_path)
+
+
+def test_prefetch_pins_commit_and_skips_existing(tmp_path):
+    """Test that prefetch downloads the resolved commit once."""
+    hub = MagicMock()
+    hub.HfApi.return_value.model_info.return_value.sha = COMMIT
+    hub.snapshot_download.side_effect = lambda local_dir, **kwargs: _write_model(Path(local_dir))
+
+    with patch.dict('sys.modules', {'huggingface_hub': hub}):
+        root = snapshot.prefetch(MODEL_ID, "main", str(tmp_path / "snap"), token="t", max_workers=4)
+        snapshot.prefetch(MODEL_ID, "main", str(tmp_path / "snap"), token="t", max_workers=4)
+
+    hub.HfApi.return_value.model_info.assert_called_with(MODEL_ID, revision="main", token="t")
+    hub.snapshot_download.assert_called_once_with(
+        repo_id=MODEL_ID, revision=COMMIT, local_dir=tmp_path / "snap", token="t", max_workers=4,
+    )
+    assert snapshot.read_manifest(root)["commit"] == COMMIT
+
+
+def test_open_snapshot_goes_offline_and_reads_ahead(tmp_path):
+    """Test that opening a snapshot verifies it and starts the readahead."""
+    _write_model(tmp_path)
+    snapshot.write_manifest(tmp_path, MODEL_ID, "main", COMMIT)
+
+    with patch.dict('os.environ', {}, clear=True) as environ, \
+         patch('flux_gen.snapshot.readahead') as mock_readahead:
+        root = snapshot.open_snapshot(_config(snapshot_dir=str(tmp_path), model_revision="main"))
+        assert environ["HF_HUB_OFFLINE"] == "1"
+
+    assert root == tmp_path
+    mock_readahead.assert_called_once()
+    with pytest.raises(RuntimeError, match="pinned"):
+        snapshot.open_snapshot(_config(snapshot_dir=str(tmp_path), model_revision="dev"))
+
+
+def test_readahead_reads_weight_files(tmp_path):
+    """Test that readahead reads only the weight files, in the background."""
+    _write_model(tmp_path)
+    manifest = snapshot.write_manifest(tmp_path, MODEL_ID, "main", COMMIT)
+
+    with patch('flux_gen.snapshot._read_through') as mock_read:
+        snapshot.readahead(tmp_path, manifest, max_workers=2).join()
+    mock_read.assert_called_once_with(tmp_path / "transformer" / "diffusion_pytorch_model.safetensors")
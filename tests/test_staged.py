@@ -0,0 +1,135 @@
+"""Tests for staged encode, denoise, decode and write execution."""
+
+import threading
+import time
+import pytest
+from PIL import Image
+from unittest.mock import patch
+from flux_gen import generate, pipeline
+from flux_gen.batch import run_batch
+from flux_gen.cli import parse_batch_args
+from flux_gen.config import GenerationConfig, RuntimeConfig
+from flux_gen.staged import STAGES, StagedRunner
+from flux_gen.stub import StubFluxPipeline
+
+
+def _job(out_dir, **overrides):
+    return GenerationConfig(**{
+        "model_id": "stub:",
+        "prompt": "a lighthouse",
+        "height": 32,
+        "width": 32,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 2,
+        "out_dir": out_dir,
+        **overrides,
+    })
+
+
+class _TimedRunner(StagedRunner):
+    """Runner whose device stages sleep and record when they ran."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.intervals = []
+        self._intervals_lock = threading.Lock()
+
+    def _timed(self, stage, job, result):
+        start = time.perf_counter()
+        time.sleep(0.05)
+        with self._intervals_lock:
+            self.intervals.append((stage, job.index, start, time.perf_counter()))
+        return result
+
+    def _encode(self, job):
+        return self._timed("encode", job, {})
+
+    def _denoise(self, job):
+        return self._timed("denoise", job, None)
+
+    def _decode(self, job):
+        return self._timed("decode", job, [])
+
+
+def _overlaps(a, b) -> bool:
+    return a[2] < b[3] and b[2] < a[3]
+
+
+def test_staged_matches_direct_rendering(tmp_path):
+    """Test that staged images equal a direct pipeline call."""
+    pipe = StubFluxPipeline()
+    jobs = [[_job(tmp_path, prompt=f"prompt {i}", output_name=f"{i}.png", height=32 + 16 * i)] for i in range(3)]
+
+    report = StagedRunner(pipe, queue_size=1).run(jobs)
+
+    assert [job.index for job in report.jobs] == [0, 1, 2]
+    assert not report.failures
+    for variants, job in zip(jobs, report.jobs):
+        expected = generate.render_variants(StubFluxPipeline(), variants)
+        assert job.outputs == [variant.output_path for variant in variants]
+        for image, output_path in zip(expected, job.outputs):
+            with Image.open(output_path) as saved:
+                assert saved.convert("RGB").tobytes() == image.tobytes()
+    assert all(report.stages[name].items == 3 for name in STAGES)
+
+
+def test_stages_overlap_across_jobs(tmp_path):
+    """Test that job N+1 encodes while job N denoises."""
+    runner = _TimedRunner(StubFluxPipeline())
+    report = runner.run([[_job(tmp_path, output_name=f"{i}.png")] for i in range(4)])
+
+    intervals = {interval[:2]: interval for interval in runner.intervals}
+    assert any(_overlaps(intervals["encode", i + 1], intervals["denoise", i]) for i in range(3))
+    assert any(_overlaps(intervals["decode", i], intervals["denoise", i + 1]) for i in range(3))
+    assert 0 < report.utilization()["denoise"] <= 1.0
+
+
+def test_offloaded_pipeline_takes_turns(tmp_path):
+    """Test that device stages never overlap when components are offloaded."""
+    pipe = StubFluxPipeline()
+    pipeline.apply_offload(pipe, "model", RuntimeConfig(hf_token=None, has_cuda=False))
+    runner = _TimedRunner(pipe)
+    runner.run([[_job(tmp_path, output_name=f"{i}.png")] for i in range(3)])
+
+    intervals = runner.intervals
+    assert not any(_overlaps(a, b) for a in intervals for b in intervals if a is not b)
+
+
+def test_failed_job_skips_later_stages(tmp_path):
+    """Test that a failing job is reported and the others still finish."""
+    jobs = [[_job(tmp_path, output_name=f"{i}.png")] for i in range(3)]
+    jobs[1] = [_job(tmp_path, output_name="bad.png", vae_decode="chunked")]
+
+    report = StagedRunner(StubFluxPipeline()).run(jobs)
+
+    assert [job.index for job in report.failures] == [1]
+    assert report.failures[0].error.startswith("decode:")
+    assert "chunked" in report.failures[0].error
+    assert (tmp_path / "0.png").exists() and (tmp_path / "2.png").exists()
+    assert not (tmp_path / "bad.png").exists()
+    assert report.stages["write"].items == 2
+
+
+def test_run_batch_staged(tmp_path):
+    """Test that run_batch renders through the stages and raises for failed jobs."""
+    jobs = [_job(tmp_path, prompt=f"prompt {i}", output_name=f"{i}.png") for i in range(3)]
+    jobs.append(_job(tmp_path, output_name="bad.png", vae_decode="chunked"))
+
+    with patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'):
+        report = run_batch(jobs[:3], staged_queue_size=2)
+        with pytest.raises(RuntimeError, match="Job 3 failed in stage decode: .*chunked") as excinfo:
+            run_batch(jobs, staged_queue_size=2)
+
+    assert sorted(result.index for result in report.results) == [0, 1, 2]
+    assert all(result.output_path.exists() for result in report.results)
+    # The message holds the last traceback line; the full traceback is the cause
+    assert "Traceback" not in str(excinfo.value)
+    assert excinfo.value.__cause__ is not None
+
+
+def test_staged_rejects_devices():
+    """Test that --staged and --devices are not accepted together."""
+    with patch('sys.argv', ['generate_batch.py', 'jobs.jsonl', '--staged', '--devices', 'cpu:2']):
+        with pytest.raises(SystemExit):
+            parse_batch_args()
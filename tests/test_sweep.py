@@ -0,0 +1,78 @@
+"""Tests for parameter sweeps."""
+
+import csv
+import pytest
+from unittest.mock import patch
+from PIL import Image
+from flux_gen import pipeline
+from flux_gen.config import GenerationConfig
+from flux_gen.embeddings import PromptEmbeddingCache
+from flux_gen.sweep import build_sweep, parse_resolution, run_sweep
+
+
+def _base(out_dir, **overrides):
+    return GenerationConfig(**{
+        "model_id": "stub:",
+        "prompt": "a lighthouse",
+        "height": 64,
+        "width": 64,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 2,
+        "out_dir": out_dir,
+        "output_name": "sweep.png",
+        **overrides,
+    })
+
+
+def test_parse_resolution():
+    """Test HEIGHTxWIDTH parsing and rejection of malformed sizes."""
+    assert parse_resolution("768x1024") == (768, 1024)
+    with pytest.raises(ValueError):
+        parse_resolution("768")
+
+
+def test_build_sweep_order(tmp_path):
+    """Test that cells group by LoRA scale and snake through resolutions."""
+    cells = build_sweep(
+        _base(tmp_path, lora_path="/l.safetensors", seed=7),
+        guidance_scales=[2.0, 4.0],
+        lora_scales=[0.5, 1.0],
+        resolutions=[(64, 64), (128, 64)],
+    )
+
+    assert [(c.config.lora_scale, c.config.height, c.config.guidance_scale) for c in cells] == [
+        (0.5, 64, 2.0), (0.5, 64, 4.0), (0.5, 128, 2.0), (0.5, 128, 4.0),
+        (1.0, 128, 2.0), (1.0, 128, 4.0), (1.0, 64, 2.0), (1.0, 64, 4.0),
+    ]
+    assert [(c.row, c.column) for c in cells[:3]] == [(0, 0), (0, 1), (1, 0)]
+    assert {c.config.seed for c in cells} == {7}
+    assert cells[3].config.output_name == "sweep_003.png"
+
+
+def test_build_sweep_requires_lora_for_scales(tmp_path):
+    """Test that LoRA scales cannot be swept without an adapter."""
+    with pytest.raises(ValueError):
+        build_sweep(_base(tmp_path), lora_scales=[0.5, 1.0])
+
+
+def test_run_sweep_stub(tmp_path):
+    """Test that a sweep loads once, encodes once and writes the sheet and CSV."""
+    cells = build_sweep(_base(tmp_path), guidance_scales=[2.0, 4.0], steps=[1, 2], resolutions=[(64, 64), (32, 64)])
+    embedding_cache = PromptEmbeddingCache()
+
+    with patch('flux_gen.device.detect_and_report_device'), \
+         patch('flux_gen.generate._generator_kwargs', return_value={}), \
+         patch('flux_gen.pipeline.load_flux_pipeline', wraps=pipeline.load_flux_pipeline) as mock_load:
+        report = run_sweep(cells, embedding_cache=embedding_cache, cell_size=32)
+
+    mock_load.assert_called_once()
+    assert embedding_cache.stats()["misses"] == 1
+    assert all((tmp_path / f"sweep_{i:03d}.png").exists() for i in range(8))
+
+    with Image.open(report.sheet_path) as sheet:
+        assert sheet.size == (2 * 32, 4 * (32 + 28))
+    with open(report.csv_path) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 8
+    assert rows[1]["guidance_scale"] == "4.0"
+    assert float(rows[0]["render_seconds"]) > 0
@@ -0,0 +1,139 @@
+"""Tests for stage spans and trace export."""
+
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from flux_gen import trace
+from flux_gen.config import GenerationConfig, RuntimeConfig
+from flux_gen.generate import run_generation
+
+
+@pytest.fixture(autouse=True)
+def _no_tracer():
+    trace.stop()
+    yield
+    trace.stop()
+
+
+def test_span_is_noop_without_tracer():
+    """Test that spans and pipeline kwargs cost nothing when tracing is off."""
+    with trace.span("anything"):
+        pass
+    assert trace.active() is None
+    assert trace.pipeline_kwargs() == {}
+
+
+def test_nested_spans_and_steps():
+    """Test that spans nest, record memory and collect step events."""
+    tracer = trace.start()
+    with trace.span("outer", label="x"):
+        with trace.span("inner"):
+            pass
+        callback = trace.pipeline_kwargs()["callback_on_step_end"]
+        assert callback(None, 0, 1000, {"latents": 1}) == {"latents": 1}
+        callback(None, 1, 500, {})
+
+    names = [event["name"] for event in tracer.events]
+    assert names == ["inner", "denoise_step", "denoise_step", "outer"]
+    outer = tracer.events[-1]
+    assert outer["label"] == "x"
+    assert outer["depth"] == 0 and tracer.events[0]["depth"] == 1
+    assert outer["rss_end_bytes"] > 0
+    assert tracer.events[1]["step"] == 0 and tracer.events[2]["timestep"] == 500.0
+
+
+def test_instrument_pipeline_restores_methods():
+    """Test that encode_prompt and vae.decode are traced and then restored."""
+    class Vae:
+        def decode(self, latents):
+            return latents
+
+    class Pipe:
+        def __init__(self):
+            self.vae = Vae()
+
+        def encode_prompt(self, prompt):
+            return prompt
+
+    pipe = Pipe()
+    tracer = trace.start()
+    with trace.instrument_pipeline(pipe):
+        assert pipe.encode_prompt("p") == "p"
+        assert pipe.vae.decode(1) == 1
+
+    assert [event["name"] for event in tracer.events] == ["text_encoding", "vae_decode"]
+    assert "encode_prompt" not in vars(pipe)
+    assert "decode" not in vars(pipe.vae)
+
+
+def test_run_generation_writes_chrome_trace(tmp_path):
+    """Test a traced end-to-end run on the stub pipeline."""
+    gen_config = GenerationConfig(
+        model_id="stub:",
+        prompt="test prompt",
+        height=64,
+        width=64,
+        guidance_scale=0.0,
+        num_inference_steps=3,
+        out_dir=tmp_path / "outputs",
+        trace_out=str(tmp_path / "trace.json"),
+    )
+
+    with patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'):
+        run_generation(gen_config)
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    names = [event["name"] for event in events]
+    for stage in ("env_setup", "load_pipeline", "from_pretrained", "offload", "render",
+                  "text_encoding", "save_image"):
+        assert stage in names
+    assert names.count("denoise_step") == 3
+    assert all(event["ph"] == "X" for event in events)
+    assert trace.active() is None
+
+    jsonl_config = GenerationConfig(**{**gen_config.__dict__, "trace_out": str(tmp_path / "trace.jsonl")})
+    with patch('flux_gen.config.RuntimeConfig.from_env', return_value=RuntimeConfig(hf_token=None, has_cuda=False)), \
+         patch('flux_gen.device.detect_and_report_device'):
+        run_generation(jsonl_config)
+    lines = (tmp_path / "trace.jsonl").read_text().splitlines()
+    assert json.loads(lines[0])["name"] == "env_setup"
+
+
+class _FakeCuda:
+    """Stands in for torch.cuda's allocation counters."""
+
+    def __init__(self):
+        self.current = self.peak = 0
+
+    def allocate(self, num_bytes):
+        self.current += num_bytes
+        self.peak = max(self.peak, self.current)
+
+    def free(self, num_bytes):
+        self.current -= num_bytes
+
+    def max_memory_allocated(self):
+        return self.peak
+
+    def reset_peak_memory_stats(self):
+        self.peak = self.current
+
+
+def test_spans_keep_the_run_peak():
+    """Test that per-span peaks do not hide the peak of the whole run."""
+    from flux_gen import metrics
+
+    cuda = _FakeCuda()
+    with patch('flux_gen.metrics._cuda', return_value=cuda):
+        metrics.reset_device_peak_memory()
+        tracer = trace.start()
+        with trace.span("load"):
+            cuda.allocate(100)
+            cuda.free(100)
+        with trace.span("render"):
+            cuda.allocate(30)
+
+        assert [event["device_peak_bytes"] for event in tracer.events] == [100, 30]
+        assert metrics.device_peak_memory_bytes() == 100
@@ -0,0 +1,147 @@
+"""Tests for the resident generation worker."""
+
+import gc
+import json
+import threading
+import urllib.error
+import urllib.request
+import weakref
+import pytest
+from unittest.mock import patch, MagicMock
+from flux_gen import lora
+from flux_gen.config import RuntimeConfig
+from flux_gen.stub import StubFluxPipeline
+from flux_gen.worker import PipelineCache, GenerationWorker, make_server
+from conftest import make_config
+
+
+
+
+def test_pipeline_cache_hit_and_miss():
+    """Test that identical configs reuse the cached pipeline."""
+    loader = MagicMock(side_effect=lambda gen_config, runtime_config: MagicMock())
+    cache = PipelineCache(loader=loader, sizer=lambda pipe: 1)
+    runtime_config = RuntimeConfig(hf_token=None, has_cuda=False)
+
+    first = cache.get(make_config(), runtime_config)
+    second = cache.get(make_config(prompt="other prompt"), runtime_config)
+
+    assert first is second
+    assert loader.call_count == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_pipeline_cache_lru_eviction():
+    """Test that least recently used pipelines are evicted over budget."""
+    loader = MagicMock(side_effect=lambda gen_config, runtime_config: MagicMock())
+    cache = PipelineCache(memory_budget_bytes=25, loader=loader, sizer=lambda pipe: 10)
+    runtime_config = RuntimeConfig(hf_token=None, has_cuda=False)
+
+    cache.get(make_config(model_id="a"), runtime_config)
+    cache.get(make_config(model_id="b"), runtime_config)
+    cache.get(make_config(model_id="a"), runtime_config)  # "b" becomes least recent
+    cache.get(make_config(model_id="c"), runtime_config)
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    cache.get(make_config(model_id="a"), runtime_config)
+    assert loader.call_count == 3  # "a" stayed cached
+
+
+def test_evicted_pipeline_is_freed():
+    """Test that an evicted pipeline with a LoRA manager is garbage collected."""
+    cache = PipelineCache(memory_budget_bytes=15, loader=lambda gen_config, runtime_config: StubFluxPipeline(),
+                          sizer=lambda pipe: 10)
+    runtime_config = RuntimeConfig(hf_token=None, has_cuda=False)
+
+    first = weakref.ref(cache.get(make_config(model_id="a"), runtime_config))
+    lora.get_lora_manager(first())
+    cache.get(make_config(model_id="b"), runtime_config)
+    gc.collect()
+
+    assert cache.evictions == 1
+    assert first() is None
+
+
+def test_worker_http_generate_path(tmp_path):
+    """Test that the HTTP worker renders payloads and returns output paths."""
+    mock_pipe = MagicMock()
+    mock_pipe.return_value.images = [MagicMock()]
+    cache = PipelineCache(loader=MagicMock(return_value=mock_pipe), sizer=lambda pipe: 0)
+    worker = GenerationWorker(make_config(out_dir=tmp_path), cache, RuntimeConfig(hf_token=None, has_cuda=False))
+
+    server = make_server(worker, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with patch('flux_gen.io.save_generated_image') as mock_save, \
+             patch('flux_gen.generate._generator_kwargs', return_value={}):
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{server.server_port}/generate",
+                data=json.dumps({"prompt": "a cat", "height": "768", "output_name": "cat.png",
+                                 "seed": 7}).encode(),
+                method="POST",
+            )
+            with urllib.request.urlopen(request) as response:
+                body = json.loads(response.read())
+
+        assert body["output_path"] == str(tmp_path / "cat.png")
+        image, output_path, metadata = mock_save.call_args.args
+        assert (image, output_path) == (mock_pipe.return_value.images[0], tmp_path / "cat.png")
+        assert metadata["seed"] == "7"
+        assert mock_pipe.call_args.kwargs["prompt"] == "a cat"
+        assert mock_pipe.call_args.kwargs["height"] == 768
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_worker_http_generate_bytes(tmp_path):
+    """Test that the worker can return encoded image bytes."""
+    mock_image = MagicMock()
+    mock_image.save.side_effect = lambda fp, format=None, pnginfo=None: fp.write(b"png-bytes")
+    mock_pipe = MagicMock()
+    mock_pipe.return_value.images = [mock_image]
+    cache = PipelineCache(loader=MagicMock(return_value=mock_pipe), sizer=lambda pipe: 0)
+    worker = GenerationWorker(make_config(out_dir=tmp_path), cache, RuntimeConfig(hf_token=None, has_cuda=False))
+
+    server = make_server(worker, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_port}/generate",
+            data=json.dumps({"prompt": "a cat", "return": "bytes"}).encode(),
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            assert response.headers["Content-Type"] == "image/png"
+            assert response.read() == b"png-bytes"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_worker_rejects_bad_payloads(tmp_path):
+    """Test that non-object bodies and client-chosen paths get a 400 response."""
+    worker = GenerationWorker(make_config(out_dir=tmp_path), PipelineCache(loader=MagicMock(), sizer=lambda pipe: 0),
+                              RuntimeConfig(hf_token=None, has_cuda=False))
+    server = make_server(worker, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for body in ([], "x", 1, {"out_dir": "/etc"}, {"trace_out": "/tmp/t.json"},
+                     {"output_name": "../escape.png"}, {"output_name": "/abs.png"}):
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{server.server_port}/generate",
+                data=json.dumps(body).encode(),
+                method="POST",
+            )
+            with pytest.raises(urllib.error.HTTPError) as excinfo:
+                urllib.request.urlopen(request)
+            assert excinfo.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+    worker.cache._loader.assert_not_called()